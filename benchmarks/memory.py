@@ -0,0 +1,55 @@
+"""Memory benchmark: parsed node graph vs. struct-of-arrays arena
+
+Usage: python benchmarks/memory.py [--statements N]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.lexer import RegexLexer
+from src.parser import Parser
+from src.arena import Arena
+from src.bench import synthetic_program
+
+
+def measure(build):
+    """Return (result, bytes allocated and still alive, seconds)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--statements", type=int, default=100000)
+    args = parser.parse_args()
+
+    source = synthetic_program(args.statements)
+    print(f"source: {args.statements} statements, {len(source) / 1e6:.1f} MB")
+
+    statements, node_bytes, parse_time = measure(lambda: Parser(RegexLexer(source)).parse())
+    arena, arena_bytes, build_time = measure(lambda: Arena.from_nodes(statements))
+    nodes = len(arena)
+
+    print(f"nodes:  {nodes} nodes, {node_bytes / 1e6:.1f} MB ({node_bytes / nodes:.0f} B/node), parsed in {parse_time:.2f}s")
+    print(f"arena:  {arena_bytes / 1e6:.1f} MB ({arena_bytes / nodes:.0f} B/node, "
+          f"{arena.nbytes() / 1e6:.1f} MB of arrays), built in {build_time:.2f}s")
+
+    del statements
+    rebuilt, _, convert_time = measure(arena.to_nodes)
+    print(f"to_nodes: {convert_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Scaling benchmark: building a string by repeated concatenation
+
+Usage: python benchmarks/ropes.py [--iterations N] [--steps K] [--no-ropes]
+
+Runs `have text = text + "ab"` N, 2N, 4N, ... times on every engine that can
+run it. With ropes the time per iteration stays flat as N doubles; with
+--no-ropes (plain str concatenation) it doubles along with N.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import ropes
+from src.lexer import RegexLexer
+from src.parser import Parser
+from src.engines import create_engine
+from src.output import OutputSink
+
+ENGINES = ("tree", "closure", "vm", "python")
+
+PROGRAM = """\
+have text = ""
+have i = 0
+repeat (i < {n}) {{
+  have text = text + "ab"
+  have i = i + 1
+}}
+say len(text)
+"""
+
+
+def run(engine, n):
+    """Seconds taken to build a string of 2 * n characters"""
+    statements = Parser(RegexLexer(PROGRAM.format(n=n))).parse()
+    output = io.StringIO()
+    interpreter = create_engine(engine, output=OutputSink(output))
+    start = time.perf_counter()
+    interpreter.run(statements)
+    elapsed = time.perf_counter() - start
+    if output.getvalue() != f"{2 * n}\n":
+        raise Exception(f"{engine}: wrong result {output.getvalue()!r}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--no-ropes", action="store_true", help="use plain str concatenation")
+    args = parser.parse_args()
+    if args.no_ropes:
+        ropes.ROPE_MIN = sys.maxsize
+
+    sizes = [args.iterations << step for step in range(args.steps)]
+    print(f"{'engine':8} {'iterations':>10} {'time':>9} {'per iteration':>14} {'vs first':>9}")
+    for engine in ENGINES:
+        first = None
+        for n in sizes:
+            per_iteration = run(engine, n) / n
+            first = first or per_iteration
+            print(f"{engine:8} {n:>10} {per_iteration * n * 1000:>7.1f}ms {per_iteration * 1e6:>11.2f}us {per_iteration / first:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
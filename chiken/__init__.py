@@ -3,18 +3,72 @@
 __version__ = "1.0.0"
 __author__ = "Your Name"
 
-from src.lexer import Lexer
+from src.lexer import Lexer, RegexLexer
 from src.parser import Parser
 from src.interpreter import Interpreter
+from src.closures import ClosureInterpreter
+from src.vm import VirtualMachine
+from src.pygen import PythonEngine, to_python
+from src.engines import ENGINES, DEFAULT_ENGINE, create_engine
+from src.optimizer import Optimizer
+from src.memo import DEFAULT_MEMO_SIZE
+from src.output import OutputSink
+from src.profiler import Profiler
+from src.program import Program, Engine, Result, shared_engine
+from src.scheduler import Scheduler
+from src.batch import BatchRunner, Job, file_jobs, sweep_jobs
+import io
 
-def run(code):
-    """Run ChIkEn code and return output"""
-    lexer = Lexer(code)
+def run(code, engine=DEFAULT_ENGINE, optimize=False, memoize=None, max_depth=None, output=None, capture=False, profiler=None, quicken=None, tier=None):
+    """Run ChIkEn code with the given engine ("tree", "closure", "vm" or "python")
+
+    With optimize=True the program goes through the AST optimizer first.
+    With memoize=SIZE (tree and closure engines) calls to pure functions are
+    cached in an LRU of up to SIZE results per function. Returns the engine,
+    whose `memo.stats()` gives the hit and miss counts. max_depth caps the
+    call depth of the vm engine, which does not use Python recursion.
+
+    Output goes to sys.stdout, or to output (a text stream or an OutputSink)
+    if given. With capture=True nothing is written; run() returns the
+    program's output as a string instead of the engine.
+
+    Pass a Profiler (closure engine) to collect call times and line hits.
+    With quicken=True (tree engine) operator and call sites specialize
+    themselves on the types they see; the engine's `quickener.report()`
+    gives per-site specialization and deoptimization counts. With tier=N
+    (tree engine) functions and top-level loops that run N calls or loop
+    iterations are compiled to Python; see the engine's `tiers.report()`.
+    """
+    lexer = RegexLexer(code)
     parser = Parser(lexer)
     statements = parser.parse()
-    interpreter = Interpreter()
-    
-    for stmt in statements:
-        interpreter.visit(stmt)
+    if optimize:
+        statements = Optimizer().optimize(statements)
+    if capture:
+        output = io.StringIO()
+    sink = output if output is None or isinstance(output, OutputSink) else OutputSink(output)
+    interpreter = create_engine(engine, memoize=memoize, max_depth=max_depth, output=sink, profiler=profiler, quicken=quicken, tier=tier)
+    interpreter.run(statements)
+    if capture:
+        return output.getvalue()
+    return interpreter
+
+def compile(code, engine=DEFAULT_ENGINE, optimize=False, memoize=None, max_depth=None, quicken=None, tier=None):
+    """Parse ChIkEn code once into a Program that can be run many times
+
+        program = chiken.compile(source)
+        result = program.run(globals={"x": 3})
+        result.output, result.variables
+
+    Programs are cached by source in a process-wide LRU per configuration,
+    and are safe to run from several threads at once.
+    """
+    return shared_engine(engine, optimize, memoize=memoize, max_depth=max_depth, quicken=quicken, tier=tier).compile(code)
+
+def compile_to_python(code):
+    """Translate ChIkEn code into equivalent Python source"""
+    lexer = RegexLexer(code)
+    parser = Parser(lexer)
+    return to_python(parser.parse())
 
-__all__ = ["Lexer", "Parser", "Interpreter", "run"]
+__all__ = ["Lexer", "RegexLexer", "Parser", "Interpreter", "ClosureInterpreter", "VirtualMachine", "PythonEngine", "Optimizer", "OutputSink", "Profiler", "Program", "Engine", "Result", "Scheduler", "BatchRunner", "Job", "file_jobs", "sweep_jobs", "ENGINES", "DEFAULT_MEMO_SIZE", "run", "compile", "compile_to_python"]
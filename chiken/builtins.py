@@ -0,0 +1,17 @@
+"""Extending ChIkEn with builtins written in Python
+
+    from chiken.builtins import register
+
+    @register(arity=2, pure=True)
+    def hypot(x, y):
+        return math.hypot(x, y)
+
+Packages can also expose a module in the "chiken.builtins" entry point
+group; it is imported (and, if callable, called) when an engine is created
+with create_engine() or chiken.run(), or when the CLI starts. Besides
+builtins, it may add engines to src.engines.ENGINES.
+"""
+
+from src.builtins import Builtin, BUILTINS, ENTRY_POINT_GROUP, register, unregister, load_plugins
+
+__all__ = ["Builtin", "BUILTINS", "ENTRY_POINT_GROUP", "register", "unregister", "load_plugins"]
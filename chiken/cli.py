@@ -1,15 +1,41 @@
 """ChIkEn command-line interface"""
 
 import sys
+import json
+import time
 import argparse
 from pathlib import Path
 
-from src.lexer import Lexer
+from src.lexer import RegexLexer, StreamLexer
 from src.parser import Parser
-from src.interpreter import Interpreter
+from src.engines import ENGINES, DEFAULT_ENGINE, ENGINE_OPTIONS, create_engine
+from src.builtins import load_plugins
+from src.cache import ProgramCache
+from src.optimizer import Optimizer
+from src.memo import DEFAULT_MEMO_SIZE
+from src.vm import DEFAULT_MAX_DEPTH
+from src.tiers import DEFAULT_TIER_THRESHOLD
+from src.output import OutputSink
+from src.profiler import Profiler, SORT_KEYS
+from src.bench import BenchmarkRunner, DEFAULT_THRESHOLD, load_workloads, format_result, compare
+from src.batch import BatchRunner, file_jobs, sweep_jobs, load_bindings
+from src.repl import Repl
+from chiken import __version__
 
-def main():
+def main(argv=None):
     """Main entry point for the chiken CLI"""
+    if argv is None:
+        argv = sys.argv[1:]
+    # Plugins may add engines, which the --engine choices must list
+    load_plugins()
+    
+    if argv and argv[0] == "compile":
+        return compile_main(argv[1:])
+    if argv and argv[0] == "bench":
+        return bench_main(argv[1:])
+    if argv and argv[0] == "batch":
+        return batch_main(argv[1:])
+    
     parser = argparse.ArgumentParser(
         description="ChIkEn Programming Language interpreter",
         prog="chiken"
@@ -18,13 +44,13 @@ def main():
     parser.add_argument(
         "file",
         nargs="?",
-        help="ChIkEn source file to run (.chiken)"
+        help="ChIkEn source file to run (.chiken); without one, start a REPL"
     )
     
     parser.add_argument(
         "-v", "--version",
         action="version",
-        version="%(prog)s 1.0.0"
+        version=f"%(prog)s {__version__}"
     )
     
     parser.add_argument(
@@ -32,7 +58,179 @@ def main():
         help="Run code directly from command line"
     )
     
-    args = parser.parse_args()
+    parser.add_argument(
+        "-e", "--engine",
+        choices=sorted(ENGINES),
+        help=f"Execution engine to use (default: {DEFAULT_ENGINE}, or closure with --profile)"
+    )
+    
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read, parse and run the file one top-level statement at a time (never cached)"
+    )
+    
+    parser.add_argument(
+        "-O", "--optimize",
+        action="store_true",
+        help="Run the AST optimizer (constant folding, dead branches) first"
+    )
+    
+    parser.add_argument(
+        "--memoize",
+        action="store_true",
+        help="Cache the results of pure functions (tree and closure engines)"
+    )
+    
+    parser.add_argument(
+        "--memo-size",
+        type=int,
+        default=DEFAULT_MEMO_SIZE,
+        metavar="SIZE",
+        help="Results kept per memoized function (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--quicken",
+        action="store_true",
+        help="Specialize operator and call sites on the types they see (tree engine)"
+    )
+    
+    parser.add_argument(
+        "--tier",
+        action="store_true",
+        help="Compile hot functions and loops to Python as they run (tree engine)"
+    )
+    
+    parser.add_argument(
+        "--tier-threshold",
+        type=int,
+        default=DEFAULT_TIER_THRESHOLD,
+        metavar="N",
+        help="Calls plus loop iterations before code is compiled (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        metavar="N",
+        help=f"Maximum call depth before a recursion error (vm engine, default: {DEFAULT_MAX_DEPTH})"
+    )
+    
+    parser.add_argument(
+        "--flush-lines",
+        type=int,
+        metavar="N",
+        help="Flush output every N lines (default: at exit and before input())"
+    )
+    
+    parser.add_argument(
+        "--flush-ms",
+        type=int,
+        metavar="MS",
+        help="Flush output at the next say once MS milliseconds have passed"
+    )
+    
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report per-function call counts and times and per-line hit counts"
+    )
+    
+    parser.add_argument(
+        "--profile-format",
+        choices=["text", "json", "pstats"],
+        default="text",
+        help="Profile report format (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--profile-sort",
+        choices=sorted(SORT_KEYS),
+        default="cumulative",
+        help="Order of functions in the profile (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help="Write the profile to FILE (default: stderr; chiken.prof for pstats)"
+    )
+    
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Report what optional passes did on stderr"
+    )
+    
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the compiled program cache"
+    )
+    
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for cached programs (default: __chikencache__ next to the file)"
+    )
+    
+    args = parser.parse_args(argv)
+    
+    profiler = None
+    if args.profile:
+        if args.engine is None:
+            args.engine = "closure"
+        if args.engine not in ENGINE_OPTIONS["profiler"]:
+            parser.error("--profile is supported by the closure engine")
+        profiler = Profiler(args.file or "<string>")
+    if args.engine is None:
+        args.engine = DEFAULT_ENGINE
+    
+    memoize = None
+    if args.memoize:
+        if args.memo_size < 1:
+            parser.error("--memo-size must be at least 1")
+        if args.engine not in ENGINE_OPTIONS["memoize"]:
+            parser.error("--memoize is supported by the tree and closure engines")
+        memoize = args.memo_size
+    
+    quicken = None
+    if args.quicken:
+        if args.engine not in ENGINE_OPTIONS["quicken"]:
+            parser.error("--quicken is supported by the tree engine")
+        quicken = True
+    
+    tier = None
+    if args.tier:
+        if args.tier_threshold < 1:
+            parser.error("--tier-threshold must be at least 1")
+        if args.engine not in ENGINE_OPTIONS["tier"]:
+            parser.error("--tier is supported by the tree engine")
+        if memoize:
+            parser.error("--tier cannot be combined with --memoize")
+        tier = args.tier_threshold
+    
+    if args.max_depth is not None:
+        if args.max_depth < 1:
+            parser.error("--max-depth must be at least 1")
+        if args.engine not in ENGINE_OPTIONS["max_depth"]:
+            parser.error("--max-depth is supported by the vm engine")
+    
+    for flag, value in (("--flush-lines", args.flush_lines), ("--flush-ms", args.flush_ms)):
+        if value is not None and value < 1:
+            parser.error(f"{flag} must be at least 1")
+    flush_interval = args.flush_ms / 1000 if args.flush_ms is not None else None
+    output = OutputSink(flush_lines=args.flush_lines, flush_interval=flush_interval)
+    
+    if args.stream and args.file and not args.code:
+        if args.engine == "python":
+            parser.error("--stream is not supported by the python engine")
+        if args.profile:
+            parser.error("--stream cannot be combined with --profile")
+        if args.cache_dir:
+            parser.error("--stream cannot be combined with --cache-dir")
+        run_stream(args.file, args.engine, args.verbose, args.optimize, memoize=memoize, max_depth=args.max_depth, output=output, quicken=quicken, tier=tier)
+        return
     
     if args.code:
         # Run code from -c flag
@@ -46,21 +244,381 @@ def main():
             print(f"Error: File '{args.file}' not found", file=sys.stderr)
             sys.exit(1)
     else:
-        parser.print_help()
-        sys.exit(0)
+        if args.engine == "python":
+            parser.error("the REPL is not supported by the python engine")
+        try:
+            run_repl(args, memoize=memoize, max_depth=args.max_depth, output=output, profiler=profiler, quicken=quicken, tier=tier)
+        finally:
+            write_profile(profiler, args)
+        return
     
     try:
-        lexer = Lexer(code)
-        parser_obj = Parser(lexer)
-        statements = parser_obj.parse()
-        interpreter = Interpreter()
-        
-        for stmt in statements:
-            interpreter.visit(stmt)
+        if args.file and not args.code and not args.no_cache:
+            statements = load_cached(args.file, code, ProgramCache(args.cache_dir, __version__))
+        else:
+            statements = parse(code)
+        if args.optimize:
+            optimizer = Optimizer()
+            statements = optimizer.optimize(statements)
+            if args.verbose:
+                print(f"optimizer: {optimizer.report()}", file=sys.stderr)
+        if profiler is not None:
+            profiler.source_lines = code.splitlines()
+        interpreter = create_engine(args.engine, memoize=memoize, max_depth=args.max_depth, output=output, profiler=profiler, quicken=quicken, tier=tier)
+        try:
+            interpreter.run(statements)
+        finally:
+            report_memo(interpreter, args.verbose)
+            report_loops(interpreter, args.verbose)
+            report_sites(interpreter, args.verbose)
+            report_tiers(interpreter, args.verbose)
+            write_profile(profiler, args)
     
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
+def report_memo(interpreter, verbose):
+    memo = getattr(interpreter, "memo", None)
+    if verbose and memo is not None:
+        print(f"memoize: {memo.report()}", file=sys.stderr)
+
+def report_loops(interpreter, verbose):
+    if not verbose or not hasattr(interpreter, "counting_loops"):
+        return
+    loops = interpreter.counting_loops()
+    if not loops:
+        print("loops: no counting loops specialized", file=sys.stderr)
+    for loop in loops:
+        print(f"loops: {loop.describe()}", file=sys.stderr)
+
+def report_sites(interpreter, verbose):
+    quickener = getattr(interpreter, "quickener", None)
+    if not verbose or quickener is None:
+        return
+    for line in quickener.report():
+        print(f"quicken: {line}", file=sys.stderr)
+
+def report_tiers(interpreter, verbose):
+    tiers = getattr(interpreter, "tiers", None)
+    if not verbose or tiers is None:
+        return
+    for line in tiers.report():
+        print(f"tier: {line}", file=sys.stderr)
+
+def write_profile(profiler, args):
+    if profiler is None:
+        return
+    if args.profile_format == "pstats":
+        path = args.profile_output or "chiken.prof"
+        profiler.dump_pstats(path)
+        print(f"profile: wrote {path}", file=sys.stderr)
+        return
+    if args.profile_format == "json":
+        report = profiler.to_json(args.profile_sort) + "\n"
+    else:
+        report = profiler.report(args.profile_sort)
+    if args.profile_output:
+        with open(args.profile_output, "w") as f:
+            f.write(report)
+    else:
+        sys.stderr.write(report)
+
+def parse(code):
+    lexer = RegexLexer(code)
+    parser_obj = Parser(lexer)
+    return parser_obj.parse()
+
+def load_cached(path, code, cache):
+    """Parse code, skipping the lexer and parser entirely on a cache hit"""
+    statements = cache.load(path, code)
+    if statements is None:
+        statements = parse(code)
+        cache.store(path, code, statements)
+    return statements
+
+def compile_main(argv):
+    """chiken compile: parse files ahead of time to warm the cache"""
+    parser = argparse.ArgumentParser(
+        description="Compile ChIkEn files into the program cache",
+        prog="chiken compile"
+    )
+    
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="ChIkEn source files to compile"
+    )
+    
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for cached programs (default: __chikencache__ next to each file)"
+    )
+    
+    args = parser.parse_args(argv)
+    cache = ProgramCache(args.cache_dir, __version__)
+    failed = False
+    
+    for path in args.files:
+        try:
+            with open(path, 'r') as f:
+                code = f.read()
+            entry = cache.store(path, code, parse(code))
+            if entry is None:
+                raise Exception("could not write cache entry")
+            print(f"Compiled {path} -> {entry}")
+        except FileNotFoundError:
+            print(f"Error: File '{path}' not found", file=sys.stderr)
+            failed = True
+        except Exception as e:
+            print(f"Error: {path}: {e}", file=sys.stderr)
+            failed = True
+    
+    if failed:
+        sys.exit(1)
+
+def bench_main(argv):
+    """chiken bench: time lexing, parsing and execution of a benchmark suite"""
+    parser = argparse.ArgumentParser(
+        description="Benchmark ChIkEn's front end and engines",
+        prog="chiken bench"
+    )
+    
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Benchmark .chiken files or directories (default: the bundled benchmarks/ suite)"
+    )
+    
+    parser.add_argument(
+        "-e", "--engine",
+        action="append",
+        choices=sorted(ENGINES),
+        help="Engine to execute with; repeat for several (default: all)"
+    )
+    
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="Untimed runs before measuring (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Timed runs per measurement (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--generated-mb",
+        type=float,
+        default=1.0,
+        metavar="MB",
+        help="Size of the generated lexer/parser workload, 0 to skip (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--json",
+        metavar="FILE",
+        help="Write the results as JSON to FILE"
+    )
+    
+    parser.add_argument(
+        "--baseline",
+        metavar="FILE",
+        help="Compare against results saved with --json; exit 1 on regression"
+    )
+    
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD * 100,
+        metavar="PERCENT",
+        help="Slowdown of a median that counts as a regression (default: %(default)g%%)"
+    )
+    
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.warmup < 0:
+        parser.error("--warmup must not be negative")
+    
+    try:
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        workloads = load_workloads(args.paths, args.generated_mb)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    runner = BenchmarkRunner(
+        args.engine or sorted(ENGINES),
+        args.warmup,
+        args.repeat,
+        progress=lambda result: print(format_result(result), flush=True),
+    )
+    results = runner.run(workloads)
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold / 100)
+        for key, old, new in regressions:
+            print(f"REGRESSION {key}: {old * 1000:.2f} ms -> {new * 1000:.2f} ms ({(new / old - 1) * 100:+.1f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+def batch_main(argv):
+    """chiken batch: run many scripts, or one script over many inputs, in parallel"""
+    parser = argparse.ArgumentParser(
+        description="Run ChIkEn programs in parallel across worker processes",
+        prog="chiken batch"
+    )
+    
+    parser.add_argument(
+        "files",
+        nargs="+",
+        help="ChIkEn source files to run, one job each"
+    )
+    
+    parser.add_argument(
+        "--bindings",
+        metavar="FILE",
+        help="Run a single file once per variable set in FILE (a JSON array or JSON lines)"
+    )
+    
+    parser.add_argument(
+        "-e", "--engine",
+        choices=sorted(ENGINES),
+        default=DEFAULT_ENGINE,
+        help="Execution engine to use (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "-O", "--optimize",
+        action="store_true",
+        help="Optimize the AST before running"
+    )
+    
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        metavar="N",
+        help="Worker processes (default: one per core)"
+    )
+    
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        metavar="N",
+        help="Jobs sent to a worker at a time (default: picked from the job count)"
+    )
+    
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Print results as jobs finish rather than in job order"
+    )
+    
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON object per job instead of its output"
+    )
+    
+    args = parser.parse_args(argv)
+    if args.bindings and len(args.files) != 1:
+        parser.error("--bindings takes exactly one file")
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    
+    try:
+        if args.bindings:
+            path = args.files[0]
+            jobs = sweep_jobs(path, Path(path).read_text(), load_bindings(args.bindings))
+        else:
+            jobs = file_jobs(args.files)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    
+    runner = BatchRunner(args.engine, args.optimize, args.jobs, args.chunksize)
+    start = time.perf_counter()
+    failed = 0
+    for result in runner.run(jobs, ordered=not args.unordered):
+        if result["status"] != "ok":
+            failed += 1
+        if args.json:
+            print(json.dumps(result), flush=True)
+            continue
+        print(f"==> {result['name']} ({result['status']}, {result['time'] * 1000:.1f} ms) <==")
+        sys.stdout.write(result["output"])
+        if result["error"] is not None:
+            print(f"Error: {result['error']}")
+        sys.stdout.flush()
+    
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs)} jobs, {failed} failed in {elapsed:.2f}s on {runner.workers} workers", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+def run_stream(path, engine, verbose=False, optimize=False, **options):
+    """Run a file while it is being read, keeping memory use bounded"""
+    try:
+        f = open(path, 'r')
+    except FileNotFoundError:
+        print(f"Error: File '{path}' not found", file=sys.stderr)
+        sys.exit(1)
+    
+    with f:
+        try:
+            interpreter = create_engine(engine, **options)
+            optimizer = Optimizer() if optimize else None
+            try:
+                for stmt in Parser(StreamLexer(f)).statements():
+                    statements = [stmt] if optimizer is None else optimizer.optimize([stmt])
+                    # Output is flushed by the sink's own policy and at the end,
+                    # not after every statement
+                    interpreter.run(statements, flush=False)
+            finally:
+                interpreter.output.flush()
+                if optimizer is not None and verbose:
+                    print(f"optimizer: {optimizer.report()}", file=sys.stderr)
+                report_memo(interpreter, verbose)
+                report_loops(interpreter, verbose)
+                report_sites(interpreter, verbose)
+                report_tiers(interpreter, verbose)
+        
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+def run_repl(args, **options):
+    """Start an interactive session in one engine"""
+    try:
+        interpreter = create_engine(args.engine, **options)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    cache = None if args.no_cache else ProgramCache(args.cache_dir, __version__)
+    repl = Repl(interpreter, optimize=args.optimize, cache=cache, verbose=args.verbose)
+    if repl.interactive:
+        print(f"ChIkEn {__version__} ({args.engine} engine). Type :help for help.")
+    try:
+        repl.interact()
+    finally:
+        report_memo(interpreter, args.verbose)
+        report_loops(interpreter, args.verbose)
+        report_sites(interpreter, args.verbose)
+        report_tiers(interpreter, args.verbose)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,210 @@
+# Struct-of-arrays AST arena for ChIkEn
+#
+# An alternative, much more compact program representation than a graph of
+# node objects: node i is described by kinds[i] and three integer fields
+# a[i], b[i], c[i], all stored in parallel `array` buffers. Numbers, strings
+# and names live once each in a constant pool, and statement/argument lists
+# are runs in a shared `items` buffer, prefixed with their length. Fields
+# that hold "no node" (a missing else block or return value) are -1.
+#
+#   kind         a            b                c
+#   NUMBER       const        -                -
+#   STRING       const        -                -
+#   VAR          name const   -                -
+#   ASSIGN       name const   value node       -
+#   BINOP        left node    operator code    right node
+#   COMPARE      left node    operator code    right node
+#   UNARY        operator     operand node     -
+#   PRINT        value node   -                -
+#   CALL         name const   args list        -
+#   IF           condition    then list        else list or -1
+#   REPEAT       condition    body list        -
+#   FUNC         name const   params list      body list
+#   RETURN       value or -1  -                -
+#   ARRAY        elements list -               -
+#   INDEX        target node  index node       -
+#
+# Fields and list entries are 32-bit, which is plenty for any real program.
+# The source line and column of statement nodes are kept in two more
+# parallel arrays (-1 for other nodes).
+#
+# Lists are offsets into `items`; params lists hold constant indices rather
+# than node indices. Arena.from_nodes() and to_nodes() convert to and from
+# the node classes in src/nodes.py.
+
+from array import array
+
+from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+
+NUMBER, STRING, VAR, ASSIGN, BINOP, COMPARE, UNARY, PRINT, CALL, IF, REPEAT, FUNC, RETURN, ARRAY, INDEX = range(15)
+
+KIND_NAMES = ("NUMBER", "STRING", "VAR", "ASSIGN", "BINOP", "COMPARE", "UNARY", "PRINT", "CALL", "IF", "REPEAT", "FUNC", "RETURN", "ARRAY", "INDEX")
+
+
+class Arena:
+    def __init__(self):
+        self.kinds = array("B")
+        self.a = array("i")
+        self.b = array("i")
+        self.c = array("i")
+        self.lines = array("i")
+        self.columns = array("i")
+        self.items = array("i")
+        self.consts = []
+        self.const_index = {}
+        self.root = -1  # list of top-level statements
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def nbytes(self):
+        """Bytes used by the array buffers (the constant pool not included)"""
+        return sum(
+            buf.itemsize * len(buf)
+            for buf in (self.kinds, self.a, self.b, self.c, self.lines, self.columns, self.items)
+        )
+
+    # Building
+
+    def const(self, value):
+        # Keyed by type so that 1, 1.0 and True stay apart, and floats by
+        # repr so that 0.0 and -0.0 do
+        key = (type(value), repr(value) if type(value) is float else value)
+        index = self.const_index.get(key)
+        if index is None:
+            index = self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return index
+
+    def add(self, kind, a=-1, b=-1, c=-1):
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        self.lines.append(-1)
+        self.columns.append(-1)
+        return len(self.kinds) - 1
+
+    def add_list(self, values):
+        offset = len(self.items)
+        self.items.append(len(values))
+        self.items.extend(values)
+        return offset
+
+    def entries(self, offset):
+        """Return the entries of the list stored at offset"""
+        length = self.items[offset]
+        return self.items[offset + 1:offset + 1 + length]
+
+    @classmethod
+    def from_nodes(cls, statements):
+        """Build an arena from a list of statement nodes"""
+        arena = cls()
+        arena.root = arena.add_list([arena.node(stmt) for stmt in statements])
+        return arena
+
+    def block(self, statements):
+        return self.add_list([self.node(stmt) for stmt in statements])
+
+    def node(self, node):
+        index = self.add_node(node)
+        line = getattr(node, "line", None)
+        if line is not None:
+            self.lines[index] = line
+            self.columns[index] = node.column
+        return index
+
+    def add_node(self, node):
+        if isinstance(node, NumberNode):
+            return self.add(NUMBER, self.const(node.value))
+        elif isinstance(node, StringNode):
+            return self.add(STRING, self.const(node.value))
+        elif isinstance(node, VarAccessNode):
+            return self.add(VAR, self.const(node.name))
+        elif isinstance(node, VarAssignNode):
+            return self.add(ASSIGN, self.const(node.name), self.node(node.value_node))
+        elif isinstance(node, BinOpNode):
+            return self.add(BINOP, self.node(node.left_node), node.op, self.node(node.right_node))
+        elif isinstance(node, ComparisonNode):
+            return self.add(COMPARE, self.node(node.left_node), node.op, self.node(node.right_node))
+        elif isinstance(node, UnaryOpNode):
+            return self.add(UNARY, node.op, self.node(node.operand))
+        elif isinstance(node, PrintNode):
+            return self.add(PRINT, self.node(node.value_node))
+        elif isinstance(node, FunctionCallNode):
+            args = self.add_list([self.node(arg) for arg in node.args])
+            return self.add(CALL, self.const(node.name), args)
+        elif isinstance(node, IfNode):
+            condition = self.node(node.condition)
+            then_block = self.block(node.then_block)
+            else_block = self.block(node.else_block) if node.else_block is not None else -1
+            return self.add(IF, condition, then_block, else_block)
+        elif isinstance(node, RepeatNode):
+            condition = self.node(node.condition)
+            return self.add(REPEAT, condition, self.block(node.body))
+        elif isinstance(node, FunctionDefNode):
+            params = self.add_list([self.const(param) for param in node.params])
+            return self.add(FUNC, self.const(node.name), params, self.block(node.body))
+        elif isinstance(node, ReturnNode):
+            value = self.node(node.value_node) if node.value_node is not None else -1
+            return self.add(RETURN, value)
+        elif isinstance(node, ArrayNode):
+            return self.add(ARRAY, self.block(node.elements))
+        elif isinstance(node, IndexNode):
+            return self.add(INDEX, self.node(node.target), self.node(node.index))
+        raise Exception(f"Unknown node type: {type(node)}")
+
+    # Converting back
+
+    def to_nodes(self):
+        """Rebuild the statement nodes the arena was built from"""
+        return self.to_block(self.root)
+
+    def to_block(self, offset):
+        return [self.to_node(index) for index in self.entries(offset)]
+
+    def to_node(self, index):
+        node = self.make_node(index)
+        if self.lines[index] != -1:
+            node.line = self.lines[index]
+            node.column = self.columns[index]
+        return node
+
+    def make_node(self, index):
+        kind = self.kinds[index]
+        a, b, c = self.a[index], self.b[index], self.c[index]
+        consts = self.consts
+
+        if kind == NUMBER:
+            return NumberNode(consts[a])
+        elif kind == STRING:
+            return StringNode(consts[a])
+        elif kind == VAR:
+            return VarAccessNode(consts[a])
+        elif kind == ASSIGN:
+            return VarAssignNode(consts[a], self.to_node(b))
+        elif kind == BINOP:
+            return BinOpNode(self.to_node(a), b, self.to_node(c))
+        elif kind == COMPARE:
+            return ComparisonNode(self.to_node(a), b, self.to_node(c))
+        elif kind == UNARY:
+            return UnaryOpNode(a, self.to_node(b))
+        elif kind == PRINT:
+            return PrintNode(self.to_node(a))
+        elif kind == CALL:
+            return FunctionCallNode(consts[a], self.to_block(b))
+        elif kind == IF:
+            else_block = self.to_block(c) if c != -1 else None
+            return IfNode(self.to_node(a), self.to_block(b), else_block)
+        elif kind == REPEAT:
+            return RepeatNode(self.to_node(a), self.to_block(b))
+        elif kind == FUNC:
+            params = [consts[param] for param in self.entries(b)]
+            return FunctionDefNode(consts[a], params, self.to_block(c))
+        elif kind == RETURN:
+            return ReturnNode(self.to_node(a) if a != -1 else None)
+        elif kind == ARRAY:
+            return ArrayNode(self.to_block(a))
+        elif kind == INDEX:
+            return IndexNode(self.to_node(a), self.to_node(b))
+        raise Exception(f"Unknown node kind {kind}")
@@ -0,0 +1,204 @@
+# Numeric arrays for ChIkEn
+#
+# An Array is an immutable sequence of numbers stored in an `array.array`:
+# typecode "q" (64-bit ints) when every element is an int, "d" (doubles)
+# otherwise. Arithmetic and comparison operators work element-wise between
+# two arrays of the same length, or between an array and a number, so every
+# engine gets vectorized operations simply by applying +, <, ... to values.
+# The element loops run inside C: map() over an operator function and the
+# array constructor, never a Python-level loop per element.
+#
+# Arrays are immutable so that they behave like every other ChIkEn value
+# when functions receive a copy of their caller's variables.
+
+import math
+import operator
+from array import array
+from itertools import repeat
+
+from src.ropes import flat
+
+
+def _typecode(values):
+    return "q" if all(type(value) in (int, bool) for value in values) else "d"
+
+
+def _numbers(values):
+    for value in values:
+        if type(value) not in (int, float, bool):
+            raise Exception(f"Arrays hold numbers only, got {value!r}")
+
+
+class Array:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data  # array.array with typecode "q" or "d"
+
+    @classmethod
+    def from_values(cls, values):
+        values = list(values)
+        if not all(type(value) is int for value in values):
+            _numbers(values)
+        try:
+            return cls(array(_typecode(values), values))
+        except OverflowError:
+            raise Exception("Array integers must fit in 64 bits") from None
+
+    @classmethod
+    def range(cls, start, stop=None, step=1):
+        if stop is None:
+            start, stop = 0, start
+        if type(start) is not int or type(stop) is not int or type(step) is not int:
+            raise Exception("range() expects whole numbers")
+        if step == 0:
+            raise Exception("range() step must not be 0")
+        return cls(array("q", range(start, stop, step)))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __getitem__(self, index):
+        if type(index) is not int:
+            raise Exception(f"Array index must be a whole number, got {index!r}")
+        if not 0 <= index < len(self.data):
+            raise Exception(f"Array index {index} out of range (length {len(self.data)})")
+        return self.data[index]
+
+    def __str__(self):
+        return "[" + ", ".join(map(str, self.data)) + "]"
+
+    def __repr__(self):
+        return f"Array({self})"
+
+    def __bool__(self):
+        raise Exception("An array is not true or false; use any() or all()")
+
+    # Equality is element-wise, so arrays cannot be dict keys
+    __hash__ = None
+
+    def key(self):
+        """A hashable value equal for equal arrays, for memoization"""
+        return (self.data.typecode, self.data.tobytes())
+
+    def map(self, func, typecode=None):
+        """Apply a one-argument function written in C to every element"""
+        data = self.data
+        return Array(array(typecode or data.typecode, map(func, data)))
+
+    def combine(self, other, func, typecode=None, reflected=False):
+        data = self.data
+        if type(other) is Array:
+            if len(other.data) != len(data):
+                raise Exception(f"Array lengths differ: {len(data)} and {len(other.data)}")
+            others = other.data
+            kind = "q" if data.typecode == others.typecode == "q" else "d"
+        elif type(other) in (int, float, bool):
+            others = repeat(other, len(data))
+            kind = "q" if data.typecode == "q" and type(other) is not float else "d"
+        else:
+            return NotImplemented
+        left, right = (others, data) if reflected else (data, others)
+        try:
+            return Array(array(typecode or kind, map(func, left, right)))
+        except OverflowError:
+            raise Exception("Array integers must fit in 64 bits") from None
+
+    def divisor(self, other, reflected, message):
+        # The element-wise counterpart of the scalar zero checks
+        divisors = self.data if reflected else (other.data if type(other) is Array else (other,))
+        if 0 in divisors:
+            raise Exception(message)
+
+    def __add__(self, other):
+        return self.combine(other, operator.add)
+
+    def __radd__(self, other):
+        return self.combine(other, operator.add, reflected=True)
+
+    def __sub__(self, other):
+        return self.combine(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self.combine(other, operator.sub, reflected=True)
+
+    def __mul__(self, other):
+        return self.combine(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self.combine(other, operator.mul, reflected=True)
+
+    def __truediv__(self, other):
+        self.divisor(other, False, "Division by zero")
+        return self.combine(other, operator.truediv, "d")
+
+    def __rtruediv__(self, other):
+        self.divisor(other, True, "Division by zero")
+        return self.combine(other, operator.truediv, "d", reflected=True)
+
+    def __mod__(self, other):
+        self.divisor(other, False, "Modulo by zero")
+        return self.combine(other, operator.mod)
+
+    def __rmod__(self, other):
+        self.divisor(other, True, "Modulo by zero")
+        return self.combine(other, operator.mod, reflected=True)
+
+    def __pow__(self, other):
+        return self.combine(other, operator.pow, "d")
+
+    def __rpow__(self, other):
+        return self.combine(other, operator.pow, "d", reflected=True)
+
+    # Comparisons give arrays of 1 (true) and 0 (false)
+
+    def __lt__(self, other):
+        return self.combine(other, operator.lt, "q")
+
+    def __le__(self, other):
+        return self.combine(other, operator.le, "q")
+
+    def __gt__(self, other):
+        return self.combine(other, operator.gt, "q")
+
+    def __ge__(self, other):
+        return self.combine(other, operator.ge, "q")
+
+    def __eq__(self, other):
+        return self.combine(other, operator.eq, "q")
+
+    def __ne__(self, other):
+        return self.combine(other, operator.ne, "q")
+
+    # Reductions and element-wise math for the builtins
+
+    def sum(self):
+        return math.fsum(self.data) if self.data.typecode == "d" else sum(self.data)
+
+    def min(self):
+        if not self.data:
+            raise Exception("min() of an empty array")
+        return min(self.data)
+
+    def max(self):
+        if not self.data:
+            raise Exception("max() of an empty array")
+        return max(self.data)
+
+    def sqrt(self):
+        if self.data and min(self.data) < 0:
+            raise Exception("Cannot take sqrt of negative number")
+        return self.map(math.sqrt, "d")
+
+    def abs(self):
+        return self.map(abs)
+
+
+def index(value, position):
+    """Evaluate value[position] for the engines"""
+    if type(value) is not Array:
+        raise Exception(f"Only arrays can be indexed, not {type(flat(value)).__name__}")
+    return value[position]
@@ -0,0 +1,151 @@
+# Parallel batch runner for `chiken batch`
+#
+# Runs many independent jobs (a ChIkEn source plus the variables to seed it
+# with) over a process pool, one worker per core by default. Every source is
+# shipped to the workers once, when they start, and a worker parses it the
+# first time one of its jobs uses it, so jobs themselves carry only a source
+# index and their bindings. Jobs are sent in chunks to keep the per-job IPC
+# cost down.
+#
+# Each job produces a plain dict: its name and index, "ok" or "error" with
+# the matching exit code, the captured output, the error message and the
+# time it took. Results can be streamed in job order or as they complete.
+
+import io
+import json
+import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from src.engines import DEFAULT_ENGINE, engine_options
+from src.program import Engine
+from src.builtins import load_plugins
+
+# Jobs per chunk when the runner picks: about this many chunks per worker
+CHUNKS_PER_WORKER = 4
+
+
+class Job:
+    __slots__ = ("name", "source", "globals")
+
+    def __init__(self, name, source, globals=None):
+        self.name = name
+        self.source = source
+        self.globals = globals
+
+
+def file_jobs(paths):
+    """One job per .chiken file"""
+    return [Job(str(path), Path(path).read_text()) for path in paths]
+
+
+def sweep_jobs(name, source, bindings):
+    """One job per set of bindings ({name: value}) for a single program"""
+    jobs = []
+    for i, values in enumerate(bindings):
+        if not isinstance(values, Mapping) or not all(isinstance(key, str) for key in values):
+            raise ValueError(f"binding set {i} must map variable names to values, got {values!r}")
+        jobs.append(Job(f"{name}[{i}]", source, dict(values)))
+    return jobs
+
+
+def load_bindings(path):
+    """Read binding sets from a JSON array or a file of JSON lines"""
+    text = Path(path).read_text()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+# Worker side: the Engine, the sources and the programs parsed so far live
+# for the whole process
+
+_worker_engine = None
+_worker_sources = None
+_worker_programs = None
+
+
+def _init_worker(engine, optimize, options, sources):
+    global _worker_engine, _worker_sources, _worker_programs
+    load_plugins()
+    _worker_engine = Engine(engine, optimize, cache_size=max(len(sources), 1), **options)
+    _worker_sources = sources
+    _worker_programs = {}  # source index -> Program, or the error parsing it raised
+
+
+def _program(source_index):
+    program = _worker_programs.get(source_index)
+    if program is None:
+        try:
+            program = _worker_engine.compile(_worker_sources[source_index])
+        except Exception as e:
+            # Syntax errors are reported by every job that uses the source
+            program = e
+        _worker_programs[source_index] = program
+    return program
+
+
+def _run_job(index, name, source_index, globals):
+    result = {"index": index, "name": name, "status": "ok", "exit_code": 0, "output": "", "error": None, "pid": os.getpid()}
+    start = time.perf_counter()
+    stream = io.StringIO()
+    try:
+        program = _program(source_index)
+        if isinstance(program, Exception):
+            raise program
+        program.run(globals, stream)
+    except Exception as e:
+        result["status"] = "error"
+        result["exit_code"] = 1
+        result["error"] = str(e)
+    # Engines flush their output even when the program fails
+    result["output"] = stream.getvalue()
+    result["time"] = time.perf_counter() - start
+    return result
+
+
+def _run_chunk(chunk):
+    return [_run_job(*job) for job in chunk]
+
+
+class BatchRunner:
+    """Runs Jobs across a pool of warm worker processes
+
+        runner = BatchRunner(engine="vm")
+        for result in runner.run(sweep_jobs("rule", source, bindings)):
+            print(result["name"], result["status"], result["output"])
+    """
+
+    def __init__(self, engine=DEFAULT_ENGINE, optimize=False, workers=None, chunksize=None, **options):
+        self.engine = engine
+        self.optimize = optimize
+        self.options = engine_options(engine, options)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+
+    def chunks(self, jobs, sources):
+        index = {}
+        entries = []
+        for i, job in enumerate(jobs):
+            source_index = index.get(job.source)
+            if source_index is None:
+                source_index = index[job.source] = len(sources)
+                sources.append(job.source)
+            entries.append((i, job.name, source_index, job.globals))
+        size = self.chunksize or max(1, len(entries) // (self.workers * CHUNKS_PER_WORKER))
+        return [entries[i:i + size] for i in range(0, len(entries), size)]
+
+    def run(self, jobs, ordered=True):
+        """Yield one result dict per job, in job order or as they finish"""
+        sources = []
+        chunks = self.chunks(jobs, sources)
+        if not chunks:
+            return
+        workers = min(self.workers, len(chunks))
+        initargs = (self.engine, self.optimize, self.options, sources)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_run_chunk, chunk) for chunk in chunks]
+            for future in (futures if ordered else as_completed(futures)):
+                yield from future.result()
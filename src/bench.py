@@ -0,0 +1,167 @@
+# Benchmark harness for `chiken bench`
+#
+# Every workload is a ChIkEn program, timed stage by stage: lexing, parsing
+# and executing it on each engine. Each measurement runs a few warmup rounds
+# and then a fixed number of timed repetitions, summarized as min, median,
+# mean and standard deviation. Results are plain dicts, saved as JSON so
+# that a later run can be compared against them as a baseline.
+
+import io
+import platform
+import statistics
+import time
+from pathlib import Path
+
+from src.lexer import RegexLexer
+from src.parser import Parser
+from src.engines import create_engine
+from src.output import OutputSink
+
+# Directory of the bundled suite, next to src/ in a source checkout
+SUITE_DIR = Path(__file__).resolve().parent.parent / "benchmarks"
+
+# Relative slowdown of a median that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Slowdowns smaller than this many seconds are timer noise, not regressions
+MIN_REGRESSION = 0.0005
+
+# Generated sources are only lexed and parsed, never run
+GENERATED_PREFIX = "generated-"
+
+
+def synthetic_program(statements):
+    """A large program mixing assignments, functions, output and loops"""
+    lines = []
+    for i in range(statements):
+        kind = i % 4
+        if kind == 0:
+            lines.append(f"have v{i} = (v{max(i - 4, 0)} + {i % 97}) * 3 - {i} % 7")
+        elif kind == 1:
+            lines.append(f"func f{i}(a, b) {{\n  if (a > b) {{ return a - b }} else {{ return add(a, b) }}\n}}")
+        elif kind == 2:
+            lines.append(f'say "line {i}" + "x"')
+        else:
+            lines.append(f"repeat (v{i - 3} < {i}) {{ have v{i - 3} = v{i - 3} + 1 }}")
+    return "\n".join(lines) + "\n"
+
+
+def generated_source(megabytes):
+    # About 49 bytes per synthetic statement
+    return synthetic_program(max(1, int(megabytes * 1e6 / 49)))
+
+
+def load_workloads(paths=None, generated_mb=1.0):
+    """Return [(name, source)] for the given .chiken files or directories"""
+    files = []
+    for path in map(Path, paths or [SUITE_DIR]):
+        if path.is_dir():
+            files.extend(sorted(path.glob("*.chiken")))
+        else:
+            files.append(path)
+
+    workloads = [(file.stem, file.read_text()) for file in files]
+    if generated_mb:
+        workloads.append((f"{GENERATED_PREFIX}{generated_mb:g}mb", generated_source(generated_mb)))
+    return workloads
+
+
+def summarize(times):
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "times": times,
+    }
+
+
+def measure(func, warmup, repeat):
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def lex(source):
+    for _ in RegexLexer(source).tokens():
+        pass
+
+
+def parse(source):
+    return Parser(RegexLexer(source)).parse()
+
+
+def execute(engine, statements):
+    # Output is discarded so that terminal speed does not skew the timing
+    interpreter = create_engine(engine, output=OutputSink(io.StringIO()))
+    interpreter.run(statements)
+
+
+def result_key(result):
+    return f"{result['workload']}/{result['stage']}/{result['engine'] or '-'}"
+
+
+class BenchmarkRunner:
+    def __init__(self, engines, warmup=1, repeat=5, progress=None):
+        self.engines = engines
+        self.warmup = warmup
+        self.repeat = repeat
+        self.progress = progress  # called with every finished result
+        self.results = []
+
+    def run(self, workloads):
+        for name, source in workloads:
+            self.record(name, "lex", None, lambda: lex(source))
+            self.record(name, "parse", None, lambda: parse(source))
+            if name.startswith(GENERATED_PREFIX):
+                continue
+            statements = parse(source)
+            for engine in self.engines:
+                self.record(name, "execute", engine, lambda: execute(engine, statements))
+        return self.to_dict()
+
+    def record(self, workload, stage, engine, func):
+        result = {"workload": workload, "stage": stage, "engine": engine}
+        result.update(measure(func, self.warmup, self.repeat))
+        self.results.append(result)
+        if self.progress is not None:
+            self.progress(result)
+
+    def to_dict(self):
+        return {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "warmup": self.warmup,
+            "repeat": self.repeat,
+            "results": self.results,
+        }
+
+
+def format_result(result):
+    return (
+        f"{result_key(result):<36} median {result['median'] * 1000:>9.2f} ms"
+        f"  min {result['min'] * 1000:>9.2f} ms  stdev {result['stdev'] * 1000:>7.2f} ms"
+    )
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return [(key, baseline median, new median)] for every regression
+
+    A result regresses when its median is more than `threshold` (a
+    fraction) and MIN_REGRESSION seconds slower than the baseline's.
+    Results missing from either side are ignored.
+    """
+    old = {result_key(result): result["median"] for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        key = result_key(result)
+        if key not in old:
+            continue
+        if result["median"] > old[key] * (1 + threshold) and result["median"] - old[key] > MIN_REGRESSION:
+            regressions.append((key, old[key], result["median"]))
+    return regressions
@@ -0,0 +1,265 @@
+# Built-in functions for ChIkEn
+#
+# Builtins live in a registry mapping each name to a Builtin: the Python
+# callable plus its declared arity and purity. Engines look a name up once
+# and check the argument count before evaluating any argument. Extensions
+# add their own functions with the `register` decorator (importable as
+# chiken.builtins.register), or ship them as a package exposing a module in
+# the "chiken.builtins" entry point group.
+
+import math
+import sys
+
+from src.arrays import Array
+from src.ropes import Rope, concat, flat, flatten
+
+ENTRY_POINT_GROUP = "chiken.builtins"
+
+
+class Builtin:
+    __slots__ = ("name", "func", "min_args", "max_args", "pure", "interactive")
+
+    def __init__(self, name, func, min_args, max_args, pure=False, interactive=False):
+        self.name = name
+        self.func = func
+        self.min_args = min_args
+        self.max_args = max_args if max_args is not None else sys.maxsize
+        self.pure = pure  # result depends only on the arguments
+        self.interactive = interactive  # reads the terminal; output is flushed first
+
+    def check(self, argc, name=None):
+        """Raise the ChIkEn arity error unless argc arguments are accepted"""
+        if self.min_args <= argc <= self.max_args:
+            return
+        name = name or self.name
+        low, high = self.min_args, self.max_args
+        if low == high:
+            expected = f"{low} argument{'s' if low != 1 else ''}"
+        elif high == sys.maxsize:
+            expected = f"at least {low} argument{'s' if low != 1 else ''}"
+        elif high == low + 1:
+            expected = f"{low} or {high} argument{'s' if high != 1 else ''}"
+        else:
+            expected = f"{low} to {high} arguments"
+        raise Exception(f"{name}() expects {expected}, got {argc}")
+
+    def __repr__(self):
+        return f"Builtin({self.name})"
+
+
+# Name -> Builtin; aliases share one Builtin
+BUILTINS = {}
+
+
+def register(name=None, arity=None, min_args=None, max_args=None, pure=False, interactive=False, aliases=(), ropes=False):
+    """Decorator adding a Python function to the ChIkEn builtins
+
+        @register(arity=2, pure=True)
+        def hypot(x, y):
+            return math.hypot(x, y)
+
+    The function is called with the evaluated ChIkEn arguments. Give either
+    a fixed arity or min_args/max_args (max_args None for no limit); when
+    neither is given it is taken from the function's signature. Mark
+    functions whose result depends only on their arguments pure=True so
+    that --memoize can cache their callers. Registering an existing name
+    replaces it. Exceptions raised by the function become ChIkEn errors.
+    Long strings built by concatenation are Ropes (src/ropes.py); they are
+    turned into str before the call unless the function says ropes=True.
+    """
+    def decorator(func):
+        low, high = min_args, max_args
+        if arity is not None:
+            low = high = arity
+        elif low is None and high is None:
+            code = func.__code__
+            high = code.co_argcount
+            low = high - len(func.__defaults__ or ())
+            if code.co_flags & 0x04:  # *args
+                high = None
+        builtin = Builtin(name or func.__name__, func if ropes else _plain_strings(func), low or 0, high, pure, interactive)
+        for alias in (builtin.name,) + tuple(aliases):
+            BUILTINS[alias] = builtin
+        return func
+
+    return decorator
+
+
+def _plain_strings(func):
+    def call(*args):
+        for arg in args:
+            if type(arg) is Rope:
+                return func(*flatten(args))
+        return func(*args)
+
+    call.__name__ = func.__name__
+    return call
+
+
+def unregister(name):
+    BUILTINS.pop(name, None)
+
+
+def lookup_builtin(name):
+    try:
+        return BUILTINS[name]
+    except KeyError:
+        raise Exception(f"Unknown function: {name}") from None
+
+
+def call_builtin(name, arg_values, output=None):
+    builtin = lookup_builtin(name)
+    builtin.check(len(arg_values), name)
+    if builtin.interactive and output is not None:
+        output.before_input()
+    return builtin.func(*arg_values)
+
+
+def is_pure_builtin(name):
+    builtin = BUILTINS.get(name)
+    return builtin is not None and builtin.pure
+
+
+_plugins_loaded = False
+
+
+def load_plugins():
+    """Import every module registered under the chiken.builtins entry point"""
+    global _plugins_loaded
+    if _plugins_loaded:
+        return
+    _plugins_loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return
+    try:
+        found = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:
+        # Python < 3.10 returns a dict of groups
+        found = entry_points().get(ENTRY_POINT_GROUP, [])
+    for entry_point in found:
+        loaded = entry_point.load()
+        # Entry points may also name a function that registers builtins
+        if callable(loaded):
+            loaded()
+
+
+# Input function
+
+@register("input", min_args=0, max_args=1, interactive=True, ropes=True)
+def _input(prompt=""):
+    try:
+        result = input(str(prompt))
+    except EOFError:
+        return ""
+    return parse_input(result)
+
+
+def parse_input(text):
+    """Turn a line read by input() into a number when it looks like one"""
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+# Math functions
+
+@register("add", arity=2, pure=True, ropes=True)
+def _add(left, right):
+    if type(left) is str:
+        return concat(left, right)
+    return left + right
+
+
+@register("subtract", arity=2, pure=True, aliases=("sub",), ropes=True)
+def _subtract(left, right):
+    return left - right
+
+
+@register("multiply", arity=2, pure=True, aliases=("mul",), ropes=True)
+def _multiply(left, right):
+    return left * right
+
+
+@register("divide", arity=2, pure=True, aliases=("div",), ropes=True)
+def _divide(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Division by zero")
+    return left / right
+
+
+@register("power", arity=2, pure=True, aliases=("pow",), ropes=True)
+def _power(base, exponent):
+    return base ** exponent
+
+
+@register("sqrt", arity=1, pure=True, ropes=True)
+def _sqrt(value):
+    if type(value) is Array:
+        return value.sqrt()
+    if value < 0:
+        raise Exception("Cannot take sqrt of negative number")
+    return math.sqrt(value)
+
+
+@register("abs", arity=1, pure=True, ropes=True)
+def _abs(value):
+    if type(value) is Array:
+        return value.abs()
+    return abs(flat(value))
+
+
+# min() and max() take two or more numbers, or a single array
+
+@register("min", min_args=1, pure=True, ropes=True)
+def _min(*values):
+    if len(values) == 1:
+        return _array_arg("min", values[0], "at least 2 arguments, got 1").min()
+    return min(values)
+
+
+@register("max", min_args=1, pure=True, ropes=True)
+def _max(*values):
+    if len(values) == 1:
+        return _array_arg("max", values[0], "at least 2 arguments, got 1").max()
+    return max(values)
+
+
+# Array functions
+
+def _array_arg(name, value, expected="an array"):
+    if type(value) is not Array:
+        raise Exception(f"{name}() expects {expected}")
+    return value
+
+
+@register("range", min_args=1, max_args=3, pure=True, ropes=True)
+def _range(start, stop=None, step=1):
+    return Array.range(start, stop, step)
+
+
+@register("len", arity=1, pure=True, ropes=True)
+def _len(value):
+    if type(value) not in (Array, str, Rope):
+        raise Exception("len() expects an array or a string")
+    return len(value)
+
+
+@register("sum", arity=1, pure=True, ropes=True)
+def _sum(values):
+    return _array_arg("sum", values).sum()
+
+
+@register("any", arity=1, pure=True, ropes=True)
+def _any(values):
+    return any(_array_arg("any", values).data)
+
+
+@register("all", arity=1, pure=True, ropes=True)
+def _all(values):
+    return all(_array_arg("all", values).data)
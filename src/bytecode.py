@@ -0,0 +1,340 @@
+# Bytecode compiler for ChIkEn
+#
+# Lowers the AST to a flat instruction stream. Every instruction is two
+# integers, an opcode followed by its argument, so a code object is just a
+# list of ints plus the constant and name tables it refers to. Jump targets
+# are indices into that list.
+
+import marshal
+
+from src.resolver import resolve, fallback_reads, find_functions
+from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+
+# Opcodes
+LOAD_CONST = 1         # push consts[arg]
+LOAD_NAME = 2          # push the variable names[arg]
+STORE_NAME = 3         # pop into the variable names[arg]
+POP_TOP = 4            # discard the top of the stack
+PRINT = 5              # pop and print
+JUMP = 6               # continue at arg
+POP_JUMP_IF_FALSE = 7  # pop, continue at arg if falsy
+CALL = 8               # call consts[arg] == (name, argc) with argc stacked args
+RETURN_VALUE = 9       # pop and return to the calling frame
+MAKE_FUNCTION = 10     # bind consts[arg] (a FunctionCode) under its name
+LOAD_FAST = 11         # push frame slot arg of the running function
+STORE_FAST = 12        # pop into frame slot arg
+LOAD_FREE = 13         # push names[arg] from the calling frames
+TAIL_CALL = 14         # like CALL, but the callee replaces the running frame
+CHECK_CALL = 15        # check a call's target and argument count before its args run
+BUILD_ARRAY = 16       # pop arg values into a new Array
+SET_RETURN = 17        # pop into the frame's pending return value
+CHECK_RETURN = 18      # return the pending return value unless it is None
+ADD = 20
+SUB = 21
+MUL = 22
+DIV = 23
+MOD = 24
+AND = 25
+OR = 26
+GT = 27
+LT = 28
+GTE = 29
+LTE = 30
+EQ = 31
+NEQ = 32
+NOT = 33
+INDEX = 34             # pop an index and an array, push the element
+
+OPNAMES = {
+    value: name for name, value in list(globals().items())
+    if name.isupper() and isinstance(value, int)
+}
+
+BINARY_OPCODES = {
+    "PLUS": ADD,
+    "MINUS": SUB,
+    "MUL": MUL,
+    "DIV": DIV,
+    "MOD": MOD,
+    "AND": AND,
+    "OR": OR,
+    "GT": GT,
+    "LT": LT,
+    "GTE": GTE,
+    "LTE": LTE,
+    "EQ": EQ,
+    "NEQ": NEQ,
+}
+
+# Bumped whenever the instruction set or the serialized layout changes
+BYTECODE_VERSION = 7
+
+
+class Code:
+    def __init__(self, ops, consts, names):
+        self.ops = ops  # flat list of [opcode, arg, opcode, arg, ...]
+        self.consts = consts
+        self.names = names
+
+    def __repr__(self):
+        return f"Code({len(self.ops) // 2} instructions)"
+
+
+class FunctionCode:
+    def __init__(self, name, params, slots, code, free_names=()):
+        self.name = name
+        self.params = tuple(params)
+        self.slots = tuple(slots)  # frame layout, see src/resolver.py
+        self.slot_index = {slot: i for i, slot in enumerate(self.slots)}
+        self.code = code
+        # Names the function may read from its callers' frames
+        self.free_names = frozenset(free_names)
+
+    def __repr__(self):
+        return f"FunctionCode({self.name})"
+
+
+class Compiler:
+    def __init__(self, known_functions=frozenset()):
+        self.ops = []
+        self.consts = []
+        self.names = []
+        self.const_index = {}
+        self.name_index = {}
+        self.in_function = False
+        self.check_return = False  # a SET_RETURN was emitted since the last CHECK_RETURN
+        # Names of user functions; calls to anything else are builtin calls
+        self.known_functions = known_functions
+
+    def compile(self, statements):
+        """Compile top-level statements into a Code object"""
+        if self.in_function:
+            self.function_body(statements)
+        else:
+            self.block(statements)
+        self.emit(LOAD_CONST, self.const(None))
+        self.emit(RETURN_VALUE)
+        return Code(self.ops, self.consts, self.names)
+
+    def emit(self, op, arg=0):
+        self.ops.append(op)
+        self.ops.append(arg)
+        return len(self.ops) - 2
+
+    def patch(self, index, target):
+        self.ops[index + 1] = target
+
+    def const(self, value):
+        # Keyed by type too so that 1, 1.0 and True stay apart, and floats
+        # by repr so that 0.0 and -0.0 do
+        key = (type(value), repr(value) if type(value) is float else value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def function_body(self, statements):
+        # Like the tree-walker, a `return` only ends the function after the
+        # top-level statement it ran in, and only with a value other than
+        # None. A return that nothing can follow leaves at once.
+        last = len(statements) - 1
+        for i, stmt in enumerate(statements):
+            self.statement(stmt, i == last)
+            if self.check_return:
+                self.emit(CHECK_RETURN)
+                self.check_return = False
+
+    def block(self, statements, final=False):
+        # With final, the last statement ends the function
+        last = len(statements) - 1
+        for i, stmt in enumerate(statements):
+            self.statement(stmt, final and i == last)
+
+    def statement(self, node, final=False):
+        if isinstance(node, VarAssignNode):
+            self.expr(node.value_node)
+            if self.in_function:
+                self.emit(STORE_FAST, node.slot)
+            else:
+                self.emit(STORE_NAME, self.name(node.name))
+
+        elif isinstance(node, PrintNode):
+            self.expr(node.value_node)
+            self.emit(PRINT)
+
+        elif isinstance(node, IfNode):
+            self.expr(node.condition)
+            jump_else = self.emit(POP_JUMP_IF_FALSE)
+            self.block(node.then_block, final)
+            if node.else_block:
+                jump_end = self.emit(JUMP)
+                self.patch(jump_else, len(self.ops))
+                self.block(node.else_block, final)
+                self.patch(jump_end, len(self.ops))
+            else:
+                self.patch(jump_else, len(self.ops))
+
+        elif isinstance(node, RepeatNode):
+            start = len(self.ops)
+            self.expr(node.condition)
+            jump_end = self.emit(POP_JUMP_IF_FALSE)
+            self.block(node.body)
+            self.emit(JUMP, start)
+            self.patch(jump_end, len(self.ops))
+
+        elif isinstance(node, FunctionDefNode):
+            resolve(node)
+            compiler = Compiler(self.known_functions)
+            compiler.in_function = True
+            code = compiler.compile(node.body)
+            free_names = fallback_reads(node.body, set(node.params), set())
+            func = FunctionCode(node.name, node.params, node.slots, code, free_names)
+            self.emit(MAKE_FUNCTION, self.const(func))
+
+        elif isinstance(node, ReturnNode):
+            if final and isinstance(node.value_node, FunctionCallNode):
+                # `return f(...)` needs nothing from this frame afterwards
+                self.call(node.value_node, TAIL_CALL)
+                return
+            if node.value_node is None:
+                self.emit(LOAD_CONST, self.const(None))
+            else:
+                self.expr(node.value_node)
+            if final:
+                self.emit(RETURN_VALUE)
+            elif self.in_function:
+                self.emit(SET_RETURN)
+                self.check_return = True
+            else:
+                # A stray top-level return does not stop the program
+                self.emit(POP_TOP)
+
+        else:
+            self.expr(node)
+            self.emit(POP_TOP)
+
+    def expr(self, node):
+        if isinstance(node, (NumberNode, StringNode)):
+            self.emit(LOAD_CONST, self.const(node.value))
+
+        elif isinstance(node, VarAccessNode):
+            if not self.in_function:
+                self.emit(LOAD_NAME, self.name(node.name))
+            elif node.slot is not None:
+                self.emit(LOAD_FAST, node.slot)
+            else:
+                self.emit(LOAD_FREE, self.name(node.name))
+
+        elif isinstance(node, (BinOpNode, ComparisonNode)):
+            op_type = node.op_type
+            if op_type not in BINARY_OPCODES:
+                raise Exception(f"Unknown operator {op_type}")
+            self.expr(node.left_node)
+            self.expr(node.right_node)
+            self.emit(BINARY_OPCODES[op_type])
+
+        elif isinstance(node, UnaryOpNode):
+            if node.op_type != "NOT":
+                raise Exception(f"Unknown unary operator {node.op_type}")
+            self.expr(node.operand)
+            self.emit(NOT)
+
+        elif isinstance(node, FunctionCallNode):
+            self.call(node, CALL)
+
+        elif isinstance(node, ArrayNode):
+            for element in node.elements:
+                self.expr(element)
+            self.emit(BUILD_ARRAY, len(node.elements))
+
+        elif isinstance(node, IndexNode):
+            self.expr(node.target)
+            self.expr(node.index)
+            self.emit(INDEX)
+
+        else:
+            raise Exception(f"Unknown node type: {type(node)}")
+
+    def call(self, node, op):
+        call = self.const((node.name, len(node.args)))
+        # Like the tree-walker, a bad call fails before its arguments run;
+        # literal arguments cannot be told apart, so they need no check
+        if node.name not in self.known_functions or not all(isinstance(arg, (NumberNode, StringNode)) for arg in node.args):
+            self.emit(CHECK_CALL, call)
+        for arg in node.args:
+            self.expr(arg)
+        self.emit(op, call)
+
+
+def compile_program(statements, known_functions=()):
+    """Compile a program; known_functions names user functions defined earlier"""
+    known = set(known_functions)
+    known.update(func.name for func in find_functions(statements))
+    return Compiler(frozenset(known)).compile(statements)
+
+
+def free_names(code, names=None):
+    """Collect the free names of every function defined in a Code object"""
+    if names is None:
+        names = set()
+    for value in code.consts:
+        if isinstance(value, FunctionCode):
+            names |= value.free_names
+            free_names(value.code, names)
+    return names
+
+
+def dis(code, indent=""):
+    """Return a human-readable listing of a Code object"""
+    lines = []
+    for pc in range(0, len(code.ops), 2):
+        op, arg = code.ops[pc], code.ops[pc + 1]
+        line = f"{indent}{pc:>5} {OPNAMES[op]:<18}"
+        if op in (LOAD_CONST, CALL, TAIL_CALL, CHECK_CALL, MAKE_FUNCTION):
+            line += f" {arg} ({code.consts[arg]!r})"
+        elif op in (LOAD_NAME, STORE_NAME, LOAD_FREE):
+            line += f" {arg} ({code.names[arg]})"
+        elif op in (JUMP, POP_JUMP_IF_FALSE, LOAD_FAST, STORE_FAST):
+            line += f" {arg}"
+        lines.append(line)
+        if op == MAKE_FUNCTION:
+            lines.append(dis(code.consts[arg].code, indent + "    "))
+    return "\n".join(lines)
+
+
+def _to_tuple(code):
+    consts = []
+    for value in code.consts:
+        if isinstance(value, FunctionCode):
+            value = ("<func>", value.name, value.params, value.slots, _to_tuple(value.code), tuple(sorted(value.free_names)))
+        consts.append(value)
+    return (tuple(code.ops), tuple(consts), tuple(code.names))
+
+
+def _from_tuple(data):
+    ops, consts, names = data
+    loaded = []
+    for value in consts:
+        if isinstance(value, tuple) and len(value) == 6 and value[0] == "<func>":
+            value = FunctionCode(value[1], value[2], value[3], _from_tuple(value[4]), value[5])
+        loaded.append(value)
+    return Code(list(ops), loaded, list(names))
+
+
+def dumps(code):
+    """Serialize a Code object to bytes"""
+    return marshal.dumps((BYTECODE_VERSION, _to_tuple(code)))
+
+
+def loads(data):
+    """Load a Code object serialized with dumps()"""
+    version, code = marshal.loads(data)
+    if version != BYTECODE_VERSION:
+        raise Exception(f"Unsupported bytecode version {version}")
+    return _from_tuple(code)
@@ -0,0 +1,90 @@
+# On-disk cache of parsed ChIkEn programs
+#
+# Works like __pycache__: parsed programs are pickled into a cache directory
+# next to the source file, keyed by a hash of the source text and the
+# interpreter version. A changed source or a new interpreter simply produces
+# a different key, so stale entries are never loaded.
+#
+# Entry names start with the file's stem and a hash of its resolved path, so
+# files with the same name in different directories never share (or prune)
+# each other's entries in a common --cache-dir.
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+CACHE_DIR_NAME = "__chikencache__"
+CACHE_SUFFIX = ".chikenc"
+
+# Bumped whenever the AST classes change shape
+CACHE_FORMAT = 5
+
+
+class ProgramCache:
+    def __init__(self, cache_dir=None, version=""):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.version = version
+
+    def key(self, source):
+        digest = hashlib.sha256()
+        digest.update(f"{self.version}:{CACHE_FORMAT}:".encode())
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()[:32]
+
+    def directory(self, source_path):
+        if self.cache_dir is not None:
+            return self.cache_dir
+        return Path(source_path).resolve().parent / CACHE_DIR_NAME
+
+    def prefix(self, source_path):
+        """The start of every entry name for one source file"""
+        path = Path(source_path).resolve()
+        digest = hashlib.sha256(str(path).encode("utf-8", "surrogatepass")).hexdigest()[:16]
+        return f"{path.stem}.{digest}"
+
+    def path(self, source_path, source):
+        return self.directory(source_path) / f"{self.prefix(source_path)}.{self.key(source)}{CACHE_SUFFIX}"
+
+    def load(self, source_path, source):
+        """Return the cached statements for source, or None on a miss"""
+        try:
+            with open(self.path(source_path, source), "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            # Missing, unreadable or corrupt entries are all just misses
+            return None
+
+    def store(self, source_path, source, statements):
+        """Write statements to the cache; returns the entry path or None"""
+        path = self.path(source_path, source)
+        try:
+            data = pickle.dumps(statements, protocol=pickle.HIGHEST_PROTOCOL)
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except (OSError, RecursionError, pickle.PicklingError):
+            return None
+
+        self.prune(path, self.prefix(source_path))
+        return path
+
+    def prune(self, current, prefix):
+        # Older entries for the same source file are dead once it changed
+        for entry in current.parent.glob(f"{glob.escape(prefix)}.*{CACHE_SUFFIX}"):
+            key = entry.name[len(prefix) + 1:-len(CACHE_SUFFIX)]
+            if entry != current and len(key) == 32 and "." not in key:
+                try:
+                    entry.unlink()
+                except OSError:
+                    pass
@@ -0,0 +1,481 @@
+# Closure compiler for ChIkEn
+#
+# Instead of re-dispatching on the node type every time a node is evaluated,
+# the compiler walks the AST once and turns every node into a Python closure
+# with its children (and, for operators, the operation itself) pre-bound.
+# Running a program is then just a matter of calling those closures.
+
+from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+from src.builtins import BUILTINS, lookup_builtin
+from src.resolver import UNSET, resolve, lookup, recursion_error
+from src.memo import Memoizer, memo_key
+from src.output import OutputSink
+from src.arrays import Array, index
+from src.ropes import concat
+from src.loops import counting_loop
+from src.profiler import PROGRAM
+
+_MISSING = object()
+
+
+def _div(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Division by zero")
+    return left / right
+
+
+def _mod(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Modulo by zero")
+    return left % right
+
+
+# Operator closures for two sub-expressions
+BINARY_OPS = {
+    # Long strings become Ropes (src/ropes.py)
+    "PLUS": lambda l, r: lambda env: concat(left, r(env)) if type(left := l(env)) is str else left + r(env),
+    "MINUS": lambda l, r: lambda env: l(env) - r(env),
+    "MUL": lambda l, r: lambda env: l(env) * r(env),
+    "DIV": lambda l, r: lambda env: _div(l(env), r(env)),
+    "MOD": lambda l, r: lambda env: _mod(l(env), r(env)),
+    # Both operands are always evaluated, just like in the tree-walker
+    "AND": lambda l, r: lambda env: _and(l(env), r(env)),
+    "OR": lambda l, r: lambda env: _or(l(env), r(env)),
+    "GT": lambda l, r: lambda env: l(env) > r(env),
+    "LT": lambda l, r: lambda env: l(env) < r(env),
+    "GTE": lambda l, r: lambda env: l(env) >= r(env),
+    "LTE": lambda l, r: lambda env: l(env) <= r(env),
+    "EQ": lambda l, r: lambda env: l(env) == r(env),
+    "NEQ": lambda l, r: lambda env: l(env) != r(env),
+}
+
+# Operator closures for a sub-expression and a literal right operand
+CONST_OPS = {
+    "PLUS": lambda l, c: (lambda env: concat(left, c) if type(left := l(env)) is str else left + c) if type(c) is str else (lambda env: l(env) + c),
+    "MINUS": lambda l, c: lambda env: l(env) - c,
+    "MUL": lambda l, c: lambda env: l(env) * c,
+    "GT": lambda l, c: lambda env: l(env) > c,
+    "LT": lambda l, c: lambda env: l(env) < c,
+    "GTE": lambda l, c: lambda env: l(env) >= c,
+    "LTE": lambda l, c: lambda env: l(env) <= c,
+    "EQ": lambda l, c: lambda env: l(env) == c,
+    "NEQ": lambda l, c: lambda env: l(env) != c,
+}
+
+
+def _and(left, right):
+    return left and right
+
+
+def _or(left, right):
+    return left or right
+
+
+class ClosureCompiler:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.profiler = interpreter.profiler
+        self.in_function = False
+        self.nparams = 0  # parameters of the function being compiled
+
+    def compile(self, statements):
+        """Compile a list of top-level statements into a single closure"""
+        stmts = tuple(self.statement(stmt) for stmt in statements)
+
+        def program(env):
+            for stmt in stmts:
+                stmt(env)
+
+        if self.profiler is not None:
+            return self.profiler.time_function(program, PROGRAM, 0)
+        return program
+
+    def block(self, statements):
+        stmts = tuple(self.statement(stmt) for stmt in statements)
+
+        if len(stmts) == 1:
+            return stmts[0]
+
+        def block(env):
+            for stmt in stmts:
+                stmt(env)
+
+        return block
+
+    def function_body(self, statements):
+        # Like the tree-walker, a `return` only ends the function after the
+        # top-level statement it ran in, and only with a value other than None
+        interpreter = self.interpreter
+        stmts = tuple(self.statement(stmt) for stmt in statements)
+
+        def function_body(env):
+            interpreter.return_value = None
+            for stmt in stmts:
+                stmt(env)
+                if interpreter.return_value is not None:
+                    break
+            result = interpreter.return_value
+            interpreter.return_value = None
+            return result
+
+        return function_body
+
+    def statement(self, node):
+        stmt = self.bare_statement(node)
+        line = getattr(node, "line", None)
+        if self.profiler is not None and line is not None:
+            stmt = self.profiler.count_line(stmt, line)
+        return stmt
+
+    def bare_statement(self, node):
+        if isinstance(node, VarAssignNode):
+            return self.var_assign(node)
+        elif isinstance(node, PrintNode):
+            return self.print_stmt(node)
+        elif isinstance(node, IfNode):
+            return self.if_stmt(node)
+        elif isinstance(node, RepeatNode):
+            return self.repeat_stmt(node)
+        elif isinstance(node, FunctionDefNode):
+            return self.func_def(node)
+        elif isinstance(node, ReturnNode):
+            return self.return_stmt(node)
+
+        expr = self.expr(node)
+
+        def expr_stmt(env):
+            expr(env)
+
+        return expr_stmt
+
+    def var_assign(self, node):
+        # Inside functions `env` is the frame list and the key is a slot
+        key = node.slot if self.in_function else node.name
+        value = self.expr(node.value_node)
+
+        def var_assign(env):
+            env[key] = value(env)
+
+        return var_assign
+
+    def print_stmt(self, node):
+        value = self.expr(node.value_node)
+        say = self.interpreter.output.say
+
+        def print_stmt(env):
+            say(value(env))
+
+        return print_stmt
+
+    def if_stmt(self, node):
+        condition = self.expr(node.condition)
+        then_block = self.block(node.then_block)
+
+        if not node.else_block:
+            def if_stmt(env):
+                if condition(env):
+                    then_block(env)
+
+            return if_stmt
+
+        else_block = self.block(node.else_block)
+
+        def if_else_stmt(env):
+            if condition(env):
+                then_block(env)
+            else:
+                else_block(env)
+
+        return if_else_stmt
+
+    def repeat_stmt(self, node):
+        condition = self.expr(node.condition)
+        body = self.block(node.body)
+
+        def repeat_stmt(env):
+            while condition(env):
+                body(env)
+
+        # Profiled loops stay general so every line's hits are counted
+        loop = counting_loop(node) if self.profiler is None else None
+        if loop is None:
+            return repeat_stmt
+        self.interpreter.loops.append(loop)
+        return self.counting_repeat(loop, repeat_stmt)
+
+    def counting_repeat(self, loop, general):
+        start = self.expr(loop.counter)
+        bound = self.expr(loop.bound)
+        body = self.block(loop.body) if loop.body else None
+        key = loop.store.slot if self.in_function else loop.store.name
+        step = loop.step
+        values = loop.values
+
+        def counting_repeat_stmt(env):
+            first = start(env)
+            stop = bound(env)
+            if type(first) is not int or type(stop) is not int:
+                loop.fallbacks += 1
+                return general(env)
+            loop.runs += 1
+            counter = values(first, stop)
+            if body is None:
+                if counter:
+                    env[key] = counter[-1] + step
+                return
+            for value in counter:
+                env[key] = value
+                body(env)
+            if counter:
+                env[key] = counter[-1] + step
+
+        return counting_repeat_stmt
+
+    def func_def(self, node):
+        functions = self.interpreter.functions
+        name = node.name
+        resolve(node)
+
+        outer = self.in_function, self.nparams
+        self.in_function, self.nparams = True, len(node.params)
+        body = self.function_body(node.body)
+        self.in_function, self.nparams = outer
+        if self.profiler is not None:
+            body = self.profiler.time_function(body, name, node.line)
+
+        padding = (UNSET,) * (len(node.slots) - len(node.params))
+        func = (len(node.params), padding, node.slot_index, body, node)
+        memo = self.interpreter.memo
+
+        if memo is not None:
+            def memo_func_def(env):
+                functions[name] = func
+                memo.update({fname: f[4] for fname, f in functions.items()})
+
+            return memo_func_def
+
+        def func_def(env):
+            functions[name] = func
+
+        return func_def
+
+    def return_stmt(self, node):
+        # The value is picked up by function_body; a stray top-level return
+        # does not stop the program
+        interpreter = self.interpreter
+
+        if node.value_node is None:
+            def return_none(env):
+                interpreter.return_value = None
+
+            return return_none
+
+        value = self.expr(node.value_node)
+
+        def return_stmt(env):
+            interpreter.return_value = value(env)
+
+        return return_stmt
+
+    def expr(self, node):
+        if isinstance(node, (NumberNode, StringNode)):
+            value = node.value
+            return lambda env: value
+
+        elif isinstance(node, VarAccessNode):
+            return self.var_access(node)
+
+        elif isinstance(node, (BinOpNode, ComparisonNode)):
+            op_type = node.op_type
+            left = self.expr(node.left_node)
+
+            if isinstance(node.right_node, (NumberNode, StringNode)) and op_type in CONST_OPS:
+                return CONST_OPS[op_type](left, node.right_node.value)
+
+            if op_type not in BINARY_OPS:
+                raise Exception(f"Unknown operator {op_type}")
+            return BINARY_OPS[op_type](left, self.expr(node.right_node))
+
+        elif isinstance(node, UnaryOpNode):
+            if node.op_type != "NOT":
+                raise Exception(f"Unknown unary operator {node.op_type}")
+            operand = self.expr(node.operand)
+            return lambda env: not operand(env)
+
+        elif isinstance(node, FunctionCallNode):
+            return self.function_call(node)
+
+        elif isinstance(node, ArrayNode):
+            return self.array(node)
+
+        elif isinstance(node, IndexNode):
+            target = self.expr(node.target)
+            position = self.expr(node.index)
+            return lambda env: index(target(env), position(env))
+
+        raise Exception(f"Unknown node type: {type(node)}")
+
+    def array(self, node):
+        if all(isinstance(element, (NumberNode, StringNode)) for element in node.elements):
+            # Arrays are immutable, so a literal one is built only once
+            value = Array.from_values([element.value for element in node.elements])
+            return lambda env: value
+
+        elements = tuple(self.expr(element) for element in node.elements)
+        from_values = Array.from_values
+        return lambda env: from_values([element(env) for element in elements])
+
+    def var_access(self, node):
+        name = node.name
+        slot = node.slot
+
+        if not self.in_function:
+            def global_access(env):
+                try:
+                    return env[name]
+                except KeyError:
+                    raise Exception(f"Variable '{name}' not defined") from None
+
+            return global_access
+
+        if slot is None:
+            return lambda env: lookup(env, name)
+
+        if slot < self.nparams:
+            # Parameters are bound from the start of the call
+            return lambda env: env[slot]
+
+        def local_access(env):
+            value = env[slot]
+            if value is UNSET:
+                return lookup(env, name)
+            return value
+
+        return local_access
+
+    def function_call(self, node):
+        interpreter = self.interpreter
+        functions = interpreter.functions
+        name = node.name
+        args = tuple(self.expr(arg) for arg in node.args)
+        nargs = len(args)
+
+        if interpreter.memo is not None:
+            return self.memo_function_call(name, args)
+        builtin = self.builtin_call(name, args)
+
+        def function_call(env):
+            func = functions.get(name)
+            if func is None:
+                return builtin(env)
+
+            nparams, padding, slot_index, body, _ = func
+            if nargs != nparams:
+                raise Exception(f"{name}() expects {nparams} arguments, got {nargs}")
+
+            # A fresh frame (see src/resolver.py) chained to the caller's
+            frame = [arg(env) for arg in args]
+            frame.extend(padding)
+            frame.append(slot_index)
+            frame.append(env)
+
+            return body(frame)
+
+        return function_call
+
+    def builtin_call(self, name, args):
+        """Closure calling the builtin `name`, used when no user function has that name"""
+        output = self.interpreter.output
+        nargs = len(args)
+        builtin = BUILTINS.get(name)
+
+        if builtin is None or builtin.interactive or not builtin.min_args <= nargs <= builtin.max_args:
+            # Errors are raised when the call runs, before its arguments
+            # are evaluated; input() flushes pending output first
+            def checked_builtin_call(env):
+                found = lookup_builtin(name)
+                found.check(nargs, name)
+                values = [arg(env) for arg in args]
+                if found.interactive:
+                    output.before_input()
+                return found.func(*values)
+
+            return checked_builtin_call
+
+        # Resolved once, here, for the lifetime of the call site
+        func = builtin.func
+        if nargs == 1:
+            arg0, = args
+            return lambda env: func(arg0(env))
+        if nargs == 2:
+            arg0, arg1 = args
+            return lambda env: func(arg0(env), arg1(env))
+        return lambda env: func(*[arg(env) for arg in args])
+
+    def memo_function_call(self, name, args):
+        # Like function_call, but pure functions answer from their cache
+        interpreter = self.interpreter
+        functions = interpreter.functions
+        memo = interpreter.memo
+        nargs = len(args)
+        builtin = self.builtin_call(name, args)
+
+        def memo_function_call(env):
+            func = functions.get(name)
+            if func is None:
+                return builtin(env)
+
+            nparams, padding, slot_index, body, _ = func
+            if nargs != nparams:
+                raise Exception(f"{name}() expects {nparams} arguments, got {nargs}")
+
+            frame = [arg(env) for arg in args]
+            cache = memo.caches.get(name)
+            if cache is not None:
+                key = memo_key(frame)
+                result = cache.get(key, _MISSING)
+                if result is not _MISSING:
+                    # Like a finished call, a cached one clears the caller's pending return
+                    interpreter.return_value = None
+                    return result
+
+            frame.extend(padding)
+            frame.append(slot_index)
+            frame.append(env)
+
+            result = body(frame)
+            if cache is not None:
+                cache.put(key, result)
+            return result
+
+        return memo_function_call
+
+
+class ClosureInterpreter:
+    """Runs programs through closures built once by ClosureCompiler"""
+
+    def __init__(self, memoize=None, output=None, profiler=None):
+        self.symbol_table = {}
+        self.functions = {}
+        self.return_value = None
+        # Cache size for pure function results, None to disable memoization
+        self.memo = Memoizer(memoize) if memoize else None
+        self.output = output if output is not None else OutputSink()
+        self.profiler = profiler  # a Profiler to instrument compiled code with
+        self.loops = []  # CountingLoops found while compiling
+
+    def counting_loops(self):
+        """The loops that were compiled as counting loops"""
+        return self.loops
+
+    def compile(self, statements):
+        return ClosureCompiler(self).compile(statements)
+
+    def run(self, statements, flush=True):
+        try:
+            self.compile(statements)(self.symbol_table)
+        except RecursionError:
+            raise recursion_error() from None
+        finally:
+            if flush:
+                self.output.flush()
@@ -0,0 +1,50 @@
+# Execution engines for ChIkEn
+from src.interpreter import Interpreter
+from src.closures import ClosureInterpreter
+from src.vm import VirtualMachine
+from src.pygen import PythonEngine
+from src.builtins import load_plugins
+
+# Maps engine names (as used by chiken.run() and the CLI) to their classes;
+# modules in the chiken.builtins entry point group may add their own
+ENGINES = {
+    "tree": Interpreter,
+    "closure": ClosureInterpreter,
+    "vm": VirtualMachine,
+    "python": PythonEngine,
+}
+
+DEFAULT_ENGINE = "tree"
+
+
+# Engine options and the engines that accept them
+ENGINE_OPTIONS = {
+    "memoize": ("tree", "closure"),  # LRU size for pure function results
+    "max_depth": ("vm",),  # maximum number of nested calls
+    "profiler": ("closure",),  # Profiler collecting call times and line hits
+    "quicken": ("tree",),  # specialize operator and call sites on observed types
+    "tier": ("tree",),  # calls and loop iterations before code is compiled to Python
+}
+
+# Options every engine accepts, including engines added by plugins
+COMMON_OPTIONS = (
+    "output",  # OutputSink that `say` writes to
+)
+
+
+def engine_options(name, options):
+    """Return the options that are set, raising for ones the engine lacks"""
+    load_plugins()
+    if name not in ENGINES:
+        raise Exception(f"Unknown engine: {name}")
+    options = {key: value for key, value in options.items() if value is not None}
+    for key in options:
+        if key not in COMMON_OPTIONS and name not in ENGINE_OPTIONS.get(key, ()):
+            raise Exception(f"The {name} engine does not support {key}")
+    return options
+
+
+def create_engine(name=DEFAULT_ENGINE, **options):
+    """Create an engine; options left as None use the engine's defaults"""
+    options = engine_options(name, options)
+    return ENGINES[name](**options)
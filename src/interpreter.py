@@ -1,11 +1,44 @@
-from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode
-import math
+import itertools
+
+from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+from src.nodes import PLUS, MINUS, MUL, DIV, MOD, AND, OR, GT, LT, GTE, LTE, EQ, NEQ, NOT
+from src.resolver import UNSET, resolve, new_frame, lookup, recursion_error
+from src.builtins import BUILTINS, Builtin, lookup_builtin
+from src.memo import Memoizer, memo_key
+from src.output import OutputSink
+from src.arrays import Array, index
+from src.ropes import concat
+from src.loops import counting_loop
+from src.quicken import Quickener
+from src.tiers import Tiers
+
+_MISSING = object()
+
+# Function table versions, unique across interpreters, so code compiled for
+# one interpreter's functions is never mistaken for another's
+_versions = itertools.count()
 
 class Interpreter:
-    def __init__(self):
+    def __init__(self, memoize=None, output=None, quicken=False, tier=None):
         self.symbol_table = {}
         self.functions = {}
+        self.version = next(_versions)  # changes whenever self.functions does
         self.return_value = None
+        self.frame = None  # slot list of the running function, None at top level
+        # Cache size for pure function results, None to disable memoization
+        self.memo = Memoizer(memoize) if memoize else None
+        self.output = output if output is not None else OutputSink()
+        self.call_sites = {}  # FunctionCallNode -> what it resolved to, see call_function
+        self.loops = {}  # id(RepeatNode) -> (node, CountingLoop or None for a general loop)
+        # With quicken, nodes run through specializing handlers (src/quicken.py)
+        # With tier=THRESHOLD, hot functions and loops are compiled to Python (src/tiers.py)
+        if tier and memoize:
+            raise Exception("Tiered execution cannot be combined with memoize")
+        self.tiers = Tiers(self, tier) if tier else None
+        self.quickener = None
+        if quicken:
+            self.quickener = Quickener(self, self.visit)
+            self.visit = self.quickener.visit
 
     def visit(self, node):
         if isinstance(node, NumberNode):
@@ -15,74 +48,92 @@ class Interpreter:
             return node.value
 
         elif isinstance(node, VarAccessNode):
-            if node.name in self.symbol_table:
+            if node.slot is not None:
+                value = self.frame[node.slot]
+                if value is not UNSET:
+                    return value
+            if self.frame is not None:
+                return lookup(self.frame, node.name)
+            try:
                 return self.symbol_table[node.name]
-            else:
-                raise Exception(f"Variable '{node.name}' not defined")
+            except KeyError:
+                raise Exception(f"Variable '{node.name}' not defined") from None
 
         elif isinstance(node, VarAssignNode):
             value = self.visit(node.value_node)
-            self.symbol_table[node.name] = value
+            if node.slot is not None:
+                self.frame[node.slot] = value
+            else:
+                self.symbol_table[node.name] = value
             return value
 
         elif isinstance(node, BinOpNode):
             left = self.visit(node.left_node)
             right = self.visit(node.right_node)
-            if node.op_token.type == "PLUS":
+            op = node.op
+            if op == PLUS:
+                if type(left) is str:
+                    return concat(left, right)
                 return left + right
-            elif node.op_token.type == "MINUS":
+            elif op == MINUS:
                 return left - right
-            elif node.op_token.type == "MUL":
+            elif op == MUL:
                 return left * right
-            elif node.op_token.type == "DIV":
-                if right == 0:
+            elif op == DIV:
+                if type(right) is not Array and right == 0:
                     raise Exception("Division by zero")
                 return left / right
-            elif node.op_token.type == "MOD":
-                if right == 0:
+            elif op == MOD:
+                if type(right) is not Array and right == 0:
                     raise Exception("Modulo by zero")
                 return left % right
-            elif node.op_token.type == "AND":
+            elif op == AND:
                 return left and right
-            elif node.op_token.type == "OR":
+            elif op == OR:
                 return left or right
             else:
-                raise Exception(f"Unknown operator {node.op_token.type}")
+                raise Exception(f"Unknown operator {node.op_type}")
 
         elif isinstance(node, UnaryOpNode):
             operand = self.visit(node.operand)
-            if node.op_token.type == "NOT":
+            if node.op == NOT:
                 return not operand
             else:
-                raise Exception(f"Unknown unary operator {node.op_token.type}")
+                raise Exception(f"Unknown unary operator {node.op_type}")
 
         elif isinstance(node, PrintNode):
             value = self.visit(node.value_node)
-            print(value)
+            self.output.say(value)
             return value
 
         elif isinstance(node, FunctionCallNode):
-            return self.call_function(node.name, node.args)
+            return self.call_function(node)
+
+        elif isinstance(node, ArrayNode):
+            return Array.from_values([self.visit(element) for element in node.elements])
+
+        elif isinstance(node, IndexNode):
+            return index(self.visit(node.target), self.visit(node.index))
 
         elif isinstance(node, ComparisonNode):
             left = self.visit(node.left_node)
             right = self.visit(node.right_node)
-            op_type = node.op_token.type
+            op = node.op
             
-            if op_type == "GT":
+            if op == GT:
                 return left > right
-            elif op_type == "LT":
+            elif op == LT:
                 return left < right
-            elif op_type == "GTE":
+            elif op == GTE:
                 return left >= right
-            elif op_type == "LTE":
+            elif op == LTE:
                 return left <= right
-            elif op_type == "EQ":
+            elif op == EQ:
                 return left == right
-            elif op_type == "NEQ":
+            elif op == NEQ:
                 return left != right
             else:
-                raise Exception(f"Unknown comparison operator: {op_type}")
+                raise Exception(f"Unknown comparison operator: {node.op_type}")
 
         elif isinstance(node, IfNode):
             condition = self.visit(node.condition)
@@ -95,12 +146,24 @@ class Interpreter:
                     self.visit(stmt)
 
         elif isinstance(node, RepeatNode):
-            while self.visit(node.condition):
-                for stmt in node.body:
-                    self.visit(stmt)
+            entry = self.loops.get(id(node))
+            if entry is None:
+                # The node is kept alive with its analysis so its id is never reused
+                entry = self.loops[id(node)] = (node, counting_loop(node))
+            loop = entry[1]
+            if self.tiers is not None:
+                self.tiers.repeat(node, loop)
+            elif loop is None or not self.counting_repeat(loop):
+                while self.visit(node.condition):
+                    for stmt in node.body:
+                        self.visit(stmt)
 
         elif isinstance(node, FunctionDefNode):
-            self.functions[node.name] = node
+            self.functions[node.name] = resolve(node)
+            self.version = next(_versions)
+            self.call_sites.clear()
+            if self.memo is not None:
+                self.memo.update(self.functions)
             return None
 
         elif isinstance(node, ReturnNode):
@@ -113,115 +176,129 @@ class Interpreter:
         # 👇 New: handle any "say" statement nodes dynamically
         elif hasattr(node, 'type') and node.type.lower() == 'say':
             value = self.visit(node.value_node)
-            print(value)
+            self.output.say(value)
             return value
 
         else:
             raise Exception(f"Unknown node type: {type(node)}")
 
-    def call_function(self, name, args):
-        # Check if it's a user-defined function
-        if name in self.functions:
-            func_def = self.functions[name]
-            if len(args) != len(func_def.params):
-                raise Exception(f"{name}() expects {len(func_def.params)} arguments, got {len(args)}")
-            
+    def counting_loops(self):
+        """The loops that were recognized as counting loops"""
+        return [loop for node, loop in self.loops.values() if loop is not None]
+
+    def counting_repeat(self, loop):
+        """Run a counting loop over a native range; False if it must run as a general loop"""
+        start = self.visit(loop.counter)
+        stop = self.visit(loop.bound)
+        if type(start) is not int or type(stop) is not int:
+            loop.fallbacks += 1
+            return False
+        loop.runs += 1
+
+        slot = loop.store.slot
+        store = self.frame if slot is not None else self.symbol_table
+        key = slot if slot is not None else loop.store.name
+        values = loop.values(start, stop)
+        body = loop.body
+        visit = self.visit
+        for value in values:
+            store[key] = value
+            for stmt in body:
+                visit(stmt)
+        if values:
+            store[key] = values[-1] + loop.step
+        return True
+
+    def resolve_call(self, name, argc):
+        """The user function or Builtin a call runs, after checking the argument count"""
+        func_def = self.functions.get(name)
+        if func_def is not None:
+            if argc != len(func_def.params):
+                raise Exception(f"{name}() expects {len(func_def.params)} arguments, got {argc}")
+            return func_def
+        # Built-in functions; the argument count is checked first
+        builtin = lookup_builtin(name)
+        builtin.check(argc, name)
+        return builtin
+
+    def call_function(self, node):
+        name, args = node.name, node.args
+        # Inline cache: what the call site resolved to, reused until a func
+        # statement clears it. It lives in the interpreter, not the node, so
+        # interpreters sharing an AST never write to it
+        target = self.call_sites.get(node)
+        if target is None:
+            target = self.call_sites[node] = self.resolve_call(name, len(args))
+        
+        if type(target) is not Builtin:
+            func_def = target
             # Evaluate arguments in current scope
             arg_values = [self.visit(arg) for arg in args]
             
-            # Create new scope for function
-            old_symbol_table = self.symbol_table
-            self.symbol_table = old_symbol_table.copy()  # Copy to preserve outer scope access
-            
-            # Bind parameters
-            for param, value in zip(func_def.params, arg_values):
-                self.symbol_table[param] = value
+            # Pure functions answer repeated calls from their cache
+            cache = self.memo.caches.get(name) if self.memo is not None else None
+            if cache is not None:
+                key = memo_key(arg_values)
+                result = cache.get(key, _MISSING)
+                if result is not _MISSING:
+                    # Like a finished call, a cached one clears the caller's pending return
+                    self.return_value = None
+                    return result
             
-            # Execute function body
-            self.return_value = None
-            for stmt in func_def.body:
-                self.visit(stmt)
-                if self.return_value is not None:
-                    break
+            tiers = self.tiers
+            if tiers is not None:
+                tier = tiers.enter(func_def)
+                if tier.code is not None:
+                    return tiers.run(tier, arg_values)
+                outer, tiers.current = tiers.current, tier
             
-            result = self.return_value
-            self.return_value = None
+            # Create new frame for function; outer variables are read through
+            # the caller's frame, so nothing needs to be copied
+            old_frame = self.frame
+            parent = old_frame if old_frame is not None else self.symbol_table
+            self.frame = new_frame(func_def, arg_values, parent)
             
-            # Restore old scope
-            self.symbol_table = old_symbol_table
+            try:
+                # Execute function body
+                self.return_value = None
+                for stmt in func_def.body:
+                    self.visit(stmt)
+                    if self.return_value is not None:
+                        break
+                
+                result = self.return_value
+                self.return_value = None
+            finally:
+                # Restore old frame
+                self.frame = old_frame
+                if tiers is not None:
+                    tiers.current = outer
             
+            if cache is not None:
+                cache.put(key, result)
             return result
         
-        # Built-in functions
+        # Builtins can be replaced or removed at any time (see register())
+        builtin = target
+        if BUILTINS.get(name) is not builtin:
+            builtin = self.resolve_call(name, len(args))
+            self.call_sites[node] = builtin
         arg_values = [self.visit(arg) for arg in args]
-        
-        # Input function
-        if name == "input":
-            if len(arg_values) > 1:
-                raise Exception(f"input() expects 0 or 1 argument, got {len(arg_values)}")
-            prompt = arg_values[0] if arg_values else ""
-            try:
-                result = input(str(prompt))
-                # Try to parse as number
-                try:
-                    return int(result)
-                except ValueError:
-                    try:
-                        return float(result)
-                    except ValueError:
-                        return result
-            except EOFError:
-                return ""
-        
-        # Math functions
-        if name == "add":
-            if len(arg_values) != 2:
-                raise Exception(f"add() expects 2 arguments, got {len(arg_values)}")
-            return arg_values[0] + arg_values[1]
-        
-        elif name == "subtract" or name == "sub":
-            if len(arg_values) != 2:
-                raise Exception(f"{name}() expects 2 arguments, got {len(arg_values)}")
-            return arg_values[0] - arg_values[1]
-        
-        elif name == "multiply" or name == "mul":
-            if len(arg_values) != 2:
-                raise Exception(f"{name}() expects 2 arguments, got {len(arg_values)}")
-            return arg_values[0] * arg_values[1]
-        
-        elif name == "divide" or name == "div":
-            if len(arg_values) != 2:
-                raise Exception(f"{name}() expects 2 arguments, got {len(arg_values)}")
-            if arg_values[1] == 0:
-                raise Exception("Division by zero")
-            return arg_values[0] / arg_values[1]
-        
-        elif name == "power" or name == "pow":
-            if len(arg_values) != 2:
-                raise Exception(f"{name}() expects 2 arguments, got {len(arg_values)}")
-            return arg_values[0] ** arg_values[1]
-        
-        elif name == "sqrt":
-            if len(arg_values) != 1:
-                raise Exception(f"sqrt() expects 1 argument, got {len(arg_values)}")
-            if arg_values[0] < 0:
-                raise Exception("Cannot take sqrt of negative number")
-            return math.sqrt(arg_values[0])
-        
-        elif name == "abs":
-            if len(arg_values) != 1:
-                raise Exception(f"abs() expects 1 argument, got {len(arg_values)}")
-            return abs(arg_values[0])
-        
-        elif name == "min":
-            if len(arg_values) < 2:
-                raise Exception(f"min() expects at least 2 arguments, got {len(arg_values)}")
-            return min(arg_values)
-        
-        elif name == "max":
-            if len(arg_values) < 2:
-                raise Exception(f"max() expects at least 2 arguments, got {len(arg_values)}")
-            return max(arg_values)
-        
-        else:
-            raise Exception(f"Unknown function: {name}")
\ No newline at end of file
+        if builtin.interactive:
+            self.output.before_input()
+        return builtin.func(*arg_values)
+
+    def run(self, statements, flush=True):
+        """Run statements; with flush=False buffered output is left for the caller to flush"""
+        if self.quickener is not None:
+            self.quickener.locate(statements)
+        try:
+            for stmt in statements:
+                self.visit(stmt)
+        except RecursionError:
+            # Every ChIkEn call nests several Python frames; the vm engine
+            # keeps its own call stack and goes much deeper
+            raise recursion_error() from None
+        finally:
+            if flush:
+                self.output.flush()
@@ -1,7 +1,56 @@
+import codecs
+import re
+import sys
+
+KEYWORDS = {
+    "have": "HAVE",
+    "say": "SAY",
+    "if": "IF",
+    "else": "ELSE",
+    "repeat": "REPEAT",
+    "and": "AND",
+    "or": "OR",
+    "not": "NOT",
+    "func": "FUNC",
+    "return": "RETURN",
+}
+
+OPERATORS = {
+    "+": "PLUS",
+    "-": "MINUS",
+    "*": "MUL",
+    "/": "DIV",
+    "%": "MOD",
+    "(": "LPAREN",
+    ")": "RPAREN",
+    ",": "COMMA",
+    "{": "LBRACE",
+    "}": "RBRACE",
+    "[": "LBRACKET",
+    "]": "RBRACKET",
+    ">": "GT",
+    ">=": "GTE",
+    "<": "LT",
+    "<=": "LTE",
+    "=": "EQUALS",
+    "==": "EQ",
+    "!=": "NEQ",
+}
+
+ESCAPES = {
+    "n": "\n",
+    "t": "\t",
+}
+
+
 class Token:
-    def __init__(self, type_, value=None):
+    __slots__ = ("type", "value", "line", "column")
+
+    def __init__(self, type_, value=None, line=None, column=None):
         self.type = type_
         self.value = value
+        self.line = line  # 1-based source position of the token's start
+        self.column = column
 
     def __repr__(self):
         if self.value is not None:
@@ -9,13 +58,26 @@ class Token:
         return f"Token({self.type})"
 
 
+def invalid_message(char, line, column):
+    return f"Invalid character {char!r} at line {line}, column {column}"
+
+
 class Lexer:
     def __init__(self, text):
         self.text = text
         self.pos = 0
         self.current_char = text[0] if text else None
+        self.line = 1
+        self.line_start = 0  # offset of the first character of the line
+
+    def invalid_character(self, pos):
+        # pos is on the current line
+        raise Exception(invalid_message(self.text[pos], self.line, pos - self.line_start + 1))
 
     def advance(self):
+        if self.current_char == "\n":
+            self.line += 1
+            self.line_start = self.pos + 1
         self.pos += 1
         if self.pos < len(self.text):
             self.current_char = self.text[self.pos]
@@ -72,30 +134,18 @@ class Lexer:
             result += self.current_char
             self.advance()
 
-        if result == "have":
-            return Token("HAVE")
-        if result == "say":
-            return Token("SAY")
-        if result == "if":
-            return Token("IF")
-        if result == "else":
-            return Token("ELSE")
-        if result == "repeat":
-            return Token("REPEAT")
-        if result == "and":
-            return Token("AND")
-        if result == "or":
-            return Token("OR")
-        if result == "not":
-            return Token("NOT")
-        if result == "func":
-            return Token("FUNC")
-        if result == "return":
-            return Token("RETURN")
-
-        return Token("IDENTIFIER", result)
+        if result in KEYWORDS:
+            return Token(KEYWORDS[result])
+
+        return Token("IDENTIFIER", sys.intern(result))
 
     def get_next_token(self):
+        token = self.next_token()
+        token.line = self.token_line
+        token.column = self.token_column
+        return token
+
+    def next_token(self):
         while self.current_char:
             if self.current_char.isspace():
                 self.skip_whitespace()
@@ -103,6 +153,8 @@ class Lexer:
             if self.current_char == "#":
                 self.skip_comment()
                 continue
+            self.token_line = self.line
+            self.token_column = self.pos - self.line_start + 1
             if self.current_char == '"':
                 return self.string('"')
             if self.current_char == "'":
@@ -141,6 +193,12 @@ class Lexer:
             if self.current_char == "}":
                 self.advance()
                 return Token("RBRACE")
+            if self.current_char == "[":
+                self.advance()
+                return Token("LBRACKET")
+            if self.current_char == "]":
+                self.advance()
+                return Token("RBRACKET")
             if self.current_char == ">":
                 self.advance()
                 if self.current_char == "=":
@@ -164,7 +222,175 @@ class Lexer:
                 if self.current_char == "=":
                     self.advance()
                     return Token("NEQ")
-                raise Exception(f"Invalid character: !")
-            raise Exception(f"Invalid character: {self.current_char}")
+                self.invalid_character(self.pos - 1)
+            self.invalid_character(self.pos)
 
+        self.token_line = self.line
+        self.token_column = self.pos - self.line_start + 1
         return Token("EOF")
+
+    def tokens(self):
+        """Yield every token up to and including EOF"""
+        while True:
+            token = self.get_next_token()
+            yield token
+            if token.type == "EOF":
+                return
+
+
+# Leading whitespace and comments, then one alternative per token class.
+# ERROR catches anything else, so matches always cover the whole input.
+TOKEN_REGEX = re.compile(r"""
+    (?:\s+|\#[^\n]*)*
+    (?:
+    (?P<NUMBER>\d+)
+  | (?P<NAME>[^\W\d]\w*)
+  | (?P<STRING>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<OP>[<>=!]=|[-+*/%(),{}\[\]<>=])
+  | (?P<ERROR>.)
+  | (?P<END>$)
+    )
+""", re.VERBOSE | re.DOTALL)
+
+ESCAPE_REGEX = re.compile(r"\\(.)", re.DOTALL)
+
+
+def _unescape(match):
+    char = match.group(1)
+    return ESCAPES.get(char, char)
+
+
+class RegexLexer(Lexer):
+    """Lexer driven by a single compiled regex instead of per-character steps"""
+
+    def __init__(self, text):
+        self.text = text
+        self.stream = None
+        self.line = 1
+        self.line_start = 0  # offset in the scanned text where the line starts
+        self.mark = 0  # offset up to which newlines have been counted
+
+    def get_next_token(self):
+        if self.stream is None:
+            self.stream = self.tokens()
+        return next(self.stream, None) or Token("EOF", None, self.line)
+
+    def tokens(self):
+        yield from self.scan(self.text)
+        yield Token("EOF", None, self.line, self.rest - self.line_start + 1)
+
+    def scan(self, text, final=True):
+        """Yield the tokens of text, without the closing EOF
+
+        Unless final, scanning stops before the first token that might
+        continue past the end of text, and self.rest is set to its offset.
+        """
+        end = len(text)
+        line = self.line
+        line_start = self.line_start
+        mark = self.mark
+        count = text.count
+        for match in TOKEN_REGEX.finditer(text):
+            kind = match.lastgroup
+            start = match.start(kind)
+
+            if not final and (match.end() == end or kind == "ERROR"):
+                start = match.start()
+                break
+
+            # Lines are counted between token starts, which is cheap
+            newlines = count("\n", mark, start)
+            if newlines:
+                line += newlines
+                line_start = text.rfind("\n", mark, start) + 1
+            mark = start
+            column = start - line_start + 1
+            value = match.group(kind)
+
+            if kind == "NAME":
+                if not (value[0].isalpha() or value[0] == "_"):
+                    # \w also matches numeric characters such as '½' or '²'
+                    self.invalid(text, start, line, column)
+                if value in KEYWORDS:
+                    yield Token(KEYWORDS[value], None, line, column)
+                else:
+                    # Interned, so every node naming a variable or function
+                    # shares one string and dict lookups match on identity
+                    yield Token("IDENTIFIER", sys.intern(value), line, column)
+            elif kind == "NUMBER":
+                if match.end() < end and text[match.end()].isdigit():
+                    self.invalid(text, start, line, column)
+                yield Token("NUMBER", int(value), line, column)
+            elif kind == "OP":
+                yield Token(OPERATORS[value], None, line, column)
+            elif kind == "STRING":
+                value = value[1:-1]
+                if "\\" in value:
+                    value = ESCAPE_REGEX.sub(_unescape, value)
+                yield Token("STRING", value, line, column)
+            elif kind == "END":
+                break
+            else:
+                self.invalid(text, start, line, column)
+        else:
+            start = end
+
+        # Count the lines up to where scanning stopped
+        newlines = text.count("\n", mark, start)
+        if newlines:
+            line += newlines
+            line_start = text.rfind("\n", mark, start) + 1
+        self.line = line
+        self.line_start = line_start
+        self.mark = start
+        self.rest = start
+
+    def invalid(self, text, pos, line, column):
+        # Rare inputs are handed to the character-level lexer so that they
+        # fail with exactly the same error, at the same line and column
+        lexer = Lexer(text[pos:])
+        lexer.line = line
+        lexer.line_start = 1 - column
+        while lexer.get_next_token().type != "EOF":
+            pass
+        raise Exception(invalid_message(text[pos], line, column))
+
+
+class StreamLexer(RegexLexer):
+    """Lexer reading a file object or mmap chunk by chunk
+
+    Only the current chunk (plus any token still running across its end) is
+    held in memory, so sources of any size can be lexed with bounded memory.
+    Binary sources such as an mmap are decoded incrementally.
+    """
+
+    def __init__(self, source, chunk_size=1 << 16, encoding="utf-8"):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.stream = None
+        self.eof = False
+        self.line = 1
+        self.line_start = 0
+        self.mark = 0
+
+    def read(self, size):
+        data = self.source.read(size)
+        self.eof = not data
+        if isinstance(data, str):
+            return data
+        return self.decoder.decode(data, final=self.eof)
+
+    def tokens(self):
+        buffer = ""
+        while not self.eof:
+            # Read at least as much as is pending so that a long token
+            # spanning many chunks is not rescanned over and over
+            buffer += self.read(max(self.chunk_size, len(buffer)))
+            yield from self.scan(buffer, self.eof)
+            buffer = buffer[self.rest:]
+            # Keep line positions relative to the new buffer
+            self.line_start -= self.rest
+            self.mark = 0
+            self.rest = 0
+        yield Token("EOF", None, self.line, self.mark - self.line_start + 1)
@@ -0,0 +1,94 @@
+# Counting-loop recognition for `repeat`
+#
+# The usual counting idiom
+#
+#   have i = 0
+#   repeat (i < n) {
+#       ...
+#       have i = i + 1
+#   }
+#
+# re-evaluates the comparison and the increment on every iteration. When the
+# body ends with `have i = i + STEP` (or `- STEP`) for a literal integer STEP,
+# assigns i nowhere else, and the bound only depends on literals and on
+# variables the body never assigns, the iterations are exactly
+# range(i, n, STEP): the bound cannot change while the loop runs, because
+# ChIkEn functions never assign their caller's variables. Engines then run
+# the body once per value of a native range, storing i before each pass and
+# its final value afterwards. Counters or bounds that turn out not to be
+# integers when the loop starts fall back to the general loop.
+
+from src.nodes import NumberNode, VarAccessNode, VarAssignNode, BinOpNode, ComparisonNode, PLUS, MINUS, MUL, LT, LTE, GT, GTE
+from src.resolver import assigned_names
+
+
+class CountingLoop:
+    __slots__ = ("counter", "store", "bound", "step", "inclusive", "body", "line", "runs", "fallbacks")
+
+    def __init__(self, counter, store, bound, step, inclusive, body, line):
+        self.counter = counter  # VarAccessNode reading the counter
+        self.store = store  # the increment's VarAssignNode, where the counter lives
+        self.bound = bound  # loop-invariant bound expression
+        self.step = step  # nonzero int
+        self.inclusive = inclusive  # <= or >= rather than < or >
+        self.body = body  # the body without its increment
+        self.line = line
+        self.runs = 0  # times the loop was entered on the fast path
+        self.fallbacks = 0  # times it had to run as a general loop
+
+    def values(self, start, stop):
+        """The counter values of one run, for int start and stop"""
+        if self.inclusive:
+            stop += 1 if self.step > 0 else -1
+        return range(start, stop, self.step)
+
+    def describe(self):
+        sign = "+" if self.step > 0 else "-"
+        where = f"line {self.line}" if self.line is not None else "loop"
+        return f"{where}: {self.counter.name} {sign}= {abs(self.step)} ({self.runs} specialized runs, {self.fallbacks} fallbacks)"
+
+
+def invariant(node, assigned):
+    """Whether an expression's value cannot change while the body runs"""
+    if isinstance(node, NumberNode):
+        return True
+    if isinstance(node, VarAccessNode):
+        return node.name not in assigned
+    if isinstance(node, BinOpNode) and node.op in (PLUS, MINUS, MUL):
+        return invariant(node.left_node, assigned) and invariant(node.right_node, assigned)
+    return False
+
+
+def counting_loop(node):
+    """Return a CountingLoop for a RepeatNode, or None for a general loop"""
+    condition = node.condition
+    if not isinstance(condition, ComparisonNode) or condition.op not in (LT, LTE, GT, GTE):
+        return None
+    counter = condition.left_node
+    if not isinstance(counter, VarAccessNode) or not node.body:
+        return None
+
+    # The body must end with the increment
+    store = node.body[-1]
+    if not isinstance(store, VarAssignNode) or store.name != counter.name:
+        return None
+    value = store.value_node
+    if not (isinstance(value, BinOpNode) and value.op in (PLUS, MINUS)):
+        return None
+    if not (isinstance(value.left_node, VarAccessNode) and value.left_node.name == counter.name):
+        return None
+    if not (isinstance(value.right_node, NumberNode) and type(value.right_node.value) is int):
+        return None
+    step = value.right_node.value if value.op == PLUS else -value.right_node.value
+
+    # Counting up needs < or <=, counting down > or >=
+    if step == 0 or (step > 0) != (condition.op in (LT, LTE)):
+        return None
+
+    body = node.body[:-1]
+    assigned = assigned_names(body)
+    if counter.name in assigned or not invariant(condition.right_node, assigned | {counter.name}):
+        return None
+
+    inclusive = condition.op in (LTE, GTE)
+    return CountingLoop(counter, store, condition.right_node, step, inclusive, body, node.line)
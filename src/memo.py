@@ -0,0 +1,118 @@
+# Automatic memoization of pure ChIkEn functions
+#
+# A function is pure when its result depends on nothing but its arguments:
+# it never says anything, never calls input(), defines no functions, reads
+# no variable it has not bound itself, and only calls pure builtins or other
+# pure functions. Calls to pure functions are cached by argument tuple in a
+# bounded LRU per function, which turns e.g. the naive recursive fib from
+# exponential into linear time.
+
+from src.nodes import BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, FunctionDefNode, ArrayNode, IndexNode
+from src.arrays import Array
+from src.builtins import is_pure_builtin
+from src.resolver import blocks, expressions, fallback_reads
+from src.lru import LRUCache
+
+DEFAULT_MEMO_SIZE = 1024
+
+
+def _calls(node, names):
+    """Collect the names of every function called by an expression"""
+    if isinstance(node, FunctionCallNode):
+        names.add(node.name)
+        for arg in node.args:
+            _calls(arg, names)
+    elif isinstance(node, (BinOpNode, ComparisonNode)):
+        _calls(node.left_node, names)
+        _calls(node.right_node, names)
+    elif isinstance(node, UnaryOpNode):
+        _calls(node.operand, names)
+    elif isinstance(node, ArrayNode):
+        for element in node.elements:
+            _calls(element, names)
+    elif isinstance(node, IndexNode):
+        _calls(node.target, names)
+        _calls(node.index, names)
+    return names
+
+
+def _body_effects(statements, calls):
+    """Collect calls made by a body; False if it prints or defines functions"""
+    for stmt in statements:
+        if isinstance(stmt, (PrintNode, FunctionDefNode)):
+            return False
+        for expr in expressions(stmt):
+            _calls(expr, calls)
+        for block in blocks(stmt):
+            if not _body_effects(block, calls):
+                return False
+    return True
+
+
+def pure_functions(functions):
+    """Return the names in functions (name -> FunctionDefNode) that are pure"""
+    calls = {}
+    for name, func_def in functions.items():
+        called = set()
+        if not _body_effects(func_def.body, called):
+            continue
+        if fallback_reads(func_def.body, set(func_def.params), set()):
+            continue  # reads a variable from its caller
+        calls[name] = called
+
+    # Start from every candidate and drop those calling anything impure
+    # until nothing changes; mutually recursive pure functions survive
+    pure = set(calls)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            for callee in calls[name]:
+                if callee in functions:
+                    ok = callee in pure
+                else:
+                    ok = is_pure_builtin(callee)
+                if not ok:
+                    pure.discard(name)
+                    changed = True
+                    break
+    return pure
+
+
+def memo_key(arg_values):
+    # Types are part of the key so that f(1), f(1.0) and f(True) stay apart;
+    # arrays are unhashable and stand in as their raw bytes
+    return tuple((type(value), value if type(value) is not Array else value.key()) for value in arg_values)
+
+
+class Memoizer:
+    """Per-function LRU caches for the pure functions of an interpreter"""
+
+    def __init__(self, maxsize=DEFAULT_MEMO_SIZE):
+        self.maxsize = maxsize
+        self.caches = {}  # name -> LRUCache, pure functions only
+        self.counters = {}  # name -> LRUCache, kept across redefinitions
+
+    def update(self, functions):
+        """Recompute purity after the function table (name -> FunctionDefNode) changed"""
+        # A redefinition can change what any other function computes
+        for cache in self.caches.values():
+            cache.clear()
+        self.caches = {}
+        for name in pure_functions(functions):
+            if name not in self.counters:
+                self.counters[name] = LRUCache(self.maxsize)
+            self.caches[name] = self.counters[name]
+
+    def stats(self):
+        """Return {name: (hits, misses)} for every function memoized so far"""
+        return {
+            name: (cache.hits, cache.misses)
+            for name, cache in sorted(self.counters.items())
+        }
+
+    def report(self):
+        return ", ".join(
+            f"{name}: {hits} hits, {misses} misses"
+            for name, (hits, misses) in self.stats().items()
+        ) or "no pure functions"
@@ -1,79 +1,157 @@
 # AST Nodes for ChIkEn
-# AST Nodes for ChIkEn
+#
+# Nodes use __slots__ to keep large programs small, and operators are stored
+# as small integer codes rather than the Token they were parsed from.
+# Statement nodes carry the line and column where they start, set by the
+# parser (None for nodes built by hand).
+
+# Operator codes, indexed by OP_NAMES
+OP_NAMES = ("PLUS", "MINUS", "MUL", "DIV", "MOD", "AND", "OR", "GT", "LT", "GTE", "LTE", "EQ", "NEQ", "NOT")
+PLUS, MINUS, MUL, DIV, MOD, AND, OR, GT, LT, GTE, LTE, EQ, NEQ, NOT = range(len(OP_NAMES))
+OP_CODES = {name: code for code, name in enumerate(OP_NAMES)}
 
 
 class NumberNode:
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
 
 class StringNode:
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
 
 class VarAccessNode:
+    __slots__ = ("name", "slot")
+
     def __init__(self, name):
         self.name = name
+        self.slot = None  # frame slot, set by the resolver
 
 
 class VarAssignNode:
+    __slots__ = ("name", "value_node", "slot", "line", "column")
+
     def __init__(self, name, value_node):
         self.name = name
         self.value_node = value_node
+        self.slot = None  # frame slot, set by the resolver
+        self.line = None
+        self.column = None
 
 
 class BinOpNode:
-    def __init__(self, left_node, op_token, right_node):
+    __slots__ = ("left_node", "op", "right_node")
+
+    def __init__(self, left_node, op, right_node):
         self.left_node = left_node
-        self.op_token = op_token
+        self.op = op  # operator code, see OP_NAMES
         self.right_node = right_node
 
+    @property
+    def op_type(self):
+        return OP_NAMES[self.op]
+
 
 class UnaryOpNode:
-    def __init__(self, op_token, operand):
-        self.op_token = op_token
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op, operand):
+        self.op = op
         self.operand = operand
 
+    @property
+    def op_type(self):
+        return OP_NAMES[self.op]
+
 
 class PrintNode:
+    __slots__ = ("value_node", "line", "column")
+
     def __init__(self, value_node):
         self.value_node = value_node
+        self.line = None
+        self.column = None
 
 
 class FunctionCallNode:
+    __slots__ = ("name", "args")
+
     def __init__(self, name, args):
         self.name = name
         self.args = args  # list of argument nodes
 
 
+class ArrayNode:
+    __slots__ = ("elements",)
+
+    def __init__(self, elements):
+        self.elements = elements  # list of element nodes
+
+
+class IndexNode:
+    __slots__ = ("target", "index")
+
+    def __init__(self, target, index):
+        self.target = target  # the array expression
+        self.index = index
+
+
 class ComparisonNode:
-    def __init__(self, left_node, op_token, right_node):
+    __slots__ = ("left_node", "op", "right_node")
+
+    def __init__(self, left_node, op, right_node):
         self.left_node = left_node
-        self.op_token = op_token
+        self.op = op
         self.right_node = right_node
 
+    @property
+    def op_type(self):
+        return OP_NAMES[self.op]
+
 
 class IfNode:
+    __slots__ = ("condition", "then_block", "else_block", "line", "column")
+
     def __init__(self, condition, then_block, else_block=None):
         self.condition = condition
         self.then_block = then_block  # list of statements
         self.else_block = else_block  # list of statements or None
+        self.line = None
+        self.column = None
 
 
 class RepeatNode:
+    __slots__ = ("condition", "body", "line", "column")
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body  # list of statements
+        self.line = None
+        self.column = None
 
 
 class FunctionDefNode:
+    __slots__ = ("name", "params", "body", "slots", "slot_index", "line", "column")
+
     def __init__(self, name, params, body):
         self.name = name
         self.params = params  # list of parameter names
         self.body = body  # list of statements
+        self.slots = None  # frame slot names, set by the resolver
+        self.slot_index = None
+        self.line = None
+        self.column = None
 
 
 class ReturnNode:
+    __slots__ = ("value_node", "line", "column")
+
     def __init__(self, value_node):
         self.value_node = value_node
+        self.line = None
+        self.column = None
@@ -0,0 +1,224 @@
+# AST optimizer for ChIkEn
+#
+# An optional pass between Parser.parse() and execution. It folds constant
+# expressions, drops if/else arms and repeat loops that can never run, and
+# removes no-op arithmetic such as `x * 1`. Anything that would fail at
+# runtime (`1 / 0`, `"a" - 1`, ...) is left alone so that it still fails at
+# runtime, with the same error.
+#
+# The pass rewrites a deep copy of the statements it is given, so an AST
+# shared with the disk cache, a Program or the REPL is never changed.
+
+import copy
+
+from src.nodes import NumberNode, StringNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+from src.resolver import blocks
+
+# Folded strings longer than this stay as expressions to keep the AST small
+MAX_FOLDED_STRING = 4096
+
+CONSTANT_OPS = {
+    "PLUS": lambda l, r: l + r,
+    "MINUS": lambda l, r: l - r,
+    "MUL": lambda l, r: l * r,
+    "DIV": lambda l, r: l / r,
+    "MOD": lambda l, r: l % r,
+    "AND": lambda l, r: l and r,
+    "OR": lambda l, r: l or r,
+    "GT": lambda l, r: l > r,
+    "LT": lambda l, r: l < r,
+    "GTE": lambda l, r: l >= r,
+    "LTE": lambda l, r: l <= r,
+    "EQ": lambda l, r: l == r,
+    "NEQ": lambda l, r: l != r,
+}
+
+
+def is_constant(node):
+    return isinstance(node, (NumberNode, StringNode))
+
+
+def constant(value):
+    if isinstance(value, str):
+        return StringNode(value)
+    return NumberNode(value)
+
+
+def has_return(statements):
+    """Whether a return is nested anywhere in statements, outside function bodies"""
+    return any(isinstance(stmt, ReturnNode) or any(has_return(block) for block in blocks(stmt)) for stmt in statements)
+
+
+def folded_length(op_type, left, right):
+    """Length of the string a constant + or * would build, or None if it is no string"""
+    if op_type == "PLUS" and type(left) is str and type(right) is str:
+        return len(left) + len(right)
+    if op_type == "MUL":
+        if type(left) is str and type(right) in (int, bool):
+            return len(left) * max(right, 0)
+        if type(right) is str and type(left) in (int, bool):
+            return len(right) * max(left, 0)
+    return None
+
+
+def is_int(node):
+    """Whether an expression can only ever produce an int"""
+    if isinstance(node, NumberNode):
+        return type(node.value) is int
+    if isinstance(node, BinOpNode) and node.op_type in ("PLUS", "MINUS", "MUL", "MOD"):
+        return is_int(node.left_node) and is_int(node.right_node)
+    return False
+
+
+def is_number(node):
+    """Whether an expression can only ever produce an int or a float"""
+    if isinstance(node, NumberNode):
+        return type(node.value) in (int, float)
+    if isinstance(node, BinOpNode):
+        op_type = node.op_type
+        # Subtraction and division fail unless they produce a number (or an
+        # array of numbers, which x * 1 and x - 0 leave unchanged just the same)
+        if op_type in ("MINUS", "DIV"):
+            return True
+        if op_type in ("PLUS", "MUL", "MOD"):
+            return is_number(node.left_node) and is_number(node.right_node)
+    return False
+
+
+class Optimizer:
+    def __init__(self):
+        self.stats = {
+            "folded": 0,
+            "branches_removed": 0,
+            "loops_removed": 0,
+            "simplified": 0,
+        }
+
+    def optimize(self, statements):
+        """Return an optimized copy of the statement list"""
+        return self.block(copy.deepcopy(statements))
+
+    def report(self):
+        stats = self.stats
+        return (
+            f"folded {stats['folded']} constant expressions, "
+            f"removed {stats['branches_removed']} dead branches and "
+            f"{stats['loops_removed']} dead loops, "
+            f"simplified {stats['simplified']} expressions"
+        )
+
+    def block(self, statements):
+        result = []
+        for stmt in statements:
+            result.extend(self.statement(stmt))
+        return result
+
+    def statement(self, node):
+        """Return the list of statements that replace node"""
+        if isinstance(node, VarAssignNode):
+            node.value_node = self.expr(node.value_node)
+
+        elif isinstance(node, PrintNode):
+            node.value_node = self.expr(node.value_node)
+
+        elif isinstance(node, ReturnNode):
+            if node.value_node is not None:
+                node.value_node = self.expr(node.value_node)
+
+        elif isinstance(node, FunctionDefNode):
+            node.body = self.block(node.body)
+
+        elif isinstance(node, IfNode):
+            node.condition = self.expr(node.condition)
+            node.then_block = self.block(node.then_block)
+            if node.else_block is not None:
+                node.else_block = self.block(node.else_block)
+
+            if is_constant(node.condition):
+                self.stats["branches_removed"] += 1
+                kept = node.then_block if node.condition.value else node.else_block or []
+                if not has_return(kept):
+                    return kept
+                # Spliced into a function body, a return would be checked
+                # after its own statement rather than after the whole `if`
+                node.condition = constant(True)
+                node.then_block = kept
+                node.else_block = None
+
+        elif isinstance(node, RepeatNode):
+            node.condition = self.expr(node.condition)
+            node.body = self.block(node.body)
+
+            if is_constant(node.condition) and not node.condition.value:
+                self.stats["loops_removed"] += 1
+                return []
+
+        else:
+            node = self.expr(node)
+
+        return [node]
+
+    def expr(self, node):
+        if isinstance(node, (BinOpNode, ComparisonNode)):
+            node.left_node = self.expr(node.left_node)
+            node.right_node = self.expr(node.right_node)
+            left, right = node.left_node, node.right_node
+            op_type = node.op_type
+
+            if is_constant(left) and is_constant(right) and op_type in CONSTANT_OPS:
+                if op_type in ("DIV", "MOD") and right.value == 0:
+                    return node
+                # Checked before building the string, which could be huge
+                length = folded_length(op_type, left.value, right.value)
+                if length is not None and length > MAX_FOLDED_STRING:
+                    return node
+                try:
+                    value = CONSTANT_OPS[op_type](left.value, right.value)
+                except Exception:
+                    return node
+                self.stats["folded"] += 1
+                return constant(value)
+
+            return self.simplify(node)
+
+        elif isinstance(node, UnaryOpNode):
+            node.operand = self.expr(node.operand)
+            if node.op_type == "NOT" and is_constant(node.operand):
+                self.stats["folded"] += 1
+                return constant(not node.operand.value)
+
+        elif isinstance(node, FunctionCallNode):
+            node.args = [self.expr(arg) for arg in node.args]
+
+        elif isinstance(node, ArrayNode):
+            node.elements = [self.expr(element) for element in node.elements]
+
+        elif isinstance(node, IndexNode):
+            node.target = self.expr(node.target)
+            node.index = self.expr(node.index)
+
+        return node
+
+    def simplify(self, node):
+        left, right = node.left_node, node.right_node
+        op_type = node.op_type
+
+        def literal(side, value):
+            return isinstance(side, NumberNode) and type(side.value) is int and side.value == value
+
+        # x * 1 and x - 0 keep any int or float; x + 0 would turn -0.0 into 0.0
+        if op_type == "MUL" and literal(right, 1) and is_number(left):
+            result = left
+        elif op_type == "MUL" and literal(left, 1) and is_number(right):
+            result = right
+        elif op_type == "MINUS" and literal(right, 0) and is_number(left):
+            result = left
+        elif op_type == "PLUS" and literal(right, 0) and is_int(left):
+            result = left
+        elif op_type == "PLUS" and literal(left, 0) and is_int(right):
+            result = right
+        else:
+            return node
+
+        self.stats["simplified"] += 1
+        return result
@@ -0,0 +1,65 @@
+# Buffered output for `say`
+#
+# Calling print() for every `say` makes output-heavy scripts spend most of
+# their time in per-call write and flush overhead. Engines instead hand every
+# value to an OutputSink, which collects lines and writes them in large
+# batches. Whatever is still buffered is written when the program ends, before
+# input() reads from the terminal, and optionally every N lines or N ms.
+
+import sys
+import time
+
+# Lines collected before a write, whatever the flush policy
+DEFAULT_BUFFER_LINES = 8192
+
+
+class OutputSink:
+    """Collects said values and writes them to a text stream in batches
+
+    stream is any object with write() (a file, pipe or io.StringIO); None
+    means whatever sys.stdout is at the time of the write, so redirecting
+    sys.stdout keeps working. flush_lines and flush_interval (seconds) add
+    flushes every N lines or, at the next `say`, once that much time has
+    passed since the last one. An interactive stdout is flushed every line.
+    """
+
+    def __init__(self, stream=None, flush_lines=None, flush_interval=None, flush_on_input=True, buffer_lines=DEFAULT_BUFFER_LINES):
+        if flush_lines is None and stream is None and _isatty(sys.stdout):
+            flush_lines = 1
+        self.stream = stream
+        self.limit = min(flush_lines or buffer_lines, buffer_lines)
+        self.flush_interval = flush_interval
+        self.flush_on_input = flush_on_input
+        self.lines = []
+        self.last_flush = time.monotonic()
+
+    def say(self, value):
+        lines = self.lines
+        # Strings are by far the most common value and need no conversion
+        lines.append(value if type(value) is str else str(value))
+        if len(lines) >= self.limit:
+            self.flush()
+        elif self.flush_interval is not None and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        stream = self.stream if self.stream is not None else sys.stdout
+        if self.lines:
+            lines = self.lines
+            self.lines = []
+            lines.append("")
+            stream.write("\n".join(lines))
+        stream.flush()
+        self.last_flush = time.monotonic()
+
+    def before_input(self):
+        # Make sure everything said so far is visible before a prompt
+        if self.flush_on_input:
+            self.flush()
+
+
+def _isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
@@ -12,40 +12,48 @@ from src.nodes import (
     RepeatNode,
     FunctionDefNode,
     ReturnNode,
+    ArrayNode,
+    IndexNode,
+    OP_CODES,
 )
 
 class Parser:
     def __init__(self, lexer):
         self.lexer = lexer
-        self.current_token = self.lexer.get_next_token()
+        self.tokens = lexer.tokens()  # consumed as a stream
+        self.current_token = next(self.tokens)
 
     def advance(self):
-        self.current_token = self.lexer.get_next_token()
+        # The stream ends with EOF; keep returning it once exhausted
+        self.current_token = next(self.tokens, self.current_token)
 
     def parse(self):
-        statements = []
+        return list(self.statements())
 
+    def statements(self):
+        """Yield top-level statements one at a time as they are parsed"""
         while self.current_token.type != "EOF":
-            stmt = self.statement()
-            statements.append(stmt)
-
-        return statements
+            yield self.statement()
 
     def statement(self):
-        if self.current_token.type == "HAVE":
-            return self.var_assign()
-        elif self.current_token.type == "SAY":
-            return self.print_stmt()
-        elif self.current_token.type == "IF":
-            return self.if_stmt()
-        elif self.current_token.type == "REPEAT":
-            return self.repeat_stmt()
-        elif self.current_token.type == "FUNC":
-            return self.func_def()
-        elif self.current_token.type == "RETURN":
-            return self.return_stmt()
+        token = self.current_token
+        if token.type == "HAVE":
+            node = self.var_assign()
+        elif token.type == "SAY":
+            node = self.print_stmt()
+        elif token.type == "IF":
+            node = self.if_stmt()
+        elif token.type == "REPEAT":
+            node = self.repeat_stmt()
+        elif token.type == "FUNC":
+            node = self.func_def()
+        elif token.type == "RETURN":
+            node = self.return_stmt()
         else:
             raise Exception(f"Unexpected token: {self.current_token}")
+        node.line = token.line
+        node.column = token.column
+        return node
 
     def var_assign(self):
         self.advance()  # skip HAVE
@@ -153,7 +161,7 @@ class Parser:
             op = self.current_token
             self.advance()
             right = self.and_expr()
-            left = BinOpNode(left, op, right)
+            left = BinOpNode(left, OP_CODES[op.type], right)
 
         return left
 
@@ -164,7 +172,7 @@ class Parser:
             op = self.current_token
             self.advance()
             right = self.not_expr()
-            left = BinOpNode(left, op, right)
+            left = BinOpNode(left, OP_CODES[op.type], right)
 
         return left
 
@@ -173,7 +181,7 @@ class Parser:
             op = self.current_token
             self.advance()
             operand = self.not_expr()
-            return UnaryOpNode(op, operand)
+            return UnaryOpNode(OP_CODES[op.type], operand)
 
         return self.comparison()
 
@@ -184,7 +192,7 @@ class Parser:
             op = self.current_token
             self.advance()
             right = self.arithmetic()
-            left = ComparisonNode(left, op, right)
+            left = ComparisonNode(left, OP_CODES[op.type], right)
 
         return left
 
@@ -195,7 +203,7 @@ class Parser:
             op = self.current_token
             self.advance()
             right = self.multiply()
-            left = BinOpNode(left, op, right)
+            left = BinOpNode(left, OP_CODES[op.type], right)
 
         return left
 
@@ -206,11 +214,25 @@ class Parser:
             op = self.current_token
             self.advance()
             right = self.term()
-            left = BinOpNode(left, op, right)
+            left = BinOpNode(left, OP_CODES[op.type], right)
 
         return left
 
     def term(self):
+        node = self.atom()
+
+        # Indexing binds tighter than any operator: a[i], f(x)[0], [1, 2][1]
+        while self.current_token.type == "LBRACKET":
+            self.advance()  # skip LBRACKET
+            index = self.expr()
+            if self.current_token.type != "RBRACKET":
+                raise Exception("Expected ']' to close index")
+            self.advance()  # skip RBRACKET
+            node = IndexNode(node, index)
+
+        return node
+
+    def atom(self):
         tok = self.current_token
 
         if tok.type == "NUMBER":
@@ -237,8 +259,27 @@ class Parser:
             self.advance()  # skip RPAREN
             return expr
 
+        if tok.type == "LBRACKET":
+            return self.array_literal()
+
         raise Exception(f"Unexpected token in expression: {tok}")
 
+    def array_literal(self):
+        self.advance()  # skip LBRACKET
+        elements = []
+
+        if self.current_token.type != "RBRACKET":
+            elements.append(self.expr())
+            while self.current_token.type == "COMMA":
+                self.advance()  # skip COMMA
+                elements.append(self.expr())
+
+        if self.current_token.type != "RBRACKET":
+            raise Exception(f"Expected ']' to close array, got {self.current_token}")
+        self.advance()  # skip RBRACKET
+
+        return ArrayNode(elements)
+
     def function_call(self, func_name):
         # current_token is LPAREN
         self.advance()  # skip LPAREN
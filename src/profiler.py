@@ -0,0 +1,169 @@
+# Profiler for ChIkEn programs
+#
+# Works with the closure engine: when a Profiler is attached, the compiler
+# wraps every statement closure in a line-hit counter and every function body
+# in a timer. Without one nothing is wrapped, so profiling costs nothing when
+# it is off.
+
+import json
+import marshal
+import time
+from collections import defaultdict
+
+PROGRAM = "<program>"
+
+SORT_KEYS = {
+    "cumulative": lambda stats: -stats.cum_time,
+    "self": lambda stats: -stats.self_time,
+    "calls": lambda stats: -stats.calls,
+    "name": lambda stats: (stats.name, stats.line),
+}
+
+
+class FunctionStats:
+    __slots__ = ("name", "line", "calls", "primitive_calls", "self_time", "cum_time", "active", "callers")
+
+    def __init__(self, name, line):
+        self.name = name
+        self.line = line
+        self.calls = 0
+        self.primitive_calls = 0  # calls not made from inside itself
+        self.self_time = 0.0  # spent in its own statements
+        self.cum_time = 0.0  # including callees, recursion counted once
+        self.active = 0  # calls currently running
+        self.callers = {}  # (name, line) -> [calls, self time, cumulative time]
+
+    @property
+    def key(self):
+        return (self.name, self.line)
+
+
+class Profiler:
+    def __init__(self, filename="<chiken>", source=None, clock=time.perf_counter):
+        self.filename = filename
+        self.source_lines = source.splitlines() if source is not None else None
+        self.clock = clock
+        self.functions = {}  # (name, line) -> FunctionStats
+        self.hits = defaultdict(int)  # line -> statements executed
+        self.stack = []  # [FunctionStats, time spent in callees] per running call
+
+    # Instrumentation, applied by ClosureCompiler
+
+    def count_line(self, stmt, line):
+        hits = self.hits
+
+        def counted(env):
+            hits[line] += 1
+            return stmt(env)
+
+        return counted
+
+    def time_function(self, body, name, line):
+        key = (name, line or 0)
+        stats = self.functions.get(key)
+        if stats is None:
+            stats = self.functions[key] = FunctionStats(name, line or 0)
+        stack = self.stack
+        clock = self.clock
+
+        def timed(env):
+            entry = [stats, 0.0]
+            if not stats.active:
+                stats.primitive_calls += 1
+            stats.active += 1
+            stack.append(entry)
+            start = clock()
+            try:
+                return body(env)
+            finally:
+                elapsed = clock() - start
+                stack.pop()
+                stats.active -= 1
+                stats.calls += 1
+                own = elapsed - entry[1]
+                stats.self_time += own
+                if not stats.active:
+                    stats.cum_time += elapsed
+                if stack:
+                    caller = stack[-1]
+                    caller[1] += elapsed
+                    edge = stats.callers.get(caller[0].key)
+                    if edge is None:
+                        edge = stats.callers[caller[0].key] = [0, 0.0, 0.0]
+                    edge[0] += 1
+                    edge[1] += own
+                    edge[2] += elapsed
+
+        return timed
+
+    # Reports
+
+    def sorted_functions(self, sort="cumulative"):
+        return sorted(self.functions.values(), key=SORT_KEYS[sort])
+
+    def report(self, sort="cumulative", limit=None):
+        """Return a human-readable report sorted by the given SORT_KEYS key"""
+        functions = self.sorted_functions(sort)[:limit]
+        lines = [
+            f"{'calls':>9} {'self (s)':>10} {'cum (s)':>10}  function",
+        ]
+        for stats in functions:
+            calls = str(stats.calls)
+            if stats.primitive_calls != stats.calls:
+                calls = f"{stats.calls}/{stats.primitive_calls}"
+            where = f" (line {stats.line})" if stats.name != PROGRAM else ""
+            lines.append(f"{calls:>9} {stats.self_time:>10.6f} {stats.cum_time:>10.6f}  {stats.name}{where}")
+
+        lines.append("")
+        lines.append(f"{'line':>6} {'hits':>10}  source")
+        for line, hits in sorted(self.hits.items()):
+            text = ""
+            if self.source_lines is not None and 0 < line <= len(self.source_lines):
+                text = self.source_lines[line - 1].strip()
+            lines.append(f"{line:>6} {hits:>10}  {text}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self, sort="cumulative"):
+        return {
+            "file": self.filename,
+            "functions": [
+                {
+                    "name": stats.name,
+                    "line": stats.line,
+                    "calls": stats.calls,
+                    "primitive_calls": stats.primitive_calls,
+                    "self_time": stats.self_time,
+                    "cumulative_time": stats.cum_time,
+                    "callers": [
+                        {"name": name, "line": line, "calls": calls, "self_time": own, "cumulative_time": cum}
+                        for (name, line), (calls, own, cum) in sorted(stats.callers.items())
+                    ],
+                }
+                for stats in self.sorted_functions(sort)
+            ],
+            "lines": [{"line": line, "hits": hits} for line, hits in sorted(self.hits.items())],
+        }
+
+    def to_json(self, sort="cumulative"):
+        return json.dumps(self.to_dict(sort), indent=2)
+
+    def pstats_data(self):
+        """Return the stats in the layout pstats.Stats loads"""
+        def label(key):
+            return (self.filename, key[1], key[0])
+
+        data = {}
+        for stats in self.functions.values():
+            if not stats.calls:
+                continue
+            callers = {
+                label(key): (calls, calls, own, cum)
+                for key, (calls, own, cum) in stats.callers.items()
+            }
+            data[label(stats.key)] = (stats.primitive_calls, stats.calls, stats.self_time, stats.cum_time, callers)
+        return data
+
+    def dump_pstats(self, path):
+        """Write a file for `python -m pstats`, snakeviz and similar tools"""
+        with open(path, "wb") as f:
+            marshal.dump(self.pstats_data(), f)
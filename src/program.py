@@ -0,0 +1,132 @@
+# Compiled programs for embedding ChIkEn
+#
+# chiken.run() lexes and parses its source on every call. A Program does
+# that once: it keeps the parsed (and optionally optimized) statements, with
+# every function already resolved, plus the engine's compiled form where the
+# engine has one that does not depend on engine state (vm bytecode, python
+# code objects). Each Program.run() then creates a fresh engine, so runs share
+# nothing mutable and one Program can be run from many threads at once.
+#
+# An Engine holds the engine name and options together with an LRU of the
+# Programs it compiled, keyed by source, so services that evaluate the same
+# few scripts over and over only parse each of them once.
+
+import io
+import threading
+
+from src.lexer import RegexLexer
+from src.parser import Parser
+from src.optimizer import Optimizer
+from src.resolver import find_functions, resolve
+from src.engines import DEFAULT_ENGINE, create_engine, engine_options
+from src.lru import LRUCache
+from src.output import OutputSink
+from src.ropes import plain
+
+# Programs kept by each Engine
+DEFAULT_PROGRAM_CACHE = 256
+
+# Engines whose compile() output can be run by any instance via run_code()
+PRECOMPILED_ENGINES = ("vm", "python")
+
+
+class Result:
+    __slots__ = ("output", "variables", "engine")
+
+    def __init__(self, output, variables, engine):
+        self.output = output  # captured output, or None when written to a stream
+        self.variables = variables  # top-level variables when the program ended
+        self.engine = engine  # the engine instance, e.g. for engine.memo.stats()
+
+    def __repr__(self):
+        return f"Result(output={self.output!r}, variables={self.variables!r})"
+
+
+class Program:
+    """A parsed ChIkEn program that can be run any number of times"""
+
+    def __init__(self, source, engine=DEFAULT_ENGINE, optimize=False, **options):
+        self.source = source
+        self.engine = engine
+        self.options = engine_options(engine, options)
+        statements = Parser(RegexLexer(source)).parse()
+        if optimize:
+            statements = Optimizer().optimize(statements)
+        # Engines resolve functions as they are defined; doing it up front
+        # means concurrent runs never write to the shared AST
+        for func_def in find_functions(statements):
+            resolve(func_def)
+        self.statements = statements
+        self.code = None
+        if engine in PRECOMPILED_ENGINES:
+            self.code = create_engine(engine).compile(statements)
+
+    def run(self, globals=None, output=None):
+        """Run the program and return a Result
+
+        globals seeds the top-level variables ({name: value}); the caller's
+        dict is never modified. Output is captured into Result.output unless
+        a text stream or OutputSink is passed as output.
+        """
+        stream = io.StringIO() if output is None else output
+        sink = stream if isinstance(stream, OutputSink) else OutputSink(stream)
+        interpreter = create_engine(self.engine, output=sink, **self.options)
+        if globals:
+            interpreter.symbol_table.update(globals)
+        if self.code is not None:
+            interpreter.run_code(self.code)
+        else:
+            interpreter.run(self.statements)
+        captured = stream.getvalue() if output is None else None
+        return Result(captured, plain(interpreter.symbol_table), interpreter)
+
+
+class Engine:
+    """An engine configuration with a cache of the programs it compiled
+
+        engine = Engine("closure", memoize=1024)
+        result = engine.run(source, globals={"x": 3})
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, engine=DEFAULT_ENGINE, optimize=False, cache_size=DEFAULT_PROGRAM_CACHE, **options):
+        self.engine = engine
+        self.optimize = optimize
+        self.options = engine_options(engine, options)
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.Lock()
+
+    def compile(self, source):
+        """Return the Program for source, parsing it only on a cache miss"""
+        with self.lock:
+            program = self.cache.get(source)
+        if program is None:
+            # Compiled outside the lock; two threads racing on the same new
+            # source both parse it and the later one wins the cache slot
+            program = Program(source, self.engine, self.optimize, **self.options)
+            with self.lock:
+                self.cache.put(source, program)
+        return program
+
+    def run(self, source, globals=None, output=None):
+        return self.compile(source).run(globals, output)
+
+    def stats(self):
+        """Return (hits, misses, size) of the program cache"""
+        with self.lock:
+            return self.cache.hits, self.cache.misses, len(self.cache)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def shared_engine(engine=DEFAULT_ENGINE, optimize=False, **options):
+    """Return the process-wide Engine for a configuration, used by chiken.compile()"""
+    key = (engine, optimize, tuple(sorted(options.items())))
+    with _engines_lock:
+        shared = _engines.get(key)
+        if shared is None:
+            shared = _engines[key] = Engine(engine, optimize, **options)
+        return shared
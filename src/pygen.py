@@ -0,0 +1,428 @@
+# Python backend for ChIkEn
+#
+# Translates the parsed program into equivalent Python source, which is then
+# compiled with compile() and run natively. Every ChIkEn `func` becomes a real
+# Python function and every `repeat` a `while` loop.
+#
+# ChIkEn functions see a *copy* of their caller's variables. The generated
+# code keeps that rule without copying whole scopes: each function keeps its
+# own variables as Python locals, and only the names that some function reads
+# without defining ("dynamic" names) are handed down to callees in a small
+# `_scope` dict, chained to the caller's scope rather than copied from it.
+#
+# Returns follow the tree-walker: a `return` ends the function only after
+# the top-level statement of the body it ran in, and only with a value other
+# than None. A return that ends its top-level statement anyway becomes
+# `if (_r := value) is not None: return _r`. When some function has returns
+# that more of the statement can follow (inside a `repeat`, or before the
+# end of an `if` branch), its returns store their value in the shared `_ret`
+# cell, which is checked after each top-level statement; every function then
+# clears `_ret` when it is called, like Interpreter.call_function does.
+
+from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+from src.builtins import BUILTINS, lookup_builtin
+from src.resolver import UNSET, assigned_names, blocks, fallback_reads, find_functions, recursion_error
+from src.output import OutputSink
+from src.arrays import Array, index
+from src.ropes import concat
+
+PYTHON_OPS = {
+    "PLUS": "+",
+    "MINUS": "-",
+    "MUL": "*",
+    "GT": ">",
+    "LT": "<",
+    "GTE": ">=",
+    "LTE": "<=",
+    "EQ": "==",
+    "NEQ": "!=",
+}
+
+# Operators that keep their ChIkEn semantics through a runtime helper
+HELPER_OPS = {
+    "DIV": "_div",
+    "MOD": "_mod",
+    "AND": "_and",
+    "OR": "_or",
+}
+
+
+def _var(name):
+    # Prefixed so ChIkEn names never clash with Python keywords or helpers
+    return "v_" + name
+
+
+class PythonGenerator:
+    def __init__(self, functions=None, dynamic=()):
+        self.lines = []
+        self.indent = 0
+        self.pynames = {}  # id(FunctionDefNode) -> Python function name
+        self.arities = {}  # function name -> set of parameter counts
+        self.dynamic = set(dynamic)
+        # Functions defined by earlier programs on the same engine
+        for name, func in (functions or {}).items():
+            self.arities[name] = {func.__code__.co_argcount - 1}
+        self.clear_returns = False  # every function clears _ret when called
+        self.pending_returns = False  # the current function's returns go through _ret
+
+    def generate(self, statements):
+        """Return Python source defining _main(_scope) for the program"""
+        self.declare(find_functions(statements))
+        self.function("_main", ["_scope"], (), statements, False)
+        # Read by PythonEngine, for the programs it runs later
+        self.emit(f"_dynamic = {tuple(sorted(self.dynamic))!r}")
+        return "\n".join(self.lines) + "\n"
+
+    def declare(self, functions):
+        """Emit a Python function for every FunctionDefNode, named by self.pynames"""
+        for i, func in enumerate(functions):
+            self.pynames[id(func)] = f"_f{i}_{func.name}"
+            self.arities.setdefault(func.name, set()).add(len(func.params))
+            fallback_reads(func.body, set(func.params), self.dynamic)
+            if _early_returns(func.body):
+                self.clear_returns = True
+
+        for func in functions:
+            self.function(self.pynames[id(func)], ["_scope"] + [_var(p) for p in func.params], func.params, func.body, True)
+
+    def emit(self, line):
+        self.lines.append("    " * self.indent + line)
+
+    def function(self, pyname, signature, params, body, in_function):
+        assigned = assigned_names(body, params)
+        self.locals = assigned
+        self.in_function = in_function
+        self.pending_returns = in_function and _early_returns(body)
+
+        self.emit(f"def {pyname}({', '.join(signature)}):")
+        self.indent += 1
+        if in_function and self.clear_returns:
+            self.emit("_ret[0] = None")
+        for name in sorted(assigned - set(params)):
+            self.emit(f"{_var(name)} = _UNSET")
+        if self.pending_returns:
+            self.body(body, set(params))
+        else:
+            self.block(body, set(params))
+        if in_function:
+            self.emit("return None")
+        else:
+            pairs = "".join(f"({name!r}, {_var(name)}), " for name in sorted(assigned))
+            self.emit(f"return _globals(_scope, ({pairs}))")
+        self.indent -= 1
+        self.emit("")
+
+    def body(self, statements, definite):
+        # A function body whose returns are kept in _ret until the end of
+        # their top-level statement
+        for stmt in statements:
+            self.statement(stmt, definite)
+            if _has_return(stmt):
+                self.emit("if (_r := _ret[0]) is not None:")
+                self.indent += 1
+                self.emit("_ret[0] = None")
+                self.emit("return _r")
+                self.indent -= 1
+
+    def block(self, statements, definite):
+        # `definite` holds the locals that are certainly bound at this point
+        if not statements:
+            self.emit("pass")
+        for stmt in statements:
+            self.statement(stmt, definite)
+
+    def statement(self, node, definite):
+        if isinstance(node, VarAssignNode):
+            self.emit(f"{_var(node.name)} = {self.expr(node.value_node, definite)}")
+            definite.add(node.name)
+
+        elif isinstance(node, PrintNode):
+            self.emit(f"_say({self.expr(node.value_node, definite)})")
+
+        elif isinstance(node, IfNode):
+            self.emit(f"if {self.expr(node.condition, definite)}:")
+            self.indent += 1
+            self.block(node.then_block, set(definite))
+            self.indent -= 1
+            if node.else_block:
+                self.emit("else:")
+                self.indent += 1
+                self.block(node.else_block, set(definite))
+                self.indent -= 1
+
+        elif isinstance(node, RepeatNode):
+            self.emit(f"while {self.expr(node.condition, definite)}:")
+            self.indent += 1
+            self.block(node.body, set(definite))
+            self.indent -= 1
+
+        elif isinstance(node, FunctionDefNode):
+            self.emit(f"_fns[{node.name!r}] = {self.pynames[id(node)]}")
+
+        elif isinstance(node, ReturnNode):
+            value = "None" if node.value_node is None else self.expr(node.value_node, definite)
+            if not self.in_function:
+                # A stray top-level return does not stop the program
+                self.emit(value)
+            elif self.pending_returns:
+                self.emit(f"_ret[0] = {value}")
+            elif node.value_node is None:
+                # The function carries on when it returns None
+                self.emit("pass")
+            else:
+                self.emit(f"if (_r := {value}) is not None:")
+                self.indent += 1
+                self.emit("return _r")
+                self.indent -= 1
+
+        else:
+            self.emit(self.expr(node, definite))
+
+    def expr(self, node, definite):
+        if isinstance(node, (NumberNode, StringNode)):
+            return repr(node.value)
+
+        elif isinstance(node, VarAccessNode):
+            name = node.name
+            if name in definite:
+                return _var(name)
+            if name in self.locals:
+                return f"({_var(name)} if {_var(name)} is not _UNSET else _free(_scope, {name!r}))"
+            return f"_free(_scope, {name!r})"
+
+        elif isinstance(node, (BinOpNode, ComparisonNode)):
+            op_type = node.op_type
+            left = self.expr(node.left_node, definite)
+            right = self.expr(node.right_node, definite)
+            if op_type == "PLUS" and (isinstance(node.left_node, StringNode) or isinstance(node.right_node, StringNode)):
+                # Long strings become Ropes (src/ropes.py); other additions
+                # stay native, and a Rope on the left appends by itself
+                return f"_add({left}, {right})"
+            if op_type in PYTHON_OPS:
+                return f"({left} {PYTHON_OPS[op_type]} {right})"
+            if op_type in HELPER_OPS:
+                return f"{HELPER_OPS[op_type]}({left}, {right})"
+            raise Exception(f"Unknown operator {op_type}")
+
+        elif isinstance(node, UnaryOpNode):
+            if node.op_type != "NOT":
+                raise Exception(f"Unknown unary operator {node.op_type}")
+            return f"(not {self.expr(node.operand, definite)})"
+
+        elif isinstance(node, FunctionCallNode):
+            return self.function_call(node, definite)
+
+        elif isinstance(node, ArrayNode):
+            elements = [self.expr(element, definite) for element in node.elements]
+            return f"_array([{', '.join(elements)}])"
+
+        elif isinstance(node, IndexNode):
+            return f"_index({self.expr(node.target, definite)}, {self.expr(node.index, definite)})"
+
+        raise Exception(f"Unknown node type: {type(node)}")
+
+    def function_call(self, node, definite):
+        args = [self.expr(arg, definite) for arg in node.args]
+
+        # The call is resolved and its argument count checked before the
+        # arguments run, as in the tree-walker
+        if node.name not in self.arities:
+            return f"_builtin({node.name!r}, {len(args)})({', '.join(args)})"
+
+        # Hand down the dynamic names this scope defines
+        shared = sorted(self.locals & self.dynamic)
+        if shared:
+            pairs = "".join(f"({name!r}, {_var(name)}), " for name in shared)
+            scope = f"_child(_scope, ({pairs}))"
+        else:
+            scope = "_scope"
+
+        if self.arities[node.name] == {len(args)} and node.name not in BUILTINS:
+            # Only a function of that arity can be found; an undefined one
+            # fails in FunctionTable.__missing__
+            return f"_fns[{node.name!r}]({', '.join([scope] + args)})"
+        return f"_resolve({node.name!r}, {len(args)})({', '.join([scope] + args)})"
+
+
+def _early_returns(statements, top=True, tail=False):
+    """Whether a return in a function body can be followed by more of its
+    top-level statement: one inside a repeat or before the end of a block"""
+    last = len(statements) - 1
+    for i, stmt in enumerate(statements):
+        if isinstance(stmt, ReturnNode) and not top and not (tail and i == last):
+            return True
+        inner_tail = (top or (tail and i == last)) and isinstance(stmt, IfNode)
+        for block in blocks(stmt):
+            if _early_returns(block, False, inner_tail):
+                return True
+    return False
+
+
+def _has_return(node):
+    if isinstance(node, ReturnNode):
+        return True
+    return any(_has_return(stmt) for block in blocks(node) for stmt in block)
+
+
+# Runtime support for generated code
+
+class FunctionTable(dict):
+    """User functions by name, falling back to builtins for unknown names"""
+
+    def __init__(self, output=None):
+        super().__init__()
+        self.output = output
+
+    def __missing__(self, name):
+        return _builtin_function(lookup_builtin(name), name, self.output)
+
+
+def _builtin_function(builtin, name, output):
+    # A builtin called like a generated function, with the scope first
+    def call(scope, *args):
+        builtin.check(len(args), name)
+        if builtin.interactive:
+            output.before_input()
+        return builtin.func(*args)
+
+    return call
+
+
+class Scope(dict):
+    """The dynamic names a call hands down, on top of its caller's scope"""
+
+    __slots__ = ("parent",)
+
+
+def _free(scope, name):
+    while True:
+        value = scope.get(name, UNSET)
+        if value is not UNSET:
+            return value
+        if type(scope) is not Scope:
+            raise Exception(f"Variable '{name}' not defined")
+        scope = scope.parent
+
+
+def _child(scope, pairs):
+    child = None
+    for name, value in pairs:
+        if value is not UNSET:
+            if child is None:
+                child = Scope()
+                child.parent = scope
+            child[name] = value
+    return scope if child is None else child
+
+
+def _globals(scope, pairs):
+    # The top-level variables once the program has run
+    scope = dict(scope)
+    for name, value in pairs:
+        if value is not UNSET:
+            scope[name] = value
+    return scope
+
+
+def _add(left, right):
+    if type(left) is str:
+        return concat(left, right)
+    return left + right
+
+
+def _div(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Division by zero")
+    return left / right
+
+
+def _mod(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Modulo by zero")
+    return left % right
+
+
+def _and(left, right):
+    return left and right
+
+
+def _or(left, right):
+    return left or right
+
+
+def runtime_namespace(functions, output):
+    def _builtin(name, argc):
+        builtin = lookup_builtin(name)
+        builtin.check(argc, name)
+        if builtin.interactive:
+            def interactive(*args):
+                output.before_input()
+                return builtin.func(*args)
+
+            return interactive
+        return builtin.func
+
+    def _resolve(name, argc):
+        func = functions.get(name)
+        if func is None:
+            builtin = lookup_builtin(name)
+            builtin.check(argc, name)
+            return _builtin_function(builtin, name, output)
+        arity = func.__code__.co_argcount - 1
+        if argc != arity:
+            raise Exception(f"{name}() expects {arity} arguments, got {argc}")
+        return func
+
+    return {
+        "_UNSET": UNSET,
+        "_ret": [None],  # the pending return value, see PythonGenerator.body
+        "_fns": functions,
+        "_free": _free,
+        "_child": _child,
+        "_globals": _globals,
+        "_resolve": _resolve,
+        "_builtin": _builtin,
+        "_say": output.say,
+        "_array": Array.from_values,
+        "_index": index,
+        "_add": _add,
+        "_div": _div,
+        "_mod": _mod,
+        "_and": _and,
+        "_or": _or,
+    }
+
+
+def to_python(statements, functions=None, dynamic=()):
+    """Python source for statements; functions and dynamic come from
+    programs run earlier on the same engine"""
+    return PythonGenerator(functions, dynamic).generate(statements)
+
+
+class PythonEngine:
+    """Runs programs as Python source generated by PythonGenerator"""
+
+    def __init__(self, output=None):
+        self.symbol_table = {}
+        self.output = output if output is not None else OutputSink()
+        self.functions = FunctionTable(self.output)
+        self.dynamic = set()  # names the functions defined so far read from callers
+
+    def compile(self, statements):
+        return compile(to_python(statements, self.functions, self.dynamic), "<chiken>", "exec")
+
+    def run(self, statements, flush=True):
+        self.run_code(self.compile(statements), flush)
+
+    def run_code(self, code, flush=True):
+        """Run a code object from compile(), which may be reused across engines"""
+        namespace = runtime_namespace(self.functions, self.output)
+        exec(code, namespace)
+        self.dynamic.update(namespace["_dynamic"])
+        try:
+            self.symbol_table = namespace["_main"](self.symbol_table)
+        except RecursionError:
+            raise recursion_error() from None
+        finally:
+            if flush:
+                self.output.flush()
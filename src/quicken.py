@@ -0,0 +1,439 @@
+# Quickening for the tree engine
+#
+# The tree-walker finds out what a node is by testing it against every node
+# class in turn, and what an operator does by comparing its code against
+# every operator, each time the node runs. With quickening
+# (Interpreter(quicken=True), `--quicken`) every node is given a handler the
+# first time it runs, and later runs find it with one dict lookup.
+#
+# Operator and call sites start with an observing handler that runs the
+# generic code and records what it saw: the operand types, or the function
+# that was called. Once a site has seen the same thing SPECIALIZE_AFTER times
+# in a row it rewrites itself into a handler specialized for it: int or
+# float arithmetic and comparisons, str concatenation and comparison, a call
+# straight into a known user function or builtin. Specialized handlers check
+# a guard (the operand types, or that the name still refers to the same
+# function) and deoptimize back to the observing handler when it fails; a
+# site that has deoptimized MAX_DEOPTS times stays generic.
+#
+# Handlers belong to the interpreter and are keyed by node; the AST is never
+# changed, so quickened runs can share their statements with other engines
+# and with concurrent runs of the same Program.
+
+import operator
+
+from src.nodes import NumberNode, StringNode, VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, FunctionCallNode, ComparisonNode, IfNode, FunctionDefNode, ReturnNode, PrintNode, ArrayNode, IndexNode
+from src.nodes import PLUS, MINUS, MUL, DIV, MOD, AND, OR, GT, LT, GTE, LTE, EQ, NEQ, OP_CODES
+from src.lexer import OPERATORS, KEYWORDS
+from src.resolver import UNSET, new_frame, lookup, blocks, expressions
+from src.builtins import BUILTINS
+from src.arrays import Array
+from src.ropes import Rope, concat
+
+# Runs with the same operand types (or callee) before a site specializes
+SPECIALIZE_AFTER = 8
+
+# Deoptimizations after which a site stays on the generic path
+MAX_DEOPTS = 4
+
+# Busiest sites listed by Quickener.report()
+REPORTED_SITES = 20
+
+# Operator code -> source symbol, for reports
+SYMBOLS = {OP_CODES[name]: symbol for symbol, name in {**OPERATORS, **KEYWORDS}.items() if name in OP_CODES}
+
+
+def _div(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Division by zero")
+    return left / right
+
+
+def _mod(left, right):
+    if type(right) is not Array and right == 0:
+        raise Exception("Modulo by zero")
+    return left % right
+
+
+def _add(left, right):
+    if type(left) is str:
+        return concat(left, right)
+    return left + right
+
+
+# The tree-walker's operators on evaluated operands
+GENERIC_OPS = {
+    PLUS: _add,
+    MINUS: operator.sub,
+    MUL: operator.mul,
+    DIV: _div,
+    MOD: _mod,
+    # Both operands are always evaluated, just like in the tree-walker
+    AND: lambda left, right: left and right,
+    OR: lambda left, right: left or right,
+    GT: operator.gt,
+    LT: operator.lt,
+    GTE: operator.ge,
+    LTE: operator.le,
+    EQ: operator.eq,
+    NEQ: operator.ne,
+}
+
+COMPARISONS = (GT, LT, GTE, LTE, EQ, NEQ)
+NUMBERS = (int, float)
+
+# (op, left type, right type) -> operation used for exactly those types
+SPECIALIZED = {}
+for _op in (PLUS, MINUS, MUL, DIV, MOD) + COMPARISONS:
+    for _left in NUMBERS:
+        for _right in NUMBERS:
+            SPECIALIZED[_op, _left, _right] = GENERIC_OPS[_op]
+SPECIALIZED[PLUS, str, str] = concat
+SPECIALIZED[PLUS, Rope, str] = operator.add
+for _op in COMPARISONS:
+    SPECIALIZED[_op, str, str] = GENERIC_OPS[_op]
+
+
+class Site:
+    """Type feedback and counters for one operator or call site"""
+
+    __slots__ = ("node", "kind", "line", "seen", "streak", "state", "generic", "fast", "specializations", "deopts")
+
+    def __init__(self, node, kind, line):
+        self.node = node
+        self.kind = kind  # "operator" or "call"
+        self.line = line
+        self.seen = None  # operand types or callee of the current streak
+        self.streak = 0
+        self.state = "generic"  # what the site is specialized for
+        self.generic = 0  # runs on the observing (generic) handler
+        self.fast = 0  # runs on a specialized handler
+        self.specializations = 0
+        self.deopts = 0
+
+    @property
+    def runs(self):
+        return self.generic + self.fast
+
+    def observe(self, seen):
+        """Record one generic run; True once the site should specialize"""
+        self.generic += 1
+        if seen == self.seen:
+            self.streak += 1
+        else:
+            self.seen = seen
+            self.streak = 1
+        # Exactly at the threshold: runs still in flight on the observing
+        # handler (recursive calls) must not specialize the site again
+        return self.streak == SPECIALIZE_AFTER and self.deopts < MAX_DEOPTS
+
+    def describe(self):
+        where = f"line {self.line}" if self.line is not None else "?"
+        rate = 100 * self.fast / self.runs if self.runs else 0
+        return (f"{where}: {render(self.node)} [{self.state}] {self.runs} runs, {rate:.1f}% specialized, "
+                f"{self.specializations} specializations, {self.deopts} deopts")
+
+
+class Quickener:
+    """The handler table and sites of one quickening Interpreter"""
+
+    def __init__(self, interpreter, generic):
+        self.interpreter = interpreter
+        self.generic = generic  # the tree-walker's own visit
+        self.handlers = {}  # node -> handler(node)
+        self.sites = []
+        self.lines = {}  # site node -> line of its statement, for reports
+
+        handlers = self.handlers
+        install = self.install
+
+        def visit(node):
+            handler = handlers.get(node)
+            if handler is None:
+                handler = install(node)
+            return handler(node)
+
+        self.visit = visit
+        self.variable = self.variable_handler()
+        self.statements = self.statement_handlers()
+
+    def locate(self, statements):
+        """Remember the line of the statement around every site below statements"""
+        for stmt in statements:
+            line = getattr(stmt, "line", None)
+            for expr in expressions(stmt):
+                _site_nodes(expr, line, self.lines)
+            for block in blocks(stmt):
+                self.locate(block)
+            if isinstance(stmt, FunctionDefNode):
+                self.locate(stmt.body)
+
+    def install(self, node):
+        cls = node.__class__
+        if cls is BinOpNode or cls is ComparisonNode:
+            handler = self.operator_site(node)
+        elif cls is FunctionCallNode:
+            handler = self.call_site(node)
+        elif cls is NumberNode or cls is StringNode:
+            handler = _constant
+        elif cls is VarAccessNode:
+            handler = self.variable
+        elif cls in self.statements:
+            handler = self.statements[cls]
+        else:
+            handler = self.generic
+        self.handlers[node] = handler
+        return handler
+
+    def site(self, node, kind):
+        site = Site(node, kind, self.lines.get(node))
+        self.sites.append(site)
+        return site
+
+    def variable_handler(self):
+        interpreter = self.interpreter
+        symbol_table = interpreter.symbol_table
+
+        def variable(node):
+            frame = interpreter.frame
+            if node.slot is not None:
+                value = frame[node.slot]
+                if value is not UNSET:
+                    return value
+            if frame is not None:
+                return lookup(frame, node.name)
+            try:
+                return symbol_table[node.name]
+            except KeyError:
+                raise Exception(f"Variable '{node.name}' not defined") from None
+
+        return variable
+
+    def statement_handlers(self):
+        # The tree-walker's code for the statements that run most often,
+        # without its chain of isinstance tests
+        interpreter = self.interpreter
+        symbol_table = interpreter.symbol_table
+        visit = self.visit
+        get = self.handlers.get
+
+        def assign(node):
+            value = (get(node.value_node) or visit)(node.value_node)
+            if node.slot is not None:
+                interpreter.frame[node.slot] = value
+            else:
+                symbol_table[node.name] = value
+            return value
+
+        def branch(node):
+            if (get(node.condition) or visit)(node.condition):
+                for stmt in node.then_block:
+                    (get(stmt) or visit)(stmt)
+            elif node.else_block:
+                for stmt in node.else_block:
+                    (get(stmt) or visit)(stmt)
+
+        def return_(node):
+            interpreter.return_value = (get(node.value_node) or visit)(node.value_node) if node.value_node else None
+            return interpreter.return_value
+
+        def say(node):
+            value = (get(node.value_node) or visit)(node.value_node)
+            interpreter.output.say(value)
+            return value
+
+        return {VarAssignNode: assign, IfNode: branch, ReturnNode: return_, PrintNode: say}
+
+    def operator_site(self, node):
+        site = self.site(node, "operator")
+        visit = self.visit
+        get = self.handlers.get
+        handlers = self.handlers
+        left_node, right_node = node.left_node, node.right_node
+        generic_op = GENERIC_OPS[node.op]
+        op = node.op
+
+        def observe(node):
+            left = visit(left_node)
+            right = visit(right_node)
+            types = (type(left), type(right))
+            if site.observe(types):
+                operation = SPECIALIZED.get((op,) + types)
+                if operation is not None:
+                    handlers[node] = specialize(types[0], types[1], operation)
+            return generic_op(left, right)
+
+        def specialize(left_type, right_type, operation):
+            site.specializations += 1
+            site.state = f"{left_type.__name__}, {right_type.__name__}"
+
+            def fast(node):
+                left = (get(left_node) or visit)(left_node)
+                right = (get(right_node) or visit)(right_node)
+                if type(left) is left_type and type(right) is right_type:
+                    site.fast += 1
+                    return operation(left, right)
+                deoptimize(site, node, handlers, observe)
+                site.observe((type(left), type(right)))
+                return generic_op(left, right)
+
+            return fast
+
+        return observe
+
+    def call_site(self, node):
+        site = self.site(node, "call")
+        interpreter = self.interpreter
+        visit = self.visit
+        get = self.handlers.get
+        handlers = self.handlers
+        functions = interpreter.functions
+        symbol_table = interpreter.symbol_table
+        name, args = node.name, node.args
+
+        def observe(node):
+            target = functions.get(name)
+            if target is None:
+                target = BUILTINS.get(name)
+            if site.observe(target) and target is not None:
+                handler = specialize(target)
+                if handler is not None:
+                    handlers[node] = handler
+            return interpreter.call_function(node)
+
+        def specialize(target):
+            # The argument count never changes, so it is checked only here;
+            # calls with the wrong count fail on the generic path
+            if isinstance(target, FunctionDefNode):
+                if len(args) != len(target.params):
+                    return None
+                site.state = f"function {name}"
+                handler = user_call(target)
+            elif target.min_args <= len(args) <= target.max_args:
+                site.state = f"builtin {name}"
+                handler = builtin_call(target)
+            else:
+                return None
+            site.specializations += 1
+            return handler
+
+        def user_call(target):
+            # Memoized and tiered calls need the interpreter's own call path
+            generic = interpreter.memo is not None or interpreter.tiers is not None
+            body = target.body
+
+            def fast(node):
+                if functions.get(name) is not target:
+                    deoptimize(site, node, handlers, observe)
+                    return observe(node)
+                site.fast += 1
+                if generic:
+                    return interpreter.call_function(node)
+                # The frame handling of Interpreter.call_function, without
+                # its checks (done when the site specialized)
+                arg_values = [(get(arg) or visit)(arg) for arg in args]
+                old_frame = interpreter.frame
+                interpreter.frame = new_frame(target, arg_values, old_frame if old_frame is not None else symbol_table)
+                try:
+                    interpreter.return_value = None
+                    for stmt in body:
+                        (get(stmt) or visit)(stmt)
+                        if interpreter.return_value is not None:
+                            break
+                    result = interpreter.return_value
+                    interpreter.return_value = None
+                finally:
+                    interpreter.frame = old_frame
+                return result
+
+            return fast
+
+        def builtin_call(builtin):
+            func = builtin.func
+            interactive = builtin.interactive
+
+            def fast(node):
+                if name in functions or BUILTINS.get(name) is not builtin:
+                    deoptimize(site, node, handlers, observe)
+                    return observe(node)
+                site.fast += 1
+                arg_values = [(get(arg) or visit)(arg) for arg in args]
+                if interactive:
+                    interpreter.output.before_input()
+                return func(*arg_values)
+
+            return fast
+
+        return observe
+
+    def report(self, limit=REPORTED_SITES):
+        """Summary line and per-site lines, busiest sites first"""
+        sites = sorted(self.sites, key=lambda site: site.runs, reverse=True)
+        runs = sum(site.runs for site in sites)
+        fast = sum(site.fast for site in sites)
+        rate = 100 * fast / runs if runs else 0
+        specializations = sum(site.specializations for site in sites)
+        deopts = sum(site.deopts for site in sites)
+        lines = [f"{len(sites)} sites, {runs} runs, {rate:.1f}% specialized, {specializations} specializations, {deopts} deopts"]
+        lines.extend(site.describe() for site in sites[:limit])
+        return lines
+
+
+def deoptimize(site, node, handlers, observe):
+    site.deopts += 1
+    site.state = "generic"
+    handlers[node] = observe
+
+
+def _constant(node):
+    return node.value
+
+
+def _site_nodes(node, line, lines):
+    if isinstance(node, (BinOpNode, ComparisonNode)):
+        lines.setdefault(node, line)
+        _site_nodes(node.left_node, line, lines)
+        _site_nodes(node.right_node, line, lines)
+    elif isinstance(node, FunctionCallNode):
+        lines.setdefault(node, line)
+        for arg in node.args:
+            _site_nodes(arg, line, lines)
+    elif isinstance(node, UnaryOpNode):
+        _site_nodes(node.operand, line, lines)
+    elif isinstance(node, ArrayNode):
+        for element in node.elements:
+            _site_nodes(element, line, lines)
+    elif isinstance(node, IndexNode):
+        _site_nodes(node.target, line, lines)
+        _site_nodes(node.index, line, lines)
+
+
+def render(node, limit=40):
+    """Short source-like text for an expression, for reports"""
+    text = _render(node)
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def _render(node):
+    if isinstance(node, NumberNode):
+        return str(node.value)
+    if isinstance(node, StringNode):
+        return f'"{node.value}"'
+    if isinstance(node, VarAccessNode):
+        return node.name
+    if isinstance(node, (BinOpNode, ComparisonNode)):
+        return f"{_operand(node.left_node)} {SYMBOLS[node.op]} {_operand(node.right_node)}"
+    if isinstance(node, UnaryOpNode):
+        return f"not {_render(node.operand)}"
+    if isinstance(node, FunctionCallNode):
+        return f"{node.name}({', '.join(_render(arg) for arg in node.args)})"
+    if isinstance(node, ArrayNode):
+        return f"[{', '.join(_render(element) for element in node.elements)}]"
+    if isinstance(node, IndexNode):
+        return f"{_render(node.target)}[{_render(node.index)}]"
+    return type(node).__name__
+
+
+def _operand(node):
+    text = _render(node)
+    return f"({text})" if isinstance(node, (BinOpNode, ComparisonNode)) else text
@@ -0,0 +1,298 @@
+# Interactive read-eval-print loop
+#
+# One engine lives for the whole session, so variables and functions defined
+# by one entry are visible to the next. Every entry is parsed on its own and
+# only its statements are run; an entry ends when its braces balance, except
+# that an `if` block waits for a possible `else` on the next line (a blank
+# line runs it). An entry that does not start with a statement is shown with
+# `say`.
+#
+# `:load FILE` runs a file in the session. Loaded files are remembered by
+# their top-level statements: a top-level statement starts on a line whose
+# first token is a statement keyword outside any braces, and runs up to the
+# next one. Loading a file again only parses the statements whose text
+# changed (the lexer alone finds where they start) and reuses the others,
+# moved to their new lines. The first load of a file in a session uses the
+# program cache like `chiken FILE` does.
+
+import sys
+from pathlib import Path
+
+from src.lexer import RegexLexer
+from src.parser import Parser
+from src.optimizer import Optimizer
+from src.nodes import FunctionDefNode
+from src.resolver import blocks
+
+PROMPT = "chiken> "
+CONTINUE = "...     "
+
+# Tokens that start a statement
+STATEMENT_TOKENS = frozenset(("HAVE", "SAY", "IF", "REPEAT", "FUNC", "RETURN"))
+
+HELP = """\
+Enter ChIkEn statements; blocks continue until their braces close.
+An expression on its own is printed.
+  :load FILE   run FILE, parsing only what changed since it was last loaded
+  :help        show this message
+  :quit        leave (or end of input)"""
+
+
+def parse_at(text, line):
+    """Parse text whose first line is line `line` of its source"""
+    lexer = RegexLexer(text)
+    lexer.line = line
+    return Parser(lexer).parse()
+
+
+def scan(text):
+    """(first token type, open braces, whether text ends with an `if` block
+    that an `else` could still continue), from the lexer alone"""
+    depth = 0
+    first = None
+    last = None
+    open_if = False
+    for token in RegexLexer(text).tokens():
+        kind = token.type
+        if kind == "EOF":
+            break
+        if first is None:
+            first = kind
+        if kind == "LBRACE":
+            depth += 1
+        elif kind == "RBRACE":
+            depth -= 1
+        elif depth == 0 and kind in STATEMENT_TOKENS:
+            open_if = kind == "IF"
+        elif depth == 0 and kind == "ELSE":
+            open_if = False
+        last = kind
+    return first, depth, open_if and depth == 0 and last == "RBRACE"
+
+
+def statement_starts(text):
+    """Lines on which the top-level statements of text start; the first
+    token starts the first group whatever it is, so stray text still fails
+    to parse"""
+    starts = []
+    depth = 0
+    line = 0
+    for token in RegexLexer(text).tokens():
+        kind = token.type
+        if token.line != line and kind != "EOF":
+            line = token.line
+            if not starts or (depth == 0 and kind in STATEMENT_TOKENS):
+                starts.append(line)
+        if kind == "LBRACE":
+            depth += 1
+        elif kind == "RBRACE":
+            depth -= 1
+    return starts
+
+
+def chunks(text, starts):
+    """(line, source) of every top-level statement group of text"""
+    lines = text.splitlines(keepends=True)
+    ends = starts[1:] + [len(lines) + 1]
+    return [(start, "".join(lines[start - 1:end - 1])) for start, end in zip(starts, ends)]
+
+
+def shift(statements, delta):
+    """Move statements and everything nested in them by delta lines"""
+    for stmt in statements:
+        if stmt.line is not None:
+            stmt.line += delta
+        for block in blocks(stmt):
+            shift(block, delta)
+        if isinstance(stmt, FunctionDefNode):
+            shift(stmt.body, delta)
+
+
+class Loaded:
+    """A file as it was last loaded"""
+
+    __slots__ = ("text", "statements")
+
+    def __init__(self, text, statements):
+        self.text = text
+        self.statements = statements
+
+    def parsed_chunks(self):
+        """{source: (line, statements)} of its top-level statement groups"""
+        statements = self.statements
+        groups = chunks(self.text, statement_starts(self.text))
+        found = {}
+        i = 0
+        for n, (line, source) in enumerate(groups):
+            end = groups[n + 1][0] if n + 1 < len(groups) else None
+            group = []
+            while i < len(statements) and (end is None or statements[i].line < end):
+                group.append(statements[i])
+                i += 1
+            found.setdefault(source, (line, group))
+        return found
+
+
+class Repl:
+    """Reads entries and runs them in one engine
+
+    interpreter is any engine that can run statements one batch at a time
+    (tree, closure or vm); cache is a ProgramCache used by :load, or None.
+    """
+
+    def __init__(self, interpreter, optimize=False, cache=None, interactive=None, verbose=False):
+        self.interpreter = interpreter
+        self.optimize = optimize
+        self.cache = cache
+        self.interactive = sys.stdin.isatty() if interactive is None else interactive
+        self.verbose = verbose
+        self.files = {}  # resolved path -> Loaded
+        self.buffer = []  # lines of the entry being typed
+        self.start = 0  # input line the entry starts on
+        self.number = 0  # input lines read so far
+        self.held = False  # the buffer is an `if` waiting for a possible `else`
+        self.done = False
+
+    def interact(self):
+        """Read and run entries until :quit or the end of input"""
+        if self.interactive:
+            try:
+                # Importing readline is what gives input() line editing
+                # and history; the module itself is never used
+                import readline  # noqa: F401
+            except ImportError:
+                pass
+        while not self.done:
+            try:
+                line = input((CONTINUE if self.buffer else PROMPT) if self.interactive else "")
+            except EOFError:
+                if self.interactive:
+                    print()
+                break
+            except KeyboardInterrupt:
+                print("\nInterrupted", file=sys.stderr)
+                self.reset()
+                continue
+            try:
+                self.feed(line)
+            except KeyboardInterrupt:
+                print("\nInterrupted", file=sys.stderr)
+                self.reset()
+        self.finish()
+
+    def feed(self, line):
+        """Take one line of input, running the entry once it is complete"""
+        self.number += 1
+        if self.held:
+            try:
+                first = scan(line)[0]
+            except Exception:
+                first = None
+            if first != "ELSE":
+                self.execute()
+        if not self.buffer:
+            command = line.strip()
+            if not command:
+                return
+            if command.startswith(":"):
+                self.command(command)
+                return
+            self.start = self.number
+        self.buffer.append(line)
+        try:
+            _, depth, open_if = scan("\n".join(self.buffer))
+        except Exception as e:
+            self.reset()
+            self.error(e)
+            return
+        self.held = open_if
+        if depth <= 0 and not open_if:
+            self.execute()
+
+    def finish(self):
+        """Run a held `if`; an unfinished block is an error"""
+        if self.held:
+            self.execute()
+        elif self.buffer:
+            self.reset()
+            self.error("Unexpected end of input inside a block")
+
+    def reset(self):
+        self.buffer = []
+        self.held = False
+
+    def execute(self):
+        text = "\n".join(self.buffer) + "\n"
+        start = self.start
+        self.reset()
+        try:
+            first = scan(text)[0]
+            if first is None:
+                return
+            if first not in STATEMENT_TOKENS:
+                text = "say " + text
+            self.run(parse_at(text, start))
+        except Exception as e:
+            self.error(e)
+
+    def run(self, statements):
+        if self.optimize:
+            statements = Optimizer().optimize(statements)
+        self.interpreter.run(statements)
+
+    def command(self, command):
+        name, _, argument = command.partition(" ")
+        argument = argument.strip()
+        if name in (":q", ":quit", ":exit"):
+            self.done = True
+        elif name == ":help":
+            print(HELP)
+        elif name == ":load" and argument:
+            try:
+                statements, parsed = self.load(argument)
+                if self.interactive or self.verbose:
+                    print(f"loaded {argument}: {len(statements)} statements, {parsed} parsed", file=sys.stderr)
+                self.run(statements)
+            except FileNotFoundError:
+                self.error(f"File '{argument}' not found")
+            except Exception as e:
+                self.error(e)
+        elif name == ":load":
+            self.error("Usage: :load FILE")
+        else:
+            self.error(f"Unknown command {name} (try :help)")
+
+    def load(self, path):
+        """The statements of a file and how many top-level groups were parsed"""
+        with open(path, "r") as f:
+            text = f.read()
+        key = str(Path(path).resolve())
+        previous = self.files.get(key)
+        if previous is not None and previous.text == text:
+            return previous.statements, 0
+
+        if previous is None and self.cache is not None:
+            statements = self.cache.load(path, text)
+            if statements is not None:
+                self.files[key] = Loaded(text, statements)
+                return statements, 0
+
+        known = previous.parsed_chunks() if previous is not None else {}
+        statements = []
+        parsed = 0
+        for line, source in chunks(text, statement_starts(text)):
+            reused = known.pop(source, None)
+            if reused is None:
+                group = parse_at(source, line)
+                parsed += 1
+            else:
+                old_line, group = reused
+                shift(group, line - old_line)
+            statements.extend(group)
+        if self.cache is not None:
+            self.cache.store(path, text, statements)
+        self.files[key] = Loaded(text, statements)
+        return statements, parsed
+
+    def error(self, e):
+        print(f"Error: {e}", file=sys.stderr)
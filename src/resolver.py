@@ -0,0 +1,184 @@
+# Static scope resolution for ChIkEn
+#
+# A function sees a copy of its caller's variables, and its own assignments
+# never leak back out. Rather than copying the caller's whole symbol table on
+# every call, the resolver gives every variable a function binds a fixed slot
+# in a frame list. Names a function reads but never binds are looked up
+# through the chain of calling frames, which is exactly what the copy used to
+# contain.
+#
+# A frame is a list laid out as [slot 0, ..., slot n-1, slot_index, parent],
+# where `parent` is the caller's frame, or the global symbol table dict for
+# calls made from the top level.
+
+from src.nodes import VarAccessNode, VarAssignNode, BinOpNode, UnaryOpNode, PrintNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+
+
+class _Unset:
+    def __repr__(self):
+        return "<unset>"
+
+
+# Value of a slot whose variable has not been assigned yet
+UNSET = _Unset()
+
+
+def blocks(node):
+    """Return the statement lists nested directly inside a statement"""
+    if isinstance(node, IfNode):
+        return [node.then_block, node.else_block or []]
+    if isinstance(node, RepeatNode):
+        return [node.body]
+    return []
+
+
+def expressions(node):
+    """Return the expressions a statement evaluates itself"""
+    if isinstance(node, (VarAssignNode, PrintNode)):
+        return [node.value_node]
+    if isinstance(node, (IfNode, RepeatNode)):
+        return [node.condition]
+    if isinstance(node, ReturnNode):
+        return [node.value_node] if node.value_node is not None else []
+    if isinstance(node, FunctionDefNode):
+        return []
+    return [node]
+
+
+def reads(node, names):
+    """Collect every variable name read by an expression"""
+    if isinstance(node, VarAccessNode):
+        names.add(node.name)
+    elif isinstance(node, (BinOpNode, ComparisonNode)):
+        reads(node.left_node, names)
+        reads(node.right_node, names)
+    elif isinstance(node, UnaryOpNode):
+        reads(node.operand, names)
+    elif isinstance(node, FunctionCallNode):
+        for arg in node.args:
+            reads(arg, names)
+    elif isinstance(node, ArrayNode):
+        for element in node.elements:
+            reads(element, names)
+    elif isinstance(node, IndexNode):
+        reads(node.target, names)
+        reads(node.index, names)
+    return names
+
+
+def var_nodes(node, found):
+    """Collect the VarAccessNode/VarAssignNode objects below a node"""
+    if isinstance(node, (VarAccessNode, VarAssignNode)):
+        found.append(node)
+    if isinstance(node, VarAssignNode):
+        var_nodes(node.value_node, found)
+    elif isinstance(node, (BinOpNode, ComparisonNode)):
+        var_nodes(node.left_node, found)
+        var_nodes(node.right_node, found)
+    elif isinstance(node, UnaryOpNode):
+        var_nodes(node.operand, found)
+    elif isinstance(node, FunctionCallNode):
+        for arg in node.args:
+            var_nodes(arg, found)
+    elif isinstance(node, ArrayNode):
+        for element in node.elements:
+            var_nodes(element, found)
+    elif isinstance(node, IndexNode):
+        var_nodes(node.target, found)
+        var_nodes(node.index, found)
+    elif isinstance(node, (PrintNode, IfNode, RepeatNode, ReturnNode)):
+        for expr in expressions(node):
+            var_nodes(expr, found)
+        for block in blocks(node):
+            for stmt in block:
+                var_nodes(stmt, found)
+    return found
+
+
+def assigned_names(statements, params=()):
+    """Return the names a body binds, not looking into nested funcs"""
+    assigned = set(params)
+    for stmt in statements:
+        if isinstance(stmt, VarAssignNode):
+            assigned.add(stmt.name)
+        for block in blocks(stmt):
+            assigned |= assigned_names(block)
+    return assigned
+
+
+def fallback_reads(statements, definite, names):
+    """Collect names that may be read before the body itself binds them"""
+    for stmt in statements:
+        for expr in expressions(stmt):
+            names |= reads(expr, set()) - definite
+        if isinstance(stmt, VarAssignNode):
+            definite.add(stmt.name)
+        for block in blocks(stmt):
+            fallback_reads(block, set(definite), names)
+    return names
+
+
+def find_functions(statements, found=None):
+    """Collect every FunctionDefNode in the program, nested ones included"""
+    if found is None:
+        found = []
+    for stmt in statements:
+        if isinstance(stmt, FunctionDefNode):
+            found.append(stmt)
+            find_functions(stmt.body, found)
+        for block in blocks(stmt):
+            find_functions(block, found)
+    return found
+
+
+def resolve(func_def):
+    """Assign frame slots to a function's variables
+
+    Sets `slots` (slot names, parameters first) and `slot_index` on the
+    FunctionDefNode and a `slot` on every variable node of its body; nodes
+    left with slot None are read from the calling frames. Resolving is
+    idempotent, so a function is only ever resolved once.
+    """
+    if func_def.slots is not None:
+        return func_def
+
+    slots = list(func_def.params)
+    for name in sorted(assigned_names(func_def.body) - set(slots)):
+        slots.append(name)
+    index = {name: i for i, name in enumerate(slots)}
+
+    for stmt in func_def.body:
+        for node in var_nodes(stmt, []):
+            node.slot = index.get(node.name)
+
+    func_def.slot_index = index
+    func_def.slots = tuple(slots)
+    return func_def
+
+
+def new_frame(func_def, arg_values, parent):
+    frame = [UNSET] * len(func_def.slots)
+    frame[:len(arg_values)] = arg_values
+    frame.append(func_def.slot_index)
+    frame.append(parent)
+    return frame
+
+
+def lookup(env, name):
+    """Read a variable the current frame has not bound through its callers"""
+    while type(env) is list:
+        slot = env[-2].get(name)
+        if slot is not None and env[slot] is not UNSET:
+            return env[slot]
+        env = env[-1]
+    try:
+        return env[name]
+    except KeyError:
+        raise Exception(f"Variable '{name}' not defined") from None
+
+
+def recursion_error(limit=None):
+    """The ChIkEn error raised when calls nest too deeply"""
+    if limit is None:
+        return Exception("Maximum recursion depth exceeded")
+    return Exception(f"Maximum recursion depth exceeded ({limit} calls)")
@@ -0,0 +1,140 @@
+# Rope strings for ChIkEn
+#
+# Strings are built with `have s = s + "..."`, and a Python str + str copies
+# both operands, so building a long string in a loop is quadratic. When a
+# concatenation would give a string of at least ROPE_MIN characters the
+# engines call concat(), which returns a Rope instead: a list of str parts
+# and a length. Adding to a Rope appends to its list, so each further `+`
+# is amortized O(1).
+#
+# Ropes are values like any other and must stay immutable. Several Ropes
+# share one list, each covering its first `count` parts; only the Rope that
+# covers the whole list appends to it in place, any other copies its parts
+# first (so `have t = s` followed by appending to both is still correct).
+#
+# A Rope is flattened (joined once, then cached) when it is printed,
+# compared, hashed or used with any operator other than +. Builtins that do
+# not declare ropes=True get plain str arguments, and the variables handed
+# back to embedders are plain str. Operators with non-string operands are
+# delegated to the flattened str, so errors read exactly as for a str.
+
+# Shorter concatenations stay plain str
+ROPE_MIN = 256
+
+
+class Rope:
+    __slots__ = ("parts", "count", "length", "text")
+
+    def __init__(self, parts, count, length):
+        self.parts = parts  # list of str, possibly extended by longer Ropes
+        self.count = count  # how many of parts make up this value
+        self.length = length
+        self.text = None  # the flattened str once needed
+
+    def __str__(self):
+        text = self.text
+        if text is None:
+            parts = self.parts
+            text = self.text = "".join(parts if len(parts) == self.count else parts[:self.count])
+        return text
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __add__(self, other):
+        if type(other) is not str:
+            if type(other) is not Rope:
+                return str(self) + other
+            other = str(other)
+        parts = self.parts
+        if len(parts) != self.count:
+            # A longer Rope already extends this one
+            parts = parts[:self.count]
+        parts.append(other)
+        return Rope(parts, self.count + 1, self.length + len(other))
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def __eq__(self, other):
+        return str(self) == flat(other)
+
+    def __ne__(self, other):
+        return str(self) != flat(other)
+
+    def __lt__(self, other):
+        return str(self) < flat(other)
+
+    def __le__(self, other):
+        return str(self) <= flat(other)
+
+    def __gt__(self, other):
+        return str(self) > flat(other)
+
+    def __ge__(self, other):
+        return str(self) >= flat(other)
+
+    def __sub__(self, other):
+        return str(self) - flat(other)
+
+    def __rsub__(self, other):
+        return other - str(self)
+
+    def __mul__(self, other):
+        return str(self) * flat(other)
+
+    def __rmul__(self, other):
+        return other * str(self)
+
+    def __truediv__(self, other):
+        return str(self) / flat(other)
+
+    def __rtruediv__(self, other):
+        return other / str(self)
+
+    def __mod__(self, other):
+        return str(self) % flat(other)
+
+    def __rmod__(self, other):
+        return other % str(self)
+
+    def __pow__(self, other):
+        return str(self) ** flat(other)
+
+    def __rpow__(self, other):
+        return other ** str(self)
+
+
+def flat(value):
+    """value, or the str it stands for when it is a Rope"""
+    return str(value) if type(value) is Rope else value
+
+
+def concat(left, right):
+    """left + right for a str left; a Rope once the result is long"""
+    if type(right) is not str:
+        if type(right) is not Rope:
+            return left + right
+        right = str(right)
+    if len(left) + len(right) < ROPE_MIN:
+        return left + right
+    return Rope([left, right], 2, len(left) + len(right))
+
+
+def flatten(values):
+    """A copy of a list of values with every Rope flattened to str"""
+    return [str(value) if type(value) is Rope else value for value in values]
+
+
+def plain(variables):
+    """A copy of a variables dict with every Rope flattened to str"""
+    return {name: str(value) if type(value) is Rope else value for name, value in variables.items()}
@@ -0,0 +1,143 @@
+# Cooperative asyncio scheduler for ChIkEn programs
+#
+# Runs many programs in one thread by driving the vm engine step by step:
+# VirtualMachine.steps() is a generator that pauses after a fixed number of
+# loop iterations and calls (a "slice"), and at every call to input(). Each
+# program runs as an asyncio coroutine that resumes its generator for one
+# slice and then yields to the event loop, so a long `repeat` loop only ever
+# holds the loop for one slice and every program gets the same share.
+#
+# `say` output is handed to an async writer after every slice, input() reads
+# from an async reader, and programs can be given a total step budget and a
+# timeout.
+
+import asyncio
+import io
+
+from src.engines import create_engine
+from src.program import Result, shared_engine
+from src.builtins import parse_input
+from src.output import OutputSink
+from src.ropes import plain
+
+# Steps (loop iterations and calls) a program runs before yielding
+DEFAULT_SLICE = 1000
+
+
+class Scheduler:
+    """Runs ChIkEn programs as cooperatively scheduled asyncio tasks
+
+        scheduler = Scheduler(slice_steps=1000, timeout=5)
+        results = await asyncio.gather(*(scheduler.run(src) for src in scripts))
+
+    slice_steps is how many steps a program runs before letting others run,
+    max_steps the total steps it may take and timeout the seconds it may
+    take (None for no limit); run() can override the last two per program.
+    """
+
+    def __init__(self, slice_steps=DEFAULT_SLICE, max_steps=None, timeout=None, max_depth=None, optimize=False):
+        if slice_steps < 1:
+            raise Exception("slice_steps must be at least 1")
+        self.slice_steps = slice_steps
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_depth = max_depth
+        self.optimize = optimize
+
+    def spawn(self, program, **kwargs):
+        """Start run() as a Task and return it"""
+        return asyncio.ensure_future(self.run(program, **kwargs))
+
+    async def run(self, program, globals=None, input=None, output=None, max_steps=None, timeout=None):
+        """Run a source string or vm Program and return its Result
+
+        input is an async callable returning the next line, or an
+        asyncio.StreamReader; without one input() sees end of file. output
+        is an async callable taking each chunk of text; without one the
+        output is captured into Result.output.
+        """
+        if isinstance(program, str):
+            program = shared_engine("vm", self.optimize).compile(program)
+        elif program.engine != "vm":
+            raise Exception("The scheduler runs programs compiled for the vm engine")
+        timeout = timeout if timeout is not None else self.timeout
+        max_steps = max_steps if max_steps is not None else self.max_steps
+
+        task = self.drive(program, globals, input, output, max_steps)
+        if timeout is None:
+            return await task
+        try:
+            return await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            raise Exception(f"Timed out after {timeout:g}s") from None
+
+    async def drive(self, program, globals, input, output, max_steps):
+        buffer = io.StringIO()
+        sink = OutputSink(buffer)
+        vm = create_engine("vm", output=sink, max_depth=self.max_depth)
+        if globals:
+            vm.symbol_table.update(globals)
+        captured = []
+
+        async def emit(text=""):
+            sink.flush()
+            text = buffer.getvalue() + text
+            if text:
+                buffer.seek(0)
+                buffer.truncate()
+                if output is None:
+                    captured.append(text)
+                else:
+                    await output(text)
+
+        def next_slice():
+            # The last slice ends at the first step past max_steps
+            if max_steps is None:
+                return self.slice_steps
+            return min(self.slice_steps, max_steps + 1 - taken)
+
+        taken = 0  # steps started so far
+        budget = next_slice()
+        steps = vm.steps(program.code, budget)
+        try:
+            request = next(steps)
+            while True:
+                if request is None:
+                    taken += budget
+                    if max_steps is not None and taken > max_steps:
+                        raise Exception(f"Step budget exceeded ({max_steps} steps)")
+                    await emit()
+                    await asyncio.sleep(0)
+                    budget = next_slice()
+                    request = steps.send(budget)
+                    continue
+
+                builtin, values = request
+                if builtin.name == "input":
+                    # The prompt is shown the way a terminal would show it
+                    await emit(str(values[0]) if values else "")
+                    value = parse_input(await read_line(input))
+                else:
+                    value = builtin.func(*values)
+                request = steps.send(value)
+        except StopIteration:
+            pass
+        finally:
+            steps.close()
+            await emit()
+
+        text = "".join(captured) if output is None else None
+        return Result(text, plain(vm.symbol_table), vm)
+
+
+async def read_line(reader):
+    """Read a line without its newline from an async source, "" at end of file"""
+    if reader is None:
+        return ""
+    if hasattr(reader, "readline"):
+        line = await reader.readline()
+    else:
+        line = await reader()
+    if isinstance(line, bytes):
+        line = line.decode()
+    return line.rstrip("\r\n")
@@ -0,0 +1,319 @@
+# Tiered execution for the tree engine
+#
+# Every function starts out in the tree-walker, which counts its calls and
+# the loop iterations ("backedges") it runs. Once the two add up to the
+# threshold, the function is compiled to Python code by the python backend
+# (src/pygen.py), together with every function it can call, and later calls
+# run the compiled code. A top-level `repeat` that reaches the threshold is
+# compiled the same way and the rest of it runs as native Python (on-stack
+# replacement); a counting loop that will run at least that many times is
+# compiled before its first iteration.
+#
+# Only code whose compiled form behaves exactly like the tree-walker is
+# promoted. The tree-walker finishes the top-level statement of a function
+# in which a `return` ran, so a `return` inside a `repeat` does not end the
+# loop; functions with returns inside loops (or before the end of an `if`
+# branch) and functions that define functions stay interpreted, and so does
+# everything that calls them. The reasons are listed by --verbose.
+#
+# Compiled code remembers the functions it was built from. A `func`
+# statement changes the interpreter's version, and compiled code whose
+# functions were redefined is dropped; its counters start over.
+
+import time
+
+from src.nodes import BinOpNode, UnaryOpNode, FunctionCallNode, ComparisonNode, IfNode, RepeatNode, FunctionDefNode, ReturnNode, ArrayNode, IndexNode
+from src.resolver import UNSET, blocks, expressions
+from src.pygen import PythonGenerator, FunctionTable, runtime_namespace
+
+# Calls plus loop iterations after which a function is compiled
+DEFAULT_TIER_THRESHOLD = 1000
+
+_MISSING = object()
+
+
+class TierGenerator(PythonGenerator):
+    """PythonGenerator for code that runs inside the tree engine"""
+
+    def loop(self, functions, node):
+        """Source for the functions and _main(_scope) running the top-level loop node"""
+        self.declare(functions)
+        self.function("_main", ["_scope"], (), [node], False)
+        return "\n".join(self.lines) + "\n"
+
+
+class Compiled:
+    """Python code built from a set of ChIkEn functions"""
+
+    __slots__ = ("functions", "builtins", "dynamic", "version")
+
+    def __init__(self, functions, builtins, dynamic, version):
+        self.functions = functions  # the FunctionDefNodes compiled together
+        self.builtins = builtins  # names called as builtins
+        self.dynamic = tuple(sorted(dynamic))  # names read from callers
+        self.version = version  # interpreter version it was last checked at
+
+
+class FunctionTier:
+    __slots__ = ("func_def", "calls", "backedges", "code", "compiled", "checked", "compiled_calls")
+
+    def __init__(self, func_def):
+        self.func_def = func_def
+        self.calls = 0  # interpreted calls
+        self.backedges = 0  # interpreted loop iterations
+        self.code = None  # the compiled Python function
+        self.compiled = None  # its Compiled
+        self.checked = None  # interpreter version promotion last failed at
+        self.compiled_calls = 0
+
+
+class Tiers:
+    """Counters and compiled code of one tiered Interpreter"""
+
+    def __init__(self, interpreter, threshold=DEFAULT_TIER_THRESHOLD):
+        if threshold < 1:
+            raise Exception("The tier threshold must be at least 1")
+        self.interpreter = interpreter
+        self.threshold = threshold
+        self.entries = {}  # FunctionDefNode -> FunctionTier
+        self.loops = {}  # top-level RepeatNode -> (Compiled, _main) or None
+        self.current = None  # FunctionTier of the interpreted function running
+        self.events = []
+
+    def enter(self, func_def):
+        """Count a call; return the function's FunctionTier, promoting it when hot"""
+        entry = self.entries.get(func_def)
+        if entry is None:
+            entry = self.entries[func_def] = FunctionTier(func_def)
+        if entry.code is not None:
+            if self.valid(entry.compiled):
+                return entry
+            self.deoptimize(entry.compiled)
+        entry.calls += 1
+        if entry.calls + entry.backedges >= self.threshold and entry.checked != self.interpreter.version:
+            self.promote(entry)
+        return entry
+
+    def run(self, entry, arg_values):
+        """Call a function's compiled code from the tree-walker"""
+        interpreter = self.interpreter
+        entry.compiled_calls += 1
+        result = entry.code(self.scope(entry.compiled), *arg_values)
+        # Like the end of an interpreted call
+        interpreter.return_value = None
+        return result
+
+    def repeat(self, node, loop):
+        """Run a RepeatNode (loop is its CountingLoop or None) in tier mode"""
+        interpreter = self.interpreter
+        visit = interpreter.visit
+        top = interpreter.frame is None
+        if loop is not None:
+            trips = self.trips(loop)
+            if top and trips >= self.threshold and self.replace(node, 0):
+                return
+            if interpreter.counting_repeat(loop):
+                if not top:
+                    self.current.backedges += trips
+                return
+
+        iterations = 0
+        while visit(node.condition):
+            for stmt in node.body:
+                visit(stmt)
+            iterations += 1
+            if iterations == self.threshold and top and self.replace(node, iterations):
+                return
+        if not top:
+            self.current.backedges += iterations
+
+    def trips(self, loop):
+        interpreter = self.interpreter
+        start = interpreter.visit(loop.counter)
+        stop = interpreter.visit(loop.bound)
+        if type(start) is not int or type(stop) is not int:
+            return 0
+        return len(loop.values(start, stop))
+
+    def replace(self, node, iterations):
+        """Run the rest of a top-level loop as compiled code; False if it cannot be"""
+        compiled = self.loops.get(node, _MISSING)
+        if compiled is not _MISSING and compiled is not None and not self.valid(compiled[0]):
+            self.deoptimize(compiled[0])
+            compiled = _MISSING
+        if compiled is _MISSING:
+            compiled = self.loops[node] = self.compile_loop(node, iterations)
+        if compiled is None:
+            return False
+        symbol_table = self.interpreter.symbol_table
+        symbol_table.update(compiled[1](symbol_table))
+        return True
+
+    def scope(self, compiled):
+        """The variables compiled code may read from the interpreted caller"""
+        interpreter = self.interpreter
+        env = interpreter.frame if interpreter.frame is not None else interpreter.symbol_table
+        scope = {}
+        for name in compiled.dynamic:
+            value = _visible(env, name)
+            if value is not _MISSING:
+                scope[name] = value
+        return scope
+
+    def valid(self, compiled):
+        version = self.interpreter.version
+        if compiled.version == version:
+            return True
+        functions = self.interpreter.functions
+        if all(functions.get(f.name) is f for f in compiled.functions) and not any(name in functions for name in compiled.builtins):
+            compiled.version = version
+            return True
+        return False
+
+    def promote(self, entry):
+        func_def = entry.func_def
+        interpreter = self.interpreter
+        functions, builtins, reason = self.closure([func_def])
+        if reason is not None:
+            entry.checked = interpreter.version
+            self.events.append(f"{func_def.name}() not compiled: {reason}")
+            return
+        start = time.perf_counter()
+        generator = TierGenerator()
+        generator.declare(functions)
+        namespace = self.build(functions, builtins, generator, "\n".join(generator.lines) + "\n", f"<chiken tier {func_def.name}>")
+        compiled = namespace["_compiled"]
+        for f in functions:
+            tier = self.entries.get(f)
+            if tier is None:
+                tier = self.entries[f] = FunctionTier(f)
+            tier.code = namespace["_fns"][f.name]
+            tier.compiled = compiled
+        elapsed = (time.perf_counter() - start) * 1000
+        names = ", ".join(f.name for f in functions)
+        self.events.append(f"{func_def.name}() compiled after {entry.calls} calls and {entry.backedges} loop iterations ({names}; {elapsed:.1f} ms)")
+
+    def compile_loop(self, node, iterations):
+        functions, builtins, reason = self.closure([node])
+        line = f"line {node.line}" if node.line is not None else "loop"
+        if reason is not None:
+            self.events.append(f"{line}: loop not compiled: {reason}")
+            return None
+        start = time.perf_counter()
+        generator = TierGenerator()
+        source = generator.loop(functions, node)
+        namespace = self.build(functions, builtins, generator, source, f"<chiken tier {line}>")
+        elapsed = (time.perf_counter() - start) * 1000
+        self.events.append(f"{line}: loop compiled after {iterations} iterations ({elapsed:.1f} ms)")
+        return namespace["_compiled"], namespace["_main"]
+
+    def build(self, functions, builtins, generator, source, filename):
+        output = self.interpreter.output
+        table = FunctionTable(output)
+        namespace = runtime_namespace(table, output)
+        exec(compile(source, filename, "exec"), namespace)
+        for f in functions:
+            table[f.name] = namespace[generator.pynames[id(f)]]
+        namespace["_compiled"] = Compiled(functions, builtins, generator.dynamic, self.interpreter.version)
+        return namespace
+
+    def closure(self, roots):
+        """The functions reachable from roots (FunctionDefNodes or statements),
+        the names called as builtins, and why they cannot be compiled or None"""
+        defined = self.interpreter.functions
+        functions = []
+        builtins = set()
+        calls = []
+        pending = []
+        for root in roots:
+            if isinstance(root, FunctionDefNode):
+                functions.append(root)
+                pending.append(root)
+            else:
+                reason = _blocker([root], calls, top=False, in_function=False)
+                if reason is not None:
+                    return None, None, reason
+        while True:
+            for call in calls:
+                callee = defined.get(call.name)
+                if callee is None:
+                    builtins.add(call.name)
+                    continue
+                if len(call.args) != len(callee.params):
+                    return None, None, f"calls {call.name}() with {len(call.args)} arguments"
+                if callee not in functions:
+                    functions.append(callee)
+                    pending.append(callee)
+            if not pending:
+                return functions, builtins, None
+            func_def = pending.pop()
+            calls = []
+            reason = _blocker(func_def.body, calls, top=True)
+            if reason is not None:
+                return None, None, f"{func_def.name}() {reason}"
+
+    def deoptimize(self, compiled):
+        names = ", ".join(f.name for f in compiled.functions) or "loop"
+        self.events.append(f"dropped compiled code for {names}: a function it uses was redefined")
+        for entry in self.entries.values():
+            if entry.compiled is compiled:
+                entry.code = entry.compiled = None
+                entry.calls = entry.backedges = 0
+        for node, loop in list(self.loops.items()):
+            if loop is not None and loop[0] is compiled:
+                del self.loops[node]
+
+    def report(self):
+        compiled = sum(1 for entry in self.entries.values() if entry.code is not None)
+        calls = sum(entry.compiled_calls for entry in self.entries.values())
+        lines = [f"threshold {self.threshold}: {compiled} functions compiled, {calls} calls into compiled code"]
+        lines.extend(self.events)
+        return lines
+
+
+def _visible(env, name):
+    # resolver.lookup without the error for undefined names
+    while type(env) is list:
+        slot = env[-2].get(name)
+        if slot is not None and env[slot] is not UNSET:
+            return env[slot]
+        env = env[-1]
+    return env.get(name, _MISSING)
+
+
+def _blocker(statements, calls, top, tail=False, in_loop=False, in_function=True):
+    """Why statements cannot be compiled without changing what they do, or None;
+    collects their FunctionCallNodes into calls"""
+    last = len(statements) - 1
+    for i, stmt in enumerate(statements):
+        if isinstance(stmt, FunctionDefNode):
+            return "defines functions"
+        # Stray top-level returns do nothing in either tier
+        if isinstance(stmt, ReturnNode) and in_function and not top and not (tail and i == last):
+            return "returns inside a repeat loop" if in_loop else "returns before the end of a block"
+        for expr in expressions(stmt):
+            _call_nodes(expr, calls)
+        inner_tail = (top or (tail and i == last)) and isinstance(stmt, IfNode)
+        for block in blocks(stmt):
+            reason = _blocker(block, calls, False, inner_tail, in_loop or isinstance(stmt, RepeatNode), in_function)
+            if reason is not None:
+                return reason
+    return None
+
+
+def _call_nodes(node, found):
+    if isinstance(node, FunctionCallNode):
+        found.append(node)
+        for arg in node.args:
+            _call_nodes(arg, found)
+    elif isinstance(node, (BinOpNode, ComparisonNode)):
+        _call_nodes(node.left_node, found)
+        _call_nodes(node.right_node, found)
+    elif isinstance(node, UnaryOpNode):
+        _call_nodes(node.operand, found)
+    elif isinstance(node, ArrayNode):
+        for element in node.elements:
+            _call_nodes(element, found)
+    elif isinstance(node, IndexNode):
+        _call_nodes(node.target, found)
+        _call_nodes(node.index, found)
@@ -0,0 +1,291 @@
+# Stack-based virtual machine for ChIkEn bytecode
+from src.bytecode import LOAD_CONST, LOAD_NAME, STORE_NAME, POP_TOP, PRINT, JUMP, POP_JUMP_IF_FALSE, CALL, RETURN_VALUE, SET_RETURN, CHECK_RETURN, MAKE_FUNCTION, LOAD_FAST, STORE_FAST, LOAD_FREE, TAIL_CALL, CHECK_CALL, BUILD_ARRAY, INDEX, ADD, SUB, MUL, DIV, MOD, AND, OR, GT, LT, GTE, LTE, EQ, NEQ, NOT, compile_program, free_names
+from src.builtins import lookup_builtin
+from src.resolver import UNSET, lookup, recursion_error
+from src.output import OutputSink
+from src.arrays import Array, index
+from src.ropes import concat
+
+# Calls are frames on a list, not Python recursion, so this can be large
+DEFAULT_MAX_DEPTH = 100000
+
+
+class VirtualMachine:
+    def __init__(self, max_depth=DEFAULT_MAX_DEPTH, output=None):
+        self.symbol_table = {}
+        self.functions = {}
+        self.output = output if output is not None else OutputSink()
+        self.max_depth = max_depth
+        # Names some function may read from its callers' frames; a tail call
+        # may drop the caller's frame from the chain when it binds none of them
+        self.dynamic = set()
+
+    def compile(self, statements):
+        return compile_program(statements, self.functions)
+
+    def run(self, statements, flush=True):
+        return self.run_code(self.compile(statements), flush)
+
+    def run_code(self, code, flush=True):
+        """Run a Code object from compile(), which may be reused across engines"""
+        try:
+            return self.execute(code)
+        finally:
+            if flush:
+                self.output.flush()
+
+    def execute(self, code):
+        """Run a Code object until its top-level RETURN_VALUE"""
+        steps = self.steps(code)
+        try:
+            request = next(steps)
+            while True:
+                builtin, values = request
+                request = steps.send(builtin.func(*values))
+        except StopIteration as stop:
+            return stop.value
+
+    def steps(self, code, budget=None):
+        """Generator running a Code object; returns its top-level value
+
+        Yields (builtin, args) for every call to an interactive builtin such
+        as input(), expecting the result to be sent back, and, when budget is
+        set, yields None after every `budget` steps so that a scheduler can
+        run something else; sending a number back makes that the size of the
+        next slice. A step is a backward jump (a loop iteration) or a call of
+        a ChIkEn function: every unbounded computation is made of them, so
+        straight-line code runs without any checks. The yield comes before
+        the step that used up the slice is taken.
+        """
+        ticks = budget or -1  # never reaches 0 without a budget
+        functions = self.functions
+        output = self.output
+        say = output.say
+        max_depth = self.max_depth
+        dynamic = self.dynamic
+        free_names(code, dynamic)
+        frames = []  # saved (func, ops, consts, names, pc, env, stack) of callers
+        func = None  # FunctionCode of the running frame
+        pending = None  # value of the last `return` the running frame ran
+
+        ops = code.ops
+        consts = code.consts
+        names = code.names
+        env = self.symbol_table
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+
+        while True:
+            op = ops[pc]
+            arg = ops[pc + 1]
+            pc += 2
+
+            if op == LOAD_FAST:
+                value = env[arg]
+                if value is UNSET:
+                    value = lookup(env, func.slots[arg])
+                push(value)
+            elif op == STORE_FAST:
+                env[arg] = pop()
+            elif op == LOAD_NAME:
+                try:
+                    push(env[names[arg]])
+                except KeyError:
+                    raise Exception(f"Variable '{names[arg]}' not defined") from None
+            elif op == LOAD_CONST:
+                push(consts[arg])
+            elif op == STORE_NAME:
+                env[names[arg]] = pop()
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP:
+                if arg < pc:
+                    ticks -= 1
+                    if not ticks:
+                        ticks = (yield None) or budget
+                pc = arg
+            elif op == ADD:
+                right = pop()
+                left = stack[-1]
+                stack[-1] = concat(left, right) if type(left) is str else left + right
+            elif op == SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == LTE:
+                right = pop()
+                stack[-1] = stack[-1] <= right
+            elif op == GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == GTE:
+                right = pop()
+                stack[-1] = stack[-1] >= right
+            elif op == EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == NEQ:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == DIV:
+                right = pop()
+                if type(right) is not Array and right == 0:
+                    raise Exception("Division by zero")
+                stack[-1] = stack[-1] / right
+            elif op == MOD:
+                right = pop()
+                if type(right) is not Array and right == 0:
+                    raise Exception("Modulo by zero")
+                stack[-1] = stack[-1] % right
+            elif op == AND:
+                right = pop()
+                stack[-1] = stack[-1] and right
+            elif op == OR:
+                right = pop()
+                stack[-1] = stack[-1] or right
+            elif op == NOT:
+                stack[-1] = not stack[-1]
+            elif op == CALL:
+                name, argc = consts[arg]
+                base = len(stack) - argc
+                callee = functions.get(name)
+
+                if callee is None:
+                    values = stack[base:]
+                    del stack[base:]
+                    builtin = lookup_builtin(name)
+                    builtin.check(argc, name)
+                    if builtin.interactive:
+                        output.before_input()
+                        push((yield builtin, values))
+                    else:
+                        push(builtin.func(*values))
+                    continue
+
+                if argc != len(callee.params):
+                    raise Exception(f"{name}() expects {len(callee.params)} arguments, got {argc}")
+                if len(frames) >= max_depth:
+                    raise recursion_error(max_depth)
+                ticks -= 1
+                if not ticks:
+                    ticks = (yield None) or budget
+
+                # A fresh frame (see src/resolver.py) chained to the caller's
+                local = stack[base:]
+                del stack[base:]
+                local.extend([UNSET] * (len(callee.slots) - argc))
+                local.append(callee.slot_index)
+                local.append(env)
+
+                frames.append((func, ops, consts, names, pc, env, stack))
+                pending = None
+                func = callee
+                code = func.code
+                ops = code.ops
+                consts = code.consts
+                names = code.names
+                env = local
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            elif op == TAIL_CALL:
+                name, argc = consts[arg]
+                base = len(stack) - argc
+                callee = functions.get(name)
+
+                if callee is None:
+                    values = stack[base:]
+                    builtin = lookup_builtin(name)
+                    builtin.check(argc, name)
+                    if builtin.interactive:
+                        output.before_input()
+                        value = yield builtin, values
+                    else:
+                        value = builtin.func(*values)
+                    func, ops, consts, names, pc, env, stack = frames.pop()
+                    push = stack.append
+                    pop = stack.pop
+                    push(value)
+                    pending = None
+                    continue
+
+                if argc != len(callee.params):
+                    raise Exception(f"{name}() expects {len(callee.params)} arguments, got {argc}")
+                ticks -= 1
+                if not ticks:
+                    ticks = (yield None) or budget
+
+                # Reuse the caller's return address; its frame stays in the
+                # chain only if the callee could still read its variables
+                parent = env if not dynamic.isdisjoint(func.slots) else env[-1]
+                local = stack[base:]
+                local.extend([UNSET] * (len(callee.slots) - argc))
+                local.append(callee.slot_index)
+                local.append(parent)
+
+                pending = None
+                func = callee
+                code = func.code
+                ops = code.ops
+                consts = code.consts
+                names = code.names
+                env = local
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                pc = 0
+            elif op == CHECK_CALL:
+                name, argc = consts[arg]
+                callee = functions.get(name)
+                if callee is None:
+                    lookup_builtin(name).check(argc, name)
+                elif argc != len(callee.params):
+                    raise Exception(f"{name}() expects {len(callee.params)} arguments, got {argc}")
+            elif op == RETURN_VALUE:
+                value = pop()
+                if not frames:
+                    return value
+                func, ops, consts, names, pc, env, stack = frames.pop()
+                push = stack.append
+                pop = stack.pop
+                push(value)
+                # Returning from a call clears the caller's pending return,
+                # as in the tree-walker
+                pending = None
+            elif op == SET_RETURN:
+                pending = pop()
+            elif op == CHECK_RETURN:
+                if pending is not None:
+                    value = pending
+                    func, ops, consts, names, pc, env, stack = frames.pop()
+                    push = stack.append
+                    pop = stack.pop
+                    push(value)
+                    pending = None
+            elif op == PRINT:
+                say(pop())
+            elif op == POP_TOP:
+                pop()
+            elif op == LOAD_FREE:
+                push(lookup(env, names[arg]))
+            elif op == BUILD_ARRAY:
+                base = len(stack) - arg
+                value = Array.from_values(stack[base:])
+                del stack[base:]
+                push(value)
+            elif op == INDEX:
+                right = pop()
+                stack[-1] = index(stack[-1], right)
+            elif op == MAKE_FUNCTION:
+                functions[consts[arg].name] = consts[arg]
+            else:
+                raise Exception(f"Unknown opcode {op}")
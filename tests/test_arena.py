@@ -0,0 +1,68 @@
+import io
+import pickle
+
+import pytest
+
+from src.arena import Arena, KIND_NAMES
+from src.engines import create_engine
+from src.lexer import RegexLexer
+from src.output import OutputSink
+from src.parser import Parser
+
+# Uses every node type
+SOURCE = """
+func classify(n) {
+    if (n < 0) {
+        return "negative"
+    } else {
+        if (n == 0) {
+            say "zero"
+            return
+        }
+    }
+    return "positive"
+}
+func total(values) {
+    have sum = 0
+    have i = 0
+    repeat (i < len(values)) {
+        have sum = sum + values[i]
+        have i = i + 1
+    }
+    return sum
+}
+have numbers = [3, 0 - 1, 4, 0]
+say total(numbers)
+say classify(0 - 2)
+say classify(0)
+say classify(numbers[0])
+say numbers[1] * 2
+say not (1 > 2) and "a" != "b"
+"""
+
+
+def parse(source):
+    return Parser(RegexLexer(source)).parse()
+
+
+def run(statements, engine):
+    stream = io.StringIO()
+    create_engine(engine, output=OutputSink(stream)).run(statements)
+    return stream.getvalue()
+
+
+def test_program_uses_every_node_type():
+    arena = Arena.from_nodes(parse(SOURCE))
+    assert {KIND_NAMES[kind] for kind in arena.kinds} == set(KIND_NAMES)
+
+
+def test_round_trip_keeps_the_tree():
+    statements = parse(SOURCE)
+    assert pickle.dumps(Arena.from_nodes(statements).to_nodes()) == pickle.dumps(statements)
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm", "python"])
+def test_round_trip_keeps_the_output(engine):
+    expected = run(parse(SOURCE), engine)
+    assert expected == "6\nnegative\nzero\npositive\npositive\n-2\nTrue\n"
+    assert run(Arena.from_nodes(parse(SOURCE)).to_nodes(), engine) == expected
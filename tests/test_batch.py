@@ -0,0 +1,23 @@
+import pytest
+
+from src import batch
+from src.batch import sweep_jobs
+
+
+def test_failed_job_keeps_its_output():
+    batch._init_worker("tree", False, {}, ['say "before"\nsay 1 / 0\n'])
+    result = batch._run_job(0, "job", 0, None)
+    assert result["status"] == "error"
+    assert result["error"] == "Division by zero"
+    assert result["output"] == "before\n"
+
+
+def test_syntax_errors_are_reported_per_job():
+    batch._init_worker("vm", False, {}, ["say (", "say x"])
+    assert batch._run_job(0, "bad", 0, None)["status"] == "error"
+    assert batch._run_job(1, "good", 1, {"x": 3})["output"] == "3\n"
+
+
+def test_sweep_jobs_rejects_non_mapping_bindings():
+    with pytest.raises(ValueError, match="binding set 1"):
+        sweep_jobs("rule", "say x", [{"x": 1}, [1, 2]])
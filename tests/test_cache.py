@@ -0,0 +1,14 @@
+from src.cache import ProgramCache
+
+
+def test_same_file_name_in_different_directories(tmp_path):
+    cache = ProgramCache(tmp_path / "cache", "test")
+    first = tmp_path / "a" / "main.chiken"
+    second = tmp_path / "b" / "main.chiken"
+    assert cache.store(first, "say 1", ["a"]) is not None
+    assert cache.store(second, "say 1", ["b"]) is not None
+    assert cache.store(second, "say 2", ["b2"]) is not None
+    assert cache.load(first, "say 1") == ["a"]
+    assert cache.load(second, "say 1") is None
+    assert cache.load(second, "say 2") == ["b2"]
+    assert len(list((tmp_path / "cache").iterdir())) == 2
@@ -0,0 +1,104 @@
+import io
+
+import pytest
+
+from chiken import cli
+
+
+class CountingStream(io.StringIO):
+    """A non-interactive stdout that counts writes and flushes"""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+    def flush(self):
+        self.flushes += 1
+
+    def isatty(self):
+        return False
+
+
+def test_stream_flushes_once_at_the_end(tmp_path, monkeypatch):
+    path = tmp_path / "many.chk"
+    path.write_text("".join(f"say {i}\n" for i in range(2000)))
+    stdout = CountingStream()
+    monkeypatch.setattr("sys.stdout", stdout)
+    cli.main(["--stream", str(path)])
+    assert stdout.getvalue() == "".join(f"{i}\n" for i in range(2000))
+    assert stdout.flushes == 1
+    assert stdout.writes == 1
+
+
+def test_stream_applies_the_optimizer(tmp_path, capsys):
+    path = tmp_path / "fold.chk"
+    path.write_text("say 2 * 3\nif (1 > 2) {\n    say \"dead\"\n}\nsay \"a\" + \"b\"\n")
+    cli.main(["--stream", "-O", "--verbose", str(path)])
+    captured = capsys.readouterr()
+    assert captured.out == "6\nab\n"
+    assert "optimizer: folded 3 constant expressions, removed 1 dead branches" in captured.err
+
+
+@pytest.mark.parametrize("flag", [["--profile"], ["--cache-dir", "cache"]])
+def test_stream_rejects_flags_it_cannot_honour(tmp_path, capsys, flag):
+    path = tmp_path / "one.chk"
+    path.write_text("say 1\n")
+    with pytest.raises(SystemExit):
+        cli.main(["--stream", *flag, str(path)])
+    assert "--stream cannot be combined with" in capsys.readouterr().err
+
+
+VERBOSE_PROGRAM = """func fib(n) {
+    if (n < 2) {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+have total = 0
+have i = 0
+repeat (i < 10) {
+    have total = total + i
+    have i = i + 1
+}
+say total
+say fib(20)
+"""
+
+
+@pytest.mark.parametrize("mode", [[], ["--stream"]])
+@pytest.mark.parametrize("engine", ["tree", "closure"])
+def test_verbose_memo_report(tmp_path, capsys, engine, mode):
+    path = tmp_path / "fib.chk"
+    path.write_text(VERBOSE_PROGRAM)
+    cli.main(["--engine", engine, "--memoize", "--verbose", *mode, str(path)])
+    captured = capsys.readouterr()
+    assert captured.out == "45\n6765\n"
+    assert "memoize: fib: 18 hits, 21 misses\n" in captured.err
+
+
+def test_reports_need_verbose(tmp_path, capsys):
+    path = tmp_path / "fib.chk"
+    path.write_text(VERBOSE_PROGRAM)
+    cli.main(["--memoize", str(path)])
+    assert capsys.readouterr() == ("45\n6765\n", "")
+
+
+@pytest.mark.parametrize("mode", [[], ["--stream"]])
+@pytest.mark.parametrize("engine", ["tree", "closure"])
+def test_verbose_loop_report(tmp_path, capsys, engine, mode):
+    path = tmp_path / "fib.chk"
+    path.write_text(VERBOSE_PROGRAM)
+    cli.main(["--engine", engine, "--verbose", *mode, str(path)])
+    assert capsys.readouterr().err == "loops: line 9: i += 1 (1 specialized runs, 0 fallbacks)\n"
+
+
+def test_verbose_without_counting_loops(tmp_path, capsys):
+    path = tmp_path / "plain.chk"
+    path.write_text("have i = 10\nrepeat (i > 0) {\n    have i = i / 2 - 1\n}\nsay i\n")
+    cli.main(["--verbose", str(path)])
+    assert capsys.readouterr().err == "loops: no counting loops specialized\n"
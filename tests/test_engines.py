@@ -0,0 +1,318 @@
+import io
+
+import pytest
+
+import chiken
+from src.engines import create_engine
+from src.lexer import RegexLexer
+from src.output import OutputSink
+from src.parser import Parser
+
+# Every engine configuration must print exactly what the tree-walker prints
+CONFIGURATIONS = {
+    "closure": dict(engine="closure"),
+    "vm": dict(engine="vm"),
+    "python": dict(engine="python"),
+    "tree-quicken": dict(engine="tree", quicken=True),
+    "tree-tier": dict(engine="tree", tier=1),
+    "tree-memoize": dict(engine="tree", memoize=64),
+    "closure-memoize": dict(engine="closure", memoize=64),
+    "tree-optimized": dict(engine="tree", optimize=True),
+    "vm-optimized": dict(engine="vm", optimize=True),
+    "python-optimized": dict(engine="python", optimize=True),
+}
+
+PROGRAMS = {
+    "arithmetic": """
+        have a = 17
+        have b = 5
+        say a + b
+        say a - b
+        say a * b
+        say a / b
+        say a % b
+        say a > b and b > 0
+        say not (a < b) or a == b
+        say "abc" + "def"
+    """,
+    "return_in_repeat": """
+        func f() {
+            have i = 0
+            repeat (i < 5) {
+                say i
+                if (i == 3) {
+                    return i
+                }
+                have i = i + 1
+            }
+            return 99
+        }
+        say f()
+    """,
+    "return_in_counting_repeat": """
+        func first_over(limit) {
+            have i = 0
+            repeat (i < 10) {
+                if (i * i > limit) {
+                    return i
+                }
+                have i = i + 1
+            }
+            say "loop done"
+        }
+        say first_over(20)
+    """,
+    "bare_return_in_if": """
+        func g(x) {
+            if (x > 0) {
+                say "early"
+                return
+            }
+            say "late"
+            return 2
+        }
+        say g(1)
+        say g(0)
+    """,
+    "return_before_end_of_branch": """
+        func h(x) {
+            if (x > 0) {
+                return "positive"
+                say "after return"
+            } else {
+                return "other"
+            }
+            say "not reached"
+        }
+        say h(1)
+        say h(0)
+    """,
+    "pending_return_cleared_by_call": """
+        func one() {
+            return 1
+        }
+        func f() {
+            have i = 0
+            repeat (i < 2) {
+                return "pending"
+                have r = one()
+                have i = i + 1
+            }
+            say "still running"
+            return "end"
+        }
+        say f()
+    """,
+    "return_none_value": """
+        func nothing() {
+            have x = 1
+        }
+        func f() {
+            return nothing()
+            say "continued"
+            return "done"
+        }
+        say f()
+    """,
+    "tail_recursion": """
+        func count(n, total) {
+            if (n == 0) {
+                return total
+            }
+            return count(n - 1, total + n)
+        }
+        say count(100, 0)
+    """,
+    "recursion": """
+        func fib(n) {
+            if (n < 2) {
+                return n
+            }
+            return fib(n - 1) + fib(n - 2)
+        }
+        say fib(15)
+    """,
+    "dynamic_scope": """
+        func show() {
+            say label + ": " + value
+        }
+        func outer(value) {
+            have label = "outer"
+            have shown = show()
+        }
+        have label = "top"
+        have value = "global"
+        have shown = show()
+        have shown = outer("argument")
+        say label
+    """,
+    "callee_gets_a_copy": """
+        func change() {
+            have x = 2
+            say x
+        }
+        have x = 1
+        have changed = change()
+        say x
+    """,
+    "division_by_zero": """
+        say "before"
+        say 1 / 0
+        say "after"
+    """,
+    "modulo_by_zero": """
+        func f(d) {
+            say "in f"
+            return 5 % d
+        }
+        say f(0)
+    """,
+    "arity_checked_before_arguments": """
+        func f() {
+            return 1
+        }
+        func g() {
+            say "side"
+            return 2
+        }
+        say f(g())
+    """,
+    "undefined_variable": """
+        say "start"
+        say missing
+    """,
+    "wrong_argument_count": """
+        func f(a, b) {
+            return a + b
+        }
+        say f(1)
+    """,
+    "ropes": """
+        have s = ""
+        have i = 0
+        repeat (i < 300) {
+            have s = s + "ab"
+            have i = i + 1
+        }
+        say len(s)
+        have t = s
+        have s = s + "!"
+        have t = t + "?"
+        say len(s)
+        say s == t
+        say s
+    """,
+    "arrays": """
+        have a = [1, 2, 3]
+        have b = [10, 20, 30]
+        say a + b
+        say a * 2
+        say b / 10
+        say a < [2, 2, 2]
+        say a[1]
+        say sum(b)
+        say len(range(5))
+        say max(1, 7, 3)
+    """,
+    "redefined_function": """
+        func f() {
+            return 1
+        }
+        have i = 0
+        repeat (i < 3) {
+            say f()
+            have i = i + 1
+        }
+        func f() {
+            return 2
+        }
+        say f()
+    """,
+}
+
+
+def parse(source):
+    return Parser(RegexLexer(source)).parse()
+
+
+def run(source, engine="tree", **options):
+    """A program's output and the message of the error it stopped with, if any"""
+    stream = io.StringIO()
+    error = None
+    try:
+        chiken.run(source, engine=engine, output=stream, **options)
+    except Exception as exc:
+        error = str(exc)
+    return stream.getvalue(), error
+
+
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+def test_corpus_parses(name):
+    assert parse(PROGRAMS[name])
+
+
+@pytest.mark.parametrize("name", sorted(PROGRAMS))
+@pytest.mark.parametrize("configuration", sorted(CONFIGURATIONS))
+def test_same_output_as_tree(name, configuration):
+    expected = run(PROGRAMS[name])
+    assert run(PROGRAMS[name], **CONFIGURATIONS[configuration]) == expected
+
+
+def test_return_in_repeat_finishes_the_loop():
+    assert run(PROGRAMS["return_in_repeat"]) == ("0\n1\n2\n3\n4\n3\n", None)
+
+
+def test_bare_return_does_not_end_the_function():
+    assert run(PROGRAMS["bare_return_in_if"]) == ("early\nlate\n2\nlate\n2\n", None)
+
+
+def test_call_clears_pending_return():
+    assert run(PROGRAMS["pending_return_cleared_by_call"]) == ("still running\nend\n", None)
+
+
+def test_errors_keep_earlier_output():
+    assert run(PROGRAMS["division_by_zero"]) == ("before\n", "Division by zero")
+    assert run(PROGRAMS["modulo_by_zero"]) == ("in f\n", "Modulo by zero")
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm", "python"])
+def test_functions_from_earlier_runs(engine):
+    stream = io.StringIO()
+    interpreter = create_engine(engine, output=OutputSink(stream))
+    interpreter.run(parse("func show() {\n    say label\n}\nfunc add(a, b) {\n    return a + b\n}\n"))
+    interpreter.run(parse("func outer() {\n    have label = \"inner\"\n    have r = show()\n}\nhave label = \"top\"\nhave r = outer()\nsay add(1, 2)\n"))
+    assert stream.getvalue() == "inner\n3\n"
+
+
+def test_deep_tail_recursion_on_vm():
+    output, error = run(PROGRAMS["tail_recursion"].replace("100", "200000"), engine="vm")
+    assert (output, error) == ("20000100000\n", None)
+
+
+DEEP_RECURSION = """
+func depth(n) {
+    if (n == 0) {
+        return 0
+    }
+    return 1 + depth(n - 1)
+}
+say "start"
+say depth(N)
+"""
+
+
+@pytest.mark.parametrize("configuration", sorted(CONFIGURATIONS))
+def test_deep_recursion_is_a_chiken_error(configuration):
+    options = dict(CONFIGURATIONS[configuration])
+    if options["engine"] == "vm":
+        options["max_depth"] = 500
+    stream = io.StringIO()
+    with pytest.raises(Exception, match=r"^Maximum recursion depth exceeded") as raised:
+        chiken.run(DEEP_RECURSION.replace("N", "100000"), output=stream, **options)
+    assert type(raised.value) is Exception
+    assert stream.getvalue() == "start\n"
+
+
+def test_vm_max_depth_is_exact():
+    assert run(DEEP_RECURSION.replace("N", "499"), engine="vm", max_depth=500) == ("start\n499\n", None)
+    assert run(DEEP_RECURSION.replace("N", "500"), engine="vm", max_depth=500) == ("start\n", "Maximum recursion depth exceeded (500 calls)")
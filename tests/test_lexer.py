@@ -0,0 +1,15 @@
+import io
+
+import pytest
+
+from src.lexer import Lexer, RegexLexer, StreamLexer
+
+SOURCE = "say 1\nhave x = 2 ! 3\n"
+
+
+@pytest.mark.parametrize("make", [Lexer, RegexLexer, lambda text: StreamLexer(io.StringIO(text), chunk_size=4)])
+def test_invalid_character_reports_its_position(make):
+    lexer = make(SOURCE)
+    with pytest.raises(Exception, match=r"Invalid character '!' at line 2, column 12"):
+        while lexer.get_next_token().type != "EOF":
+            pass
@@ -0,0 +1,41 @@
+import chiken
+from src.lexer import RegexLexer
+from src.parser import Parser
+from src.optimizer import Optimizer
+
+
+def test_optimize_leaves_its_input_alone():
+    statements = Parser(RegexLexer("have x = 2 * 3\nif (1 < 2) {\n    say x * 1\n}\n")).parse()
+    assign = statements[0]
+    value = assign.value_node
+    optimizer = Optimizer()
+    optimized = optimizer.optimize(statements)
+    assert len(statements) == 2
+    assert assign.value_node is value
+    assert optimized[0].value_node.value == 6
+    assert optimizer.stats["folded"] == 2
+
+
+def test_folded_if_keeps_return_semantics():
+    source = """
+func f() {
+    if (1 < 2) {
+        return 1
+        say "after"
+    }
+    say "later"
+    return 2
+}
+say f()
+"""
+    for engine in ("tree", "closure", "vm", "python"):
+        assert chiken.run(source, engine=engine, optimize=True, capture=True) == "after\n1\n"
+
+
+def test_huge_strings_are_not_built_while_folding():
+    statements = Parser(RegexLexer('if (0) {\n    say "ab" * 100000000\n}\nsay "ab" * 3\n')).parse()
+    optimizer = Optimizer()
+    optimized = optimizer.optimize(statements)
+    assert len(optimized) == 1
+    assert optimized[0].value_node.value == "ababab"
+    assert optimizer.stats["folded"] == 1
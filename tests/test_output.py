@@ -0,0 +1,116 @@
+import io
+
+import pytest
+
+import chiken
+from src import output as output_module
+from src.output import OutputSink
+
+
+class CountingStream(io.StringIO):
+    """A non-interactive stream that counts writes and flushes"""
+
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+    def flush(self):
+        self.flushes += 1
+
+    def isatty(self):
+        return False
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lines_are_written_in_one_batch():
+    stream = CountingStream()
+    sink = OutputSink(stream)
+    for i in range(100):
+        sink.say(i)
+    assert stream.writes == 0
+    sink.flush()
+    assert (stream.getvalue(), stream.writes, stream.flushes) == ("".join(f"{i}\n" for i in range(100)), 1, 1)
+
+
+def test_buffer_lines_bounds_the_buffer():
+    stream = CountingStream()
+    sink = OutputSink(stream, buffer_lines=10)
+    for i in range(25):
+        sink.say(i)
+    assert stream.writes == 2
+    assert stream.getvalue().count("\n") == 20
+
+
+def test_flush_lines():
+    stream = CountingStream()
+    sink = OutputSink(stream, flush_lines=3)
+    for i in range(7):
+        sink.say(i)
+    assert (stream.writes, stream.flushes) == (2, 2)
+    assert stream.getvalue() == "0\n1\n2\n3\n4\n5\n"
+    sink.flush()
+    assert stream.getvalue().endswith("5\n6\n")
+
+
+def test_flush_interval(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(output_module.time, "monotonic", clock)
+    stream = CountingStream()
+    sink = OutputSink(stream, flush_interval=0.5)
+    sink.say("a")
+    clock.now = 0.4
+    sink.say("b")
+    assert stream.flushes == 0
+    clock.now = 0.6
+    sink.say("c")
+    assert (stream.getvalue(), stream.flushes) == ("a\nb\nc\n", 1)
+    # The interval counts from the last flush
+    clock.now = 1.0
+    sink.say("d")
+    assert stream.flushes == 1
+
+
+@pytest.mark.parametrize("flush_on_input, seen", [(True, "before\n"), (False, "")])
+def test_flush_on_input(monkeypatch, flush_on_input, seen):
+    stream = CountingStream()
+    prompts = []
+
+    def fake_input(prompt):
+        prompts.append((prompt, stream.getvalue()))
+        return "7"
+
+    monkeypatch.setattr("builtins.input", fake_input)
+    sink = OutputSink(stream, flush_on_input=flush_on_input)
+    chiken.run('say "before"\nhave x = input("x? ")\nsay x * 2\n', output=sink)
+    assert prompts == [("x? ", seen)]
+    assert stream.getvalue() == "before\n14\n"
+
+
+def test_interactive_stdout_flushes_every_line(monkeypatch):
+    stdout = CountingStream()
+    stdout.isatty = lambda: True
+    monkeypatch.setattr("sys.stdout", stdout)
+    sink = OutputSink()
+    sink.say(1)
+    sink.say(2)
+    assert (stdout.getvalue(), stdout.flushes) == ("1\n2\n", 2)
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm", "python"])
+def test_capture_writes_nothing(monkeypatch, engine):
+    stdout = CountingStream()
+    monkeypatch.setattr("sys.stdout", stdout)
+    assert chiken.run('say "captured"\nsay 2\n', engine=engine, capture=True) == "captured\n2\n"
+    assert (stdout.getvalue(), stdout.writes) == ("", 0)
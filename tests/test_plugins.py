@@ -0,0 +1,62 @@
+import pytest
+
+import chiken
+from chiken import cli
+from chiken.builtins import register, unregister
+from src import builtins
+from src.engines import ENGINES
+from src.interpreter import Interpreter
+
+
+class CountingEngine(Interpreter):
+    """A trivial plugin engine: the tree-walker, announcing each run"""
+
+    def run(self, statements, flush=True):
+        self.output.say(f"running {len(statements)} statements")
+        return super().run(statements, flush)
+
+
+def add_plugin():
+    @register(arity=2, pure=True)
+    def clamp_to(value, limit):
+        return min(value, limit)
+
+    ENGINES["counting"] = CountingEngine
+
+
+class EntryPoint:
+    def load(self):
+        return add_plugin
+
+
+@pytest.fixture
+def plugin(monkeypatch):
+    monkeypatch.setattr(builtins, "_plugins_loaded", False)
+    monkeypatch.setattr("importlib.metadata.entry_points", lambda **kwargs: [EntryPoint()])
+    yield
+    ENGINES.pop("counting", None)
+    unregister("clamp_to")
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "vm", "python"])
+def test_registered_builtin_on_every_engine(engine):
+    @register(arity=1, pure=True)
+    def triple(x):
+        return x * 3
+
+    try:
+        assert chiken.run("say triple(14)\nsay triple(\"ab\")\n", engine=engine, capture=True) == "42\nababab\n"
+        with pytest.raises(Exception, match="expects 1 argument"):
+            chiken.run("say triple(1, 2)\n", engine=engine, capture=True)
+    finally:
+        unregister("triple")
+
+
+def test_plugin_engine_through_run(plugin):
+    output = chiken.run("say clamp_to(12, 5)\nsay 1\n", engine="counting", capture=True)
+    assert output == "running 2 statements\n5\n1\n"
+
+
+def test_plugin_engine_through_the_cli(plugin, capsys):
+    cli.main(["--engine", "counting", "-c", "say clamp_to(3, 5)"])
+    assert capsys.readouterr().out == "running 1 statements\n3\n"
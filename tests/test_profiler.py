@@ -0,0 +1,111 @@
+import io
+import itertools
+import json
+import pstats
+
+import pytest
+
+import chiken
+from chiken import cli
+from src.profiler import Profiler
+
+SOURCE = """func fact(n) {
+    if (n < 2) {
+        return 1
+    }
+    return n * fact(n - 1)
+}
+func twice(x) {
+    return x + x
+}
+say fact(3)
+say twice(2)
+say twice(fact(2))
+"""
+
+
+def profile(source=SOURCE):
+    # Every clock reading is one second later than the one before
+    ticks = itertools.count()
+    profiler = Profiler("fact.chk", source=source, clock=lambda: float(next(ticks)))
+    assert chiken.run(source, engine="closure", profiler=profiler, capture=True) == "6\n4\n4\n"
+    return profiler
+
+
+def by_name(profiler):
+    return {stats.name: stats for stats in profiler.functions.values()}
+
+
+def test_call_counts_per_function():
+    functions = by_name(profile())
+    assert (functions["fact"].calls, functions["fact"].primitive_calls) == (5, 2)
+    assert (functions["twice"].calls, functions["twice"].primitive_calls) == (2, 2)
+    assert functions["<program>"].calls == 1
+    assert functions["fact"].callers == {("<program>", 0): [2, 4.0, 8.0], ("fact", 1): [3, 4.0, 5.0]}
+
+
+def test_recursion_counted_once_in_cumulative_time():
+    fact = by_name(profile())["fact"]
+    # fact(3) takes 5 ticks and fact(2) 3; the nested calls are inside them
+    assert fact.cum_time == 8.0
+    assert fact.self_time == 8.0
+
+
+def test_line_hits():
+    profiler = profile()
+    assert profiler.hits[2] == 5
+    assert profiler.hits[5] == 3
+    assert profiler.hits[12] == 1
+
+
+def test_text_report():
+    report = profile().report()
+    assert "      5/2   8.000000   8.000000  fact (line 1)" in report
+    assert "        2   2.000000   2.000000  twice (line 7)" in report
+    assert "     2          5  if (n < 2) {" in report
+
+
+@pytest.mark.parametrize("sort, order", [("cumulative", ["<program>", "fact", "twice"]), ("calls", ["fact", "twice", "<program>"]), ("name", ["<program>", "fact", "twice"])])
+def test_report_sorting(sort, order):
+    rows = profile().report(sort=sort).split("\n\n")[0].splitlines()[1:]
+    assert [row.split()[3] for row in rows] == order
+
+
+def test_json_report():
+    data = json.loads(profile().to_json())
+    assert data["file"] == "fact.chk"
+    assert [entry["name"] for entry in data["functions"]] == ["<program>", "fact", "twice"]
+    fact = data["functions"][1]
+    assert (fact["calls"], fact["primitive_calls"], fact["cumulative_time"]) == (5, 2, 8.0)
+    assert {"line": 2, "hits": 5} in data["lines"]
+
+
+def test_pstats_dump_loads(tmp_path):
+    path = tmp_path / "fact.prof"
+    profile().dump_pstats(str(path))
+    stats = pstats.Stats(str(path))
+    assert stats.total_calls == 8
+    assert stats.prim_calls == 5
+    primitive, calls, own, cumulative, callers = stats.stats[("fact.chk", 1, "fact")]
+    assert (primitive, calls, own, cumulative) == (2, 5, 8.0, 8.0)
+    assert callers[("fact.chk", 0, "<program>")] == (2, 2, 4.0, 8.0)
+    report = io.StringIO()
+    stats.stream = report
+    stats.sort_stats("cumulative").print_stats()
+    assert "fact.chk:1(fact)" in report.getvalue()
+
+
+@pytest.mark.parametrize("profile_format", ["text", "json", "pstats"])
+def test_cli_profile_formats(tmp_path, capsys, profile_format):
+    path = tmp_path / "fact.chk"
+    path.write_text(SOURCE)
+    output = tmp_path / "profile.out"
+    cli.main(["--profile", "--profile-format", profile_format, "--profile-output", str(output), str(path)])
+    assert capsys.readouterr().out == "6\n4\n4\n"
+    if profile_format == "pstats":
+        assert pstats.Stats(str(output)).stats[(str(path), 7, "twice")][:2] == (2, 2)
+    elif profile_format == "json":
+        functions = {entry["name"]: entry for entry in json.loads(output.read_text())["functions"]}
+        assert (functions["fact"]["calls"], functions["fact"]["primitive_calls"]) == (5, 2)
+    else:
+        assert "fact (line 1)" in output.read_text()
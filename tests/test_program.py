@@ -0,0 +1,120 @@
+import io
+import pickle
+import threading
+
+import pytest
+
+import chiken
+from src.program import Engine, Program, shared_engine
+
+SOURCE = """
+func fib(n) {
+    if (n < 2) {
+        return n
+    }
+    return fib(n - 1) + fib(n - 2)
+}
+func twice(n) {
+    return n + n
+}
+have i = 0
+repeat (i < 12) {
+    say fib(twice(i) - i)
+    have i = i + 1
+}
+say len(range(start))
+"""
+
+
+def run_in_threads(program, count):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def work(index):
+        barrier.wait()
+        results[index] = program.run(globals={"start": index}).output
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.mark.parametrize("options", [dict(engine="tree"), dict(engine="tree", quicken=True), dict(engine="closure"), dict(engine="vm"), dict(engine="python")])
+def test_one_program_run_from_many_threads(options):
+    program = Program(SOURCE, **options)
+    statements = pickle.dumps(program.statements)
+    expected = [program.run(globals={"start": index}).output for index in range(8)]
+    assert run_in_threads(program, 8) == expected
+    # Runs share the AST and never write to it
+    assert pickle.dumps(program.statements) == statements
+    assert expected[5] == "0\n1\n1\n2\n3\n5\n8\n13\n21\n34\n55\n89\n5\n"
+
+
+def test_program_run_returns_output_and_variables():
+    program = Program("have y = x * 2\nsay y\n")
+    result = program.run(globals={"x": 21})
+    assert result.output == "42\n"
+    assert result.variables == {"x": 21, "y": 42}
+    # The caller's globals are never modified
+    seeds = {"x": 1}
+    assert program.run(globals=seeds).variables["y"] == 2
+    assert seeds == {"x": 1}
+
+
+def test_program_run_writes_to_a_given_stream():
+    stream = io.StringIO()
+    result = Program('say "out"\n', engine="vm").run(output=stream)
+    assert result.output is None
+    assert stream.getvalue() == "out\n"
+
+
+def test_engine_parses_each_source_once():
+    engine = Engine("closure")
+    first = engine.compile("say 1\n")
+    assert engine.compile("say 1\n") is first
+    assert engine.run("say 1\n").output == "1\n"
+    assert engine.stats() == (2, 1, 1)
+
+
+def test_engine_cache_evicts_least_recently_used():
+    engine = Engine("tree", cache_size=2)
+    a = engine.compile("say 1\n")
+    b = engine.compile("say 2\n")
+    assert engine.compile("say 1\n") is a
+    engine.compile("say 3\n")
+    # "say 2" was the least recently used and made room for "say 3"
+    assert engine.stats()[2] == 2
+    assert engine.compile("say 1\n") is a
+    assert engine.compile("say 2\n") is not b
+
+
+def test_engine_compiles_from_many_threads():
+    engine = Engine("vm", cache_size=4)
+    sources = [f"say {index} * 3\n" for index in range(8)]
+    errors = []
+
+    def work():
+        try:
+            for _ in range(20):
+                for index, source in enumerate(sources):
+                    assert engine.run(source).output == f"{index * 3}\n"
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert engine.stats()[2] == 4
+
+
+def test_shared_engine_per_configuration():
+    assert shared_engine("tree", memoize=8) is shared_engine("tree", memoize=8)
+    assert shared_engine("tree", memoize=8) is not shared_engine("tree", memoize=16)
+    assert shared_engine("vm") is not shared_engine("vm", optimize=True)
+    assert chiken.compile("say 5\n", engine="vm") is chiken.compile("say 5\n", engine="vm")
@@ -0,0 +1,18 @@
+from src.interpreter import Interpreter
+from src.repl import Repl
+
+
+def test_reload_shifts_lines_inside_functions(tmp_path):
+    path = tmp_path / "prelude.chiken"
+    path.write_text("func f(x) {\n    say x\n    return x\n}\n")
+    repl = Repl(Interpreter(), interactive=False)
+    statements, parsed = repl.load(path)
+    assert parsed == 1
+    assert [stmt.line for stmt in statements[0].body] == [2, 3]
+
+    path.write_text("have a = 1\n\nfunc f(x) {\n    say x\n    return x\n}\n")
+    statements, parsed = repl.load(path)
+    assert parsed == 1
+    func = statements[1]
+    assert func.line == 3
+    assert [stmt.line for stmt in func.body] == [4, 5]
@@ -0,0 +1,15 @@
+import asyncio
+
+import pytest
+
+from src.scheduler import Scheduler
+
+COUNT = "have i = 0\nrepeat (i < {n}) {{\n    have i = i + 1\n}}\nsay i\n"
+
+
+def test_max_steps_is_exact_across_slices():
+    scheduler = Scheduler(slice_steps=1000)
+    result = asyncio.run(scheduler.run(COUNT.format(n=1500), max_steps=1500))
+    assert result.output == "1500\n"
+    with pytest.raises(Exception, match="Step budget exceeded"):
+        asyncio.run(scheduler.run(COUNT.format(n=1501), max_steps=1500))